@@ -1,6 +1,24 @@
 # Description: This file contains the functions for angular motion calculations.
 # Original Author: Mark Ciubal
 # i@markciubal.com
+# The scalar helpers work on NumPy arrays too. The rotational motion functions below evaluate
+# theta(t), omega(t) and alpha(t) for whole time grids and many bodies at once, and export
+# the rotation of a point on a circle as animated KML tracks.
+
+from collections import namedtuple
+
+import numpy as np
+
+from geodesy import offset_to_geodetic
+from integrators import rk4_step
+from kmlOutput import open_kml_output
+from kmlWriter import BLUE, RED, RELATIVE_TO_GROUND, KmlStreamWriter
+
+# Rotational state over a time grid. Every field has the shape of the bodies followed by the time grid.
+# - theta: angular position in radians
+# - omega: angular velocity in rad/s
+# - alpha: angular acceleration in rad/s^2
+RotationalState = namedtuple("RotationalState", ["theta", "omega", "alpha"])
 
 # Theta: Angular Position
 def angularPosition(angularVelocity, time):
@@ -8,7 +26,7 @@ def angularPosition(angularVelocity, time):
 
 # Delta Theta: Angular Displacement
 def angularDisplacement(angularPositionInitial, angularPositionFinal):
-    return angularPositionInitial - angularPositionFinal
+    return angularPositionFinal - angularPositionInitial
 
 # Omega: Angular Velocity
 def angularVelocity(angularDisplacement, time):
@@ -35,16 +53,168 @@ def torque(I, alpha):
 def rotationalMass(m, r):
     return m * r**2
 
+def bodyTimeGrid(t, *bodyParameters):
+    """
+    Broadcasts per-body parameters against a time grid.
+
+    Returns:
+    - The parameters with trailing axes for the time grid, and the time grid with leading axes
+      for the bodies, so that combining them gives arrays of shape bodies + time grid.
+    """
+    t = np.asarray(t, dtype=float)
+    parameters = np.broadcast_arrays(*(np.asarray(p, dtype=float) for p in bodyParameters))
+    bodyShape = parameters[0].shape
+    expanded = [p.reshape(bodyShape + (1,) * t.ndim) for p in parameters]
+    return expanded, t.reshape((1,) * len(bodyShape) + t.shape)
+
+def constantTorqueMotion(theta0, omega0, torque, I, t):
+    """
+    Evaluates the rotation of bodies under constant torque.
+
+    Parameters:
+    - theta0: Initial angular positions in radians.
+    - omega0: Initial angular velocities in rad/s.
+    - torque: Torques in N m.
+    - I: Moments of inertia in kg m^2.
+    - t: Time grid in seconds, any shape.
+
+    theta0, omega0, torque and I may be scalars or arrays, broadcast together into the bodies.
+
+    Returns:
+    - RotationalState with arrays of shape bodies + t.shape.
+    """
+    (theta0, omega0, torque, I), t = bodyTimeGrid(t, theta0, omega0, torque, I)
+    alpha = torque / I
+    shape = np.broadcast_shapes(alpha.shape, t.shape)
+    return RotationalState(
+        theta=np.broadcast_to(theta0 + omega0 * t + 0.5 * alpha * t**2, shape),
+        omega=np.broadcast_to(omega0 + alpha * t, shape),
+        alpha=np.broadcast_to(alpha, shape),
+    )
+
+def torqueProfileMotion(theta0, omega0, torque, I, t):
+    """
+    Integrates the rotation of bodies under a torque that varies over time.
+
+    The torque is taken as piecewise linear between the samples of the time grid, and
+    integrated exactly, so constant and ramped torques give the closed-form result.
+
+    Parameters:
+    - theta0, omega0, I: Per-body initial angle (rad), angular velocity (rad/s) and moment of inertia (kg m^2).
+    - torque: Torque in N m at every time of t, of shape bodies + (len(t),) or broadcastable to it,
+      e.g. a single (len(t),) profile shared by all bodies.
+    - t: Increasing 1-D time grid in seconds.
+
+    Returns:
+    - RotationalState with arrays of shape bodies + (len(t),).
+    """
+    (theta0, omega0, I), t = bodyTimeGrid(t, theta0, omega0, I)
+    alpha = np.asarray(torque, dtype=float) / I
+    shape = np.broadcast_shapes(alpha.shape, t.shape, theta0.shape)
+    alpha = np.broadcast_to(alpha, shape)
+    dt = np.diff(t, axis=-1)
+    # Exact integrals of a linear alpha over every step
+    omega = np.concatenate([np.broadcast_to(omega0, shape[:-1] + (1,)),
+                            omega0 + np.cumsum(dt * (alpha[..., :-1] + alpha[..., 1:]) / 2, axis=-1)], axis=-1)
+    dtheta = omega[..., :-1] * dt + dt**2 * (2 * alpha[..., :-1] + alpha[..., 1:]) / 6
+    theta = np.concatenate([np.broadcast_to(theta0, shape[:-1] + (1,)),
+                            theta0 + np.cumsum(dtheta, axis=-1)], axis=-1)
+    return RotationalState(theta, omega, alpha)
+
+def integrateRotation(theta0, omega0, I, torqueFunction, t, substeps=1):
+    """
+    Integrates the rotation of bodies whose torque depends on their state, e.g. a motor whose
+    torque drops with speed (torqueFunction = lambda t, theta, omega: tau0 * (1 - omega / omegaMax))
+    or friction. All bodies advance together with fixed RK4 steps.
+
+    Parameters:
+    - theta0, omega0, I: Per-body initial angle (rad), angular velocity (rad/s) and moment of inertia (kg m^2).
+    - torqueFunction: Function (t, theta, omega) returning the torques in N m, called with
+      arrays of the body shape.
+    - t: Increasing 1-D time grid in seconds.
+    - substeps: RK4 steps per interval of the time grid.
+
+    Returns:
+    - RotationalState with arrays of shape bodies + (len(t),).
+    """
+    theta0, omega0, I = np.broadcast_arrays(*(np.asarray(p, dtype=float) for p in (theta0, omega0, I)))
+    t = np.asarray(t, dtype=float)
+
+    def derivative(time, state):
+        return np.stack([state[1], torqueFunction(time, state[0], state[1]) / I])
+
+    states = np.empty((2,) + theta0.shape + t.shape)
+    state = np.stack([theta0, omega0])
+    states[..., 0] = state
+    for index in range(1, t.size):
+        step = (t[index] - t[index - 1]) / substeps
+        for substep in range(substeps):
+            state = rk4_step(derivative, t[index - 1] + substep * step, state, step)
+        states[..., index] = state
+    alpha = np.moveaxis(np.stack([np.asarray(torqueFunction(t[i], states[0, ..., i], states[1, ..., i]), dtype=float) / I
+                                  for i in range(t.size)]), 0, -1)
+    return RotationalState(states[0], states[1], np.broadcast_to(alpha, states[0].shape))
+
+def rotatingPointCoords(latitude, longitude, altitude, radius, theta):
+    """
+    Returns the (lon, lat, h) tuples of a point on a horizontal circle at the angles theta,
+    measured counterclockwise from east like create_timed_segments_circle in googleEarth.py.
+    """
+    theta = np.asarray(theta, dtype=float)
+    lat, lon = offset_to_geodetic(latitude, longitude, radius * np.cos(theta), radius * np.sin(theta))
+    h = np.broadcast_to(np.asarray(altitude, dtype=float), theta.shape)
+    return zip(np.ravel(lon).tolist(), np.ravel(lat).tolist(), np.ravel(h).tolist())
+
+def writeRotatingTracks(writer, latitude, longitude, altitude, radius, theta, startTime, t, names=None, circlePoints=72):
+    """
+    Writes the rotation of bodies as animated gx:Tracks of a point on their rim, with the rim circle.
+
+    Parameters:
+    - writer: Open kmlWriter.KmlStreamWriter.
+    - latitude, longitude, altitude, radius: Center of the circle in degrees and meters, and its
+      radius in meters, shared by all bodies or one per body.
+    - theta: Angular positions in radians of shape (bodies, len(t)), e.g. RotationalState.theta.
+    - startTime: datetime of t = 0.
+    - t: 1-D time grid in seconds.
+    - names: Optional track names, "Body 1", "Body 2", ... by default.
+    - circlePoints: Number of points of the rim circle.
+    """
+    theta = np.atleast_2d(theta)
+    count = theta.shape[0]
+    latitude, longitude, altitude, radius = (np.broadcast_to(np.asarray(p, dtype=float), (count,))
+                                             for p in (latitude, longitude, altitude, radius))
+    offsets = np.round(np.asarray(t, dtype=float) * 1e6).astype("timedelta64[us]")
+    whens = [s + "Z" for s in np.datetime_as_string(np.datetime64(startTime, "us") + offsets, unit="us").tolist()]
+    rimStyle = writer.style(line_color=BLUE, line_width=2)
+    trackStyle = writer.style(line_color=RED, line_width=3)
+    rim = np.linspace(0, 2 * np.pi, circlePoints + 1)
+    for body in range(count):
+        name = names[body] if names else f"Body {body + 1}"
+        writer.linestring(rotatingPointCoords(latitude[body], longitude[body], altitude[body], radius[body], rim),
+                          name=f"{name} rim", style_id=rimStyle, altitudemode=RELATIVE_TO_GROUND)
+        writer.track(whens, rotatingPointCoords(latitude[body], longitude[body], altitude[body], radius[body], theta[body]),
+                     name=name, style_id=trackStyle, altitudemode=RELATIVE_TO_GROUND)
+    return writer
+
+def saveRotatingTracks(path, latitude, longitude, altitude, radius, theta, startTime, t, names=None, circlePoints=72):
+    """Saves writeRotatingTracks as a .kml, .kmz or .kml.gz file, by the extension of path."""
+    with open_kml_output(path) as output, KmlStreamWriter(output) as writer:
+        writeRotatingTracks(writer, latitude, longitude, altitude, radius, theta, startTime, t, names, circlePoints)
+
 # Angular Motion
-# Time in Seconds
-time = .5
-angularPositionInitial = 0
-angularPositionFinal = 4*3.14159
-angularDisplacementValue = angularDisplacement(angularPositionInitial, angularPositionFinal)
-angular_velocity = angularVelocity(angularDisplacementValue, time)
-angular_position = angularPosition(angular_velocity, time)
-angular_jerk = angularJerk(angular_velocity, time)
-print("Angular Motion")
-print("Angular Position: ", angular_position)
-print("Angular Displacement: ", angular_displacement)
-print("Angular Velocity: ", angular_velocity)
\ No newline at end of file
+def main():
+    # Time in Seconds
+    time = .5
+    angularPositionInitial = 0
+    angularPositionFinal = 4*3.14159
+    angularDisplacementValue = angularDisplacement(angularPositionInitial, angularPositionFinal)
+    angular_velocity = angularVelocity(angularDisplacementValue, time)
+    angular_position = angularPosition(angular_velocity, time)
+    angular_jerk = angularJerk(angular_velocity, time)
+    print("Angular Motion")
+    print("Angular Position: ", angular_position)
+    print("Angular Displacement: ", angularDisplacementValue)
+    print("Angular Velocity: ", angular_velocity)
+
+if __name__ == "__main__":
+    main()
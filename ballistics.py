@@ -0,0 +1,206 @@
+# Description: Projectile motion with air drag and wind.
+# Integrates many projectiles at once with the integrators in integrators.py, using quadratic
+# drag and the altitude-dependent air density from fluids.py.
+
+from collections import namedtuple
+
+import numpy as np
+
+from fluids import airDensity
+from geodesy import offset_to_geodetic
+from integrators import integrate_rk4, integrate_rk45
+from trajectoryEngine import GRAVITY_CONSTANT
+
+# Results of simulate_ballistic_batch.
+# - elapsed: (T,) integrator times in seconds, shared by all launches
+# - lon, lat, h: (N, T) tracks, NaN from the first sample below ground on
+# - time_of_flight, apex, range, impact_lat, impact_lon: (N,) summaries, with the impact found on the
+#   cubic Hermite interpolant between the last sample above and the first sample below ground, and
+#   the apex on the interpolant of the step where the vertical velocity turns negative.
+#   NaN for launches that start below ground or are still in the air at the end of duration.
+BallisticResult = namedtuple(
+    "BallisticResult",
+    ["elapsed", "lon", "lat", "h", "time_of_flight", "apex", "range", "impact_lat", "impact_lon"],
+)
+
+
+def hermite(p0, v0, p1, v1, dt, s):
+    """Cubic Hermite interpolation at fractions s of a step of length dt from (p0, v0) to (p1, v1)."""
+    s2 = s * s
+    s3 = s2 * s
+    return ((2 * s3 - 3 * s2 + 1) * p0 + (s3 - 2 * s2 + s) * dt * v0
+            + (-2 * s3 + 3 * s2) * p1 + (s3 - s2) * dt * v1)
+
+
+def hermite_slope(p0, v0, p1, v1, dt, s):
+    """Derivative with respect to s of the cubic Hermite interpolant at fractions s of a step."""
+    s2 = s * s
+    return ((6 * s2 - 6 * s) * p0 + (3 * s2 - 4 * s + 1) * dt * v0
+            + (-6 * s2 + 6 * s) * p1 + (3 * s2 - 2 * s) * dt * v1)
+
+
+def apex_crossing(z0, vz0, z1, vz1, dt, iterations=50):
+    """
+    Fractions of the steps at which the vertical velocity crosses zero, by bisection on the slope
+    of the cubic Hermite interpolant. vz0 >= 0 > vz1 for every step.
+    """
+    low = np.zeros_like(z0)
+    high = np.ones_like(z0)
+    for _ in range(iterations):
+        middle = (low + high) / 2
+        rising = hermite_slope(z0, vz0, z1, vz1, dt, middle) >= 0
+        low = np.where(rising, middle, low)
+        high = np.where(rising, high, middle)
+    return (low + high) / 2
+
+
+def ground_crossing(z0, vz0, z1, vz1, dt, iterations=50):
+    """
+    Fractions of the steps at which the height crosses zero, by bisection on the cubic Hermite
+    interpolant. z0 >= 0 > z1 for every step, the interpolant is exact for constant acceleration.
+    """
+    low = np.zeros_like(z0)
+    high = np.ones_like(z0)
+    for _ in range(iterations):
+        middle = (low + high) / 2
+        above = hermite(z0, vz0, z1, vz1, dt, middle) >= 0
+        low = np.where(above, middle, low)
+        high = np.where(above, high, middle)
+    return (low + high) / 2
+
+
+def ballistic_derivative(drag_factor, wind, ground_altitude=0.0, g=GRAVITY_CONSTANT):
+    """
+    Returns f(t, y) for an (N, 6) state of east/north/up positions and velocities.
+
+    Parameters:
+    - drag_factor: (N,) array of Cd * A / (2 m) in m^2/kg, 0 for a vacuum trajectory.
+    - wind: (3,) or (N, 3) east/north/up wind velocity in m/s.
+    - ground_altitude: Altitude of the ground above sea level in meters, for the air density.
+    - g: Gravitational acceleration in m/s^2.
+    """
+    drag_factor = np.asarray(drag_factor, dtype=float)
+    wind = np.asarray(wind, dtype=float)
+
+    def derivative(t, y):
+        velocity = y[:, 3:]
+        relative = velocity - wind
+        speed = np.linalg.norm(relative, axis=1)
+        density = airDensity(ground_altitude + y[:, 2])
+        acceleration = -(drag_factor * density * speed)[:, None] * relative
+        acceleration[:, 2] -= g
+        return np.concatenate((velocity, acceleration), axis=1)
+
+    return derivative
+
+
+def simulate_ballistic_batch(lat, lon, h0, v0, elevation_angle_deg, azimuth_angle_deg, mass, drag_coefficient, area,
+                             duration, wind=(0.0, 0.0, 0.0), ground_altitude=0.0, g=GRAVITY_CONSTANT,
+                             method="rk45", dt=0.01, rtol=1e-6, atol=1e-6, max_step=None):
+    """
+    Simulates many projectiles with quadratic air drag and wind.
+
+    Every launch parameter may be a scalar or an array, they are broadcast together into one
+    flat list of launches that is integrated as a single (N, 6) state.
+
+    Parameters:
+    - lat, lon: Launch latitudes and longitudes.
+    - h0: Initial heights above ground in meters.
+    - v0: Initial velocities in meters per second.
+    - elevation_angle_deg: Launch elevation angles in degrees.
+    - azimuth_angle_deg: Launch azimuth angles in degrees from north.
+    - mass: Projectile masses in kg.
+    - drag_coefficient: Drag coefficients (about 0.47 for a sphere).
+    - area: Cross-section areas in m^2.
+    - duration: Maximum simulated time in seconds, integration stops earlier once every projectile has landed.
+    - wind: East/north/up wind velocity in m/s, (3,) or (N, 3).
+    - ground_altitude: Altitude of the ground above sea level in meters, for the air density.
+    - g: Gravitational acceleration in m/s^2.
+    - method: "rk45" for adaptive Dormand-Prince steps or "rk4" for fixed steps of dt.
+    - dt: Step size in seconds for "rk4", first step size for "rk45".
+    - rtol, atol: Error tolerances for "rk45".
+    - max_step: Largest "rk45" step in seconds, duration / 100 by default so the tracks stay smooth.
+
+    Returns:
+    - BallisticResult.
+    """
+    lat, lon, h0, v0, elevation, azimuth, mass, drag_coefficient, area = (
+        np.ravel(a).astype(float) for a in np.broadcast_arrays(
+            lat, lon, h0, v0, elevation_angle_deg, azimuth_angle_deg, mass, drag_coefficient, area
+        )
+    )
+    count = lat.size
+    elevation_rad = np.radians(elevation)
+    azimuth_rad = np.radians(azimuth)
+    v0h = v0 * np.cos(elevation_rad)  # Horizontal component
+
+    y0 = np.zeros((count, 6))
+    y0[:, 2] = h0
+    y0[:, 3] = v0h * np.sin(azimuth_rad)  # East-West component (x)
+    y0[:, 4] = v0h * np.cos(azimuth_rad)  # North-South component (y)
+    y0[:, 5] = v0 * np.sin(elevation_rad)  # Vertical component
+
+    derivative = ballistic_derivative(0.5 * drag_coefficient * area / mass, wind, ground_altitude, g)
+
+    def all_landed(t, y):
+        return bool(np.all(y[:, 2] < 0))
+
+    if method == "rk45":
+        elapsed, states = integrate_rk45(
+            derivative, y0, 0.0, duration, rtol=rtol, atol=atol, dt=dt,
+            max_step=max_step or duration / 100, stop=all_landed
+        )
+    elif method == "rk4":
+        elapsed, states = integrate_rk4(derivative, y0, 0.0, duration, dt, stop=all_landed)
+    else:
+        raise ValueError(f"Unknown integration method {method!r}, expected 'rk45' or 'rk4'")
+
+    # (N, T) tracks
+    east = states[:, :, 0].T
+    north = states[:, :, 1].T
+    h = states[:, :, 2].T
+
+    below = h < 0
+    landed = below.any(axis=1)
+    first_below = np.where(landed, below.argmax(axis=1), elapsed.size)
+    valid = np.arange(elapsed.size) < first_below[:, None]
+
+    # Ground crossing between the last sample above and the first sample below ground
+    rows = np.arange(count)
+    after = np.minimum(first_below, elapsed.size - 1)
+    before = np.maximum(after - 1, 0)
+    in_flight = landed & (first_below > 0)
+    step = elapsed[after] - elapsed[before]
+    start, end = states[before, rows], states[after, rows]
+    fraction = ground_crossing(start[:, 2], start[:, 5], end[:, 2], end[:, 5], step)
+    time_of_flight = np.where(in_flight, elapsed[before] + fraction * step, np.nan)
+    impact_east = hermite(start[:, 0], start[:, 3], end[:, 0], end[:, 3], step, fraction)
+    impact_north = hermite(start[:, 1], start[:, 4], end[:, 1], end[:, 4], step, fraction)
+
+    # Apex on the interpolant of the first step where the vertical velocity turns negative before
+    # landing. Launches that never climb peak at their first sample.
+    falling = states[:, :, 5].T < 0
+    first_falling = falling.argmax(axis=1)
+    peaked = falling.any(axis=1) & (first_falling > 0) & (first_falling <= first_below)
+    after = np.maximum(first_falling, 1)
+    step = elapsed[after] - elapsed[after - 1]
+    start, end = states[after - 1, rows], states[after, rows]
+    fraction = apex_crossing(start[:, 2], start[:, 5], end[:, 2], end[:, 5], step)
+    peak = hermite(start[:, 2], start[:, 5], end[:, 2], end[:, 5], step, fraction)
+    with np.errstate(invalid="ignore"):
+        sampled = np.max(np.where(valid, h, -np.inf), axis=1)
+    apex = np.where(in_flight, np.where(peaked, np.fmax(sampled, peak), sampled), np.nan)
+
+    track_lat, track_lon = offset_to_geodetic(lat[:, None], lon[:, None], east, north)
+    impact_lat, impact_lon = offset_to_geodetic(lat, lon, impact_east, impact_north)
+    return BallisticResult(
+        elapsed=elapsed,
+        lon=np.where(valid, track_lon, np.nan),
+        lat=np.where(valid, track_lat, np.nan),
+        h=np.where(valid, h, np.nan),
+        time_of_flight=time_of_flight,
+        apex=apex,
+        range=np.where(in_flight, np.hypot(impact_east, impact_north), np.nan),
+        impact_lat=np.where(in_flight, impact_lat, np.nan),
+        impact_lon=np.where(in_flight, impact_lon, np.nan),
+    )
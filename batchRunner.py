@@ -0,0 +1,250 @@
+# Description: Command-line batch runner for simulation jobs.
+# Reads freefall, projectile, circle and vector jobs from a CSV or JSON lines file and runs them
+# across a process pool, writing every output file into one directory and reporting per-job timings.
+#
+# Usage:
+#     python batchRunner.py jobs.csv --output-dir out --workers 8 --chunksize 4 --report timings.json
+#
+# Every job has a "type" and a "name", the other fields are the parameters of the job type
+# (see JOB_TYPES). In CSV files empty cells are left at their defaults.
+# With --cache-dir, jobs with an explicit start_time are served from a resultCache.ResultCache
+# when the same job ran before.
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+import traceback
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from kmlOutput import EXTENSIONS, open_kml_output, output_path
+from kmlWriter import KmlStreamWriter
+from projectileMotion import GRAVITY_CONSTANT, create_circle, create_vector, simulate_freefall, simulate_projectile_motion
+from resultCache import ResultCache, cache_key
+
+# Outcome of one job.
+# - index: position of the job in the job file
+# - name, type: from the job
+# - seconds: wall time of the job
+# - output: path of the written file relative to the output directory, None on failure
+# - error: error message, None on success
+# - cached: True if the output was copied from the result cache
+JobResult = namedtuple("JobResult", ["index", "name", "type", "seconds", "output", "error", "cached"], defaults=[False])
+
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ("1", "true", "yes", "y")
+
+
+def parse_time(value):
+    return value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
+
+
+def run_freefall(job, output_format):
+    simulate_freefall(job["lat"], job["lon"], job["height"], job["duration"], job["intervals"], job["name"],
+                      job.get("start_time"), job.get("end_time"), stream=True, track=job.get("track", False),
+                      output_format=output_format, g=job.get("g", GRAVITY_CONSTANT))
+
+
+def run_projectile(job, output_format):
+    simulate_projectile_motion(job["lat"], job["lon"], job["h0"], job["v0"], job["elevation_angle_deg"],
+                               job["azimuth_angle_deg"], job["duration"], job["intervals"], job["name"],
+                               job.get("start_time"), job.get("end_time"), stream=True, track=job.get("track", False),
+                               output_format=output_format, tolerance=job.get("tolerance"),
+                               simplify_tolerance=job.get("simplify_tolerance"), g=job.get("g", GRAVITY_CONSTANT))
+
+
+def time_span(job):
+    """Returns the (start_time, end_time) of a job, end_time defaulting to start_time + duration."""
+    start_time = job.get("start_time")
+    end_time = job.get("end_time")
+    if start_time and not end_time and "duration" in job:
+        end_time = start_time + timedelta(seconds=job["duration"])
+    return start_time, end_time
+
+
+def run_circle(job, output_format):
+    start_time, end_time = time_span(job)
+    with open_kml_output(output_path(job["name"], output_format)) as output, KmlStreamWriter(output) as writer:
+        create_circle(writer, job["lat"], job["lon"], job.get("altitude", 0.0), job["radius"], job.get("num_points", 36),
+                      start_time, end_time)
+
+
+def run_vector(job, output_format):
+    start_time, end_time = time_span(job)
+    with open_kml_output(output_path(job["name"], output_format)) as output, KmlStreamWriter(output) as writer:
+        create_vector(writer, job["name"], job["lat"], job["lon"], job["i"], job["j"], job.get("h1", 0.0),
+                      job.get("h2", 0.0), start_time, end_time)
+
+
+# Job type -> (runner, {parameter: parser}, required parameters)
+JOB_TYPES = {
+    "freefall": (run_freefall, {
+        "lat": float, "lon": float, "height": float, "duration": float, "intervals": int,
+        "start_time": parse_time, "end_time": parse_time, "track": parse_bool, "g": float,
+    }, ("lat", "lon", "height", "duration", "intervals")),
+    "projectile": (run_projectile, {
+        "lat": float, "lon": float, "h0": float, "v0": float, "elevation_angle_deg": float,
+        "azimuth_angle_deg": float, "duration": float, "intervals": int, "start_time": parse_time,
+        "end_time": parse_time, "track": parse_bool, "tolerance": float, "simplify_tolerance": float, "g": float,
+    }, ("lat", "lon", "h0", "v0", "elevation_angle_deg", "azimuth_angle_deg", "duration", "intervals")),
+    "circle": (run_circle, {
+        "lat": float, "lon": float, "altitude": float, "radius": float, "num_points": int,
+        "start_time": parse_time, "end_time": parse_time, "duration": float,
+    }, ("lat", "lon", "radius")),
+    "vector": (run_vector, {
+        "lat": float, "lon": float, "i": float, "j": float, "h1": float, "h2": float,
+        "start_time": parse_time, "end_time": parse_time, "duration": float,
+    }, ("lat", "lon", "i", "j")),
+}
+
+
+def parse_job(record, index):
+    """
+    Validates a raw job record and converts its parameters to their types.
+
+    Raises ValueError for unknown job types, unknown or missing parameters and values that do not parse.
+    """
+    record = {key.strip(): value for key, value in record.items() if key and value is not None and value != ""}
+    job_type = str(record.pop("type", "")).strip().lower()
+    if job_type not in JOB_TYPES:
+        raise ValueError(f"Job {index}: unknown type {job_type!r}, expected one of {sorted(JOB_TYPES)}")
+    _, parsers, required = JOB_TYPES[job_type]
+    job = {"type": job_type, "name": str(record.pop("name", f"{job_type}_{index}"))}
+    if os.path.basename(job["name"]) != job["name"]:
+        raise ValueError(f"Job {index}: name {job['name']!r} must be a plain file name")
+    for key, value in record.items():
+        if key not in parsers:
+            raise ValueError(f"Job {index}: unknown parameter {key!r} for a {job_type} job")
+        try:
+            job[key] = parsers[key](value)
+        except (TypeError, ValueError) as error:
+            raise ValueError(f"Job {index}: invalid {key} {value!r}: {error}") from None
+    missing = [key for key in required if key not in job]
+    if missing:
+        raise ValueError(f"Job {index}: missing {', '.join(missing)} for a {job_type} job")
+    return job
+
+
+def read_jobs(path):
+    """Reads and validates the jobs of a .csv file or a JSON lines file (one object per line)."""
+    with open(path, newline="", encoding="utf-8") as file:
+        if path.lower().endswith(".csv"):
+            records = list(csv.DictReader(file))
+        else:
+            records = [json.loads(line) for line in file if line.strip()]
+    return [parse_job(record, index) for index, record in enumerate(records)]
+
+
+@contextmanager
+def working_directory(path):
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def run_job(indexed_job, output_format, cache=None):
+    """
+    Runs one job in the current directory and returns its JobResult, errors included.
+
+    With a ResultCache, jobs with a start_time are keyed by their parameters and output format,
+    and a job that ran before gets its output copied from the cache.
+    """
+    index, job = indexed_job
+    runner = JOB_TYPES[job["type"]][0]
+    path = output_path(job["name"], output_format)
+    cached = False
+    start = time.perf_counter()
+    try:
+        if cache is not None and job.get("start_time"):
+            params = {key: value for key, value in job.items() if key not in ("start_time", "end_time")}
+            key = cache_key(f"batch_{job['type']}", dict(params, output_format=output_format), time_span(job))
+            cached = cache.run(key, path, lambda: runner(job, output_format))
+        else:
+            runner(job, output_format)
+    except Exception as error:
+        message = f"{type(error).__name__}: {error}\n{traceback.format_exc(limit=3)}"
+        return JobResult(index, job["name"], job["type"], time.perf_counter() - start, None, message)
+    return JobResult(index, job["name"], job["type"], time.perf_counter() - start, path, None, cached)
+
+
+def run_jobs(jobs, output_dir, output_format="kml", workers=None, chunksize=1, cache=None):
+    """
+    Runs jobs across a process pool and returns their JobResults in job order.
+
+    Parameters:
+    - jobs: Parsed jobs, see read_jobs.
+    - output_dir: Directory the output files are written to, created if needed.
+    - output_format: "kml", "kmz" or "gzip".
+    - workers: Number of worker processes, os.cpu_count() by default. 1 runs the jobs in this process.
+    - chunksize: Number of jobs sent to a worker at a time. Larger chunks cut the inter-process
+      overhead for many small jobs, smaller chunks balance uneven jobs better.
+    - cache: Optional ResultCache shared by the workers. Its directory should be an absolute path,
+      the jobs run inside output_dir.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    indexed = list(enumerate(jobs))
+    output_formats = [output_format] * len(indexed)
+    caches = [cache] * len(indexed)
+    if workers == 1 or len(indexed) < 2:
+        with working_directory(output_dir):
+            return [run_job(job, output_format, cache) for job in indexed]
+    # Every worker writes into the output directory, so job names stay plain file names
+    with ProcessPoolExecutor(max_workers=workers, initializer=os.chdir, initargs=(os.path.abspath(output_dir),)) as executor:
+        return list(executor.map(run_job, indexed, output_formats, caches, chunksize=chunksize))
+
+
+def format_report(results, total_seconds):
+    lines = [f"{'#':>4}  {'type':<10}  {'name':<24}  {'seconds':>9}  result"]
+    for result in results:
+        if result.error is not None:
+            outcome = "FAILED: " + result.error.splitlines()[0]
+        else:
+            outcome = result.output + (" (cached)" if result.cached else "")
+        lines.append(f"{result.index:>4}  {result.type:<10}  {result.name[:24]:<24}  {result.seconds:>9.3f}  {outcome}")
+    failed = sum(result.error is not None for result in results)
+    cached = sum(result.cached for result in results)
+    job_seconds = sum(result.seconds for result in results)
+    lines.append(f"{len(results)} jobs, {failed} failed, {cached} cached, {job_seconds:.3f} s of job time in {total_seconds:.3f} s wall time")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run simulation jobs from a CSV or JSON lines file across a process pool.")
+    parser.add_argument("jobs", help="Job file, .csv or JSON lines")
+    parser.add_argument("--output-dir", default="output", help="Directory for the output files")
+    parser.add_argument("--format", default="kml", choices=sorted(EXTENSIONS), help="Output file format")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (CPU count by default, 1 for none)")
+    parser.add_argument("--chunksize", type=int, default=1, help="Jobs sent to a worker at a time")
+    parser.add_argument("--report", help="Also write the per-job timings to this JSON file")
+    parser.add_argument("--cache-dir", help="Result cache directory, reused across runs for jobs with a start_time")
+    parser.add_argument("--cache-max-mb", type=float, default=1024, help="Size bound of the result cache in megabytes")
+    args = parser.parse_args(argv)
+
+    try:
+        jobs = read_jobs(args.jobs)
+    except (OSError, ValueError) as error:
+        parser.error(str(error))
+    cache = ResultCache(os.path.abspath(args.cache_dir), int(args.cache_max_mb * 1024 ** 2)) if args.cache_dir else None
+    start = time.perf_counter()
+    results = run_jobs(jobs, args.output_dir, args.format, args.workers, args.chunksize, cache)
+    total_seconds = time.perf_counter() - start
+    print(format_report(results, total_seconds))
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as file:
+            json.dump({"total_seconds": total_seconds, "jobs": [result._asdict() for result in results]}, file, indent=2)
+    return 1 if any(result.error is not None for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
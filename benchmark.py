@@ -0,0 +1,291 @@
+# Description: Reproducible benchmarks of the KML generators and conversion helpers.
+# Every benchmark runs with a fixed random seed and a fixed time base over a sweep of sizes
+# (samples, points, segments or vectors), and records the wall time, the peak traced memory and
+# the bytes of output written. Results are stored as JSON so runs can be compared to a baseline.
+#
+# Usage:
+#     python benchmark.py --output baseline.json
+#     python benchmark.py --baseline baseline.json --output current.json --threshold 0.2
+#     python benchmark.py --only projectile_stream,offset_to_geodetic --sizes 100,10000
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import namedtuple
+from contextlib import chdir
+from datetime import datetime, timedelta
+
+import numpy as np
+
+SEED = 20240101
+START_TIME = datetime(2024, 1, 1)
+END_TIME = datetime(2025, 1, 1)
+LAT, LON = 38.662463, -121.125643
+SIZES = (10**2, 10**3, 10**4, 10**5, 10**6)
+
+# Measurements of one benchmark at one size.
+# - seconds: best wall time of the repeats
+# - peak_bytes: peak memory traced by tracemalloc during one extra run
+# - output_bytes: total size of the files the benchmark wrote
+Measurement = namedtuple("Measurement", ["seconds", "peak_bytes", "output_bytes"])
+
+
+def projectile(size, **options):
+    from projectileMotion import simulate_projectile_motion
+    simulate_projectile_motion(LAT, LON, 0, 200, 45, 90, 40, size, "projectile", START_TIME, **options)
+
+
+def freefall(size, **options):
+    from projectileMotion import simulate_freefall
+    # Long enough that no sample reaches the ground before the last one
+    simulate_freefall(LAT, LON, 10000, 40, size, "freefall", START_TIME, **options)
+
+
+def circle(size):
+    from kmlWriter import KmlStreamWriter
+    from projectileMotion import create_circle
+    with KmlStreamWriter("circle.kml") as writer:
+        create_circle(writer, LAT, LON, 100, 100, size, START_TIME, END_TIME)
+
+
+def circle_simplekml(size):
+    from googleEarth import create_circle
+    create_circle(LAT, LON, 100, 100, size, START_TIME, END_TIME).save("circle.kml")
+
+
+def timed_segments_circle(size):
+    from googleEarth import save_timed_segments_circle
+    # One day per segment, so every segment has a distinct time span
+    save_timed_segments_circle("timed_circle_with_vectors.kml", LAT, LON, 100, 100, size, START_TIME, START_TIME + timedelta(days=size))
+
+
+def random_vectors(size):
+    rng = np.random.default_rng(SEED)
+    i, j = rng.uniform(-100, 100, (2, size))
+    h2 = rng.uniform(0, 100, size)
+    return [{"name": f"Vector {index + 1}", "lat": LAT, "lon": LON, "long": LON, "i": float(i[index]), "j": float(j[index]),
+             "h1": 0, "h2": float(h2[index])} for index in range(size)]
+
+
+def vector_operations(size, stream=True, multigeometry=False):
+    from googleEarth import Particle
+    Particle.vector_operations(random_vectors(size), stream=stream, multigeometry=multigeometry)
+
+
+def create_vectors(size):
+    from kmlWriter import KmlStreamWriter
+    from projectileMotion import create_vectors
+    vectors = random_vectors(size)
+    with KmlStreamWriter("vectors.kml") as writer:
+        create_vectors(writer, vectors, START_TIME, END_TIME)
+
+
+def vector_chain(size):
+    from kmlWriter import KmlStreamWriter
+    from vectorChain import random_walk, write_chains
+    with KmlStreamWriter("vector_chain.kml") as writer:
+        write_chains(writer, random_walk(LAT, LON, size, seed=SEED))
+
+
+def particle_system(size):
+    from geodesy import offset_to_geodetic
+    from particleSystem import ParticleSystem, save_particle_tracks
+    rng = np.random.default_rng(SEED)
+    bearing = rng.uniform(0, 360, size)
+    lat, lon = offset_to_geodetic(LAT, LON, 500 * np.sin(np.radians(bearing)), 500 * np.cos(np.radians(bearing)))
+    system = ParticleSystem(LAT, LON, restitution=0.8)
+    system.launch(lat, lon, 0, rng.uniform(95, 105, size), 45, (bearing + 180) % 360, radius=1.0)
+    save_particle_tracks("particles.kml", system.run(10, 0.01, record_every=50), START_TIME)
+
+
+def random_offsets(size):
+    rng = np.random.default_rng(SEED)
+    return rng.uniform(-50000, 50000, (2, size))
+
+
+def offset_to_geodetic(size):
+    from geodesy import offset_to_geodetic
+    east, north = random_offsets(size)
+    offset_to_geodetic(LAT, LON, east, north)
+
+
+def geodetic_to_offset(size):
+    from geodesy import geodetic_to_offset, offset_to_geodetic
+    east, north = random_offsets(size)
+    lat, lon = offset_to_geodetic(LAT, LON, east, north)
+    geodetic_to_offset(LAT, LON, lat, lon)
+
+
+def format_kml_times(size):
+    from trajectoryEngine import elapsed_to_datetime64, format_kml_times
+    format_kml_times(elapsed_to_datetime64(START_TIME, np.arange(size) * 0.01))
+
+
+def simplify_trajectory(size):
+    from simplify import simplify_trajectory
+    from trajectoryEngine import projectile_trajectory
+    trajectory = projectile_trajectory(LAT, LON, 0, 200, 45, 90, 40, size, START_TIME, END_TIME)
+    simplify_trajectory(trajectory, 0.5)
+
+
+# Benchmark name -> (function of the size, largest size it runs at by default).
+# Generators that build a simplekml document in memory stop at 10^4, their memory grows too fast for more.
+BENCHMARKS = {
+    "projectile_stream": (lambda size: projectile(size, stream=True), 10**6),
+    "projectile_track": (lambda size: projectile(size, stream=True, track=True), 10**6),
+    "projectile_simplekml": (lambda size: projectile(size), 10**4),
+    "freefall_stream": (lambda size: freefall(size, stream=True), 10**6),
+    "freefall_simplekml": (lambda size: freefall(size), 10**4),
+    "circle": (circle, 10**6),
+    "circle_simplekml": (circle_simplekml, 10**5),
+    "timed_segments_circle": (timed_segments_circle, 10**5),
+    "vector_operations_stream": (vector_operations, 10**5),
+    "vector_operations_simplekml": (lambda size: vector_operations(size, stream=False), 10**4),
+    "vector_operations_multigeometry": (lambda size: vector_operations(size, multigeometry=True), 10**5),
+    "vector_chain": (vector_chain, 10**6),
+    "particle_system": (particle_system, 10**4),
+    "create_vectors": (create_vectors, 10**5),
+    "offset_to_geodetic": (offset_to_geodetic, 10**6),
+    "geodetic_to_offset": (geodetic_to_offset, 10**6),
+    "format_kml_times": (format_kml_times, 10**6),
+    "simplify_trajectory": (simplify_trajectory, 10**6),
+}
+
+
+def directory_bytes(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+def measure(function, size, repeat=3):
+    """Runs function(size) in fresh temporary directories and returns its Measurement."""
+    best = float("inf")
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as directory, chdir(directory):
+            start = time.perf_counter()
+            function(size)
+            best = min(best, time.perf_counter() - start)
+            output_bytes = directory_bytes(directory)
+    # tracemalloc slows allocations down, so memory is measured in a separate run
+    with tempfile.TemporaryDirectory() as directory, chdir(directory):
+        tracemalloc.start()
+        try:
+            function(size)
+            peak_bytes = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return Measurement(best, peak_bytes, output_bytes)
+
+
+def run_benchmarks(names=None, sizes=SIZES, repeat=3, max_size=None, progress=None):
+    """
+    Runs benchmarks and returns {name: {size: Measurement}}.
+
+    Parameters:
+    - names: Benchmark names, all of BENCHMARKS by default.
+    - sizes: Sizes to run.
+    - repeat: Timed runs per size, the best one counts.
+    - max_size: Overrides the largest size of every benchmark.
+    - progress: Optional function called with (name, size, Measurement) after every measurement.
+    """
+    results = {}
+    for name in names or BENCHMARKS:
+        function, largest = BENCHMARKS[name]
+        results[name] = {}
+        # Untimed warm-up, so imports and caches do not count against the smallest size
+        with tempfile.TemporaryDirectory() as directory, chdir(directory):
+            function(min(sizes))
+        for size in sizes:
+            if size > (max_size or largest):
+                continue
+            measurement = measure(function, size, repeat)
+            results[name][size] = measurement
+            if progress is not None:
+                progress(name, size, measurement)
+    return results
+
+
+def to_json(results):
+    return {
+        "environment": {"python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform(),
+                        "seed": SEED, "start_time": START_TIME.isoformat()},
+        "results": {name: {str(size): measurement._asdict() for size, measurement in by_size.items()}
+                    for name, by_size in results.items()},
+    }
+
+
+def from_json(data):
+    return {name: {int(size): Measurement(**values) for size, values in by_size.items()}
+            for name, by_size in data["results"].items()}
+
+
+def compare(baseline, results, threshold=0.2, min_seconds=0.001):
+    """
+    Compares results to a baseline.
+
+    Returns:
+    - (lines, regressions): a report line for every measurement found in both, and the number
+      of wall times or peak memories more than threshold (0.2 = 20 %) above the baseline. Wall
+      times that grew by less than min_seconds are timer noise and do not count.
+    """
+    lines = [f"{'benchmark':<32} {'size':>8} {'time':>10} {'change':>8} {'peak MB':>9} {'change':>8}"]
+    regressions = 0
+    for name, by_size in results.items():
+        for size, current in by_size.items():
+            previous = baseline.get(name, {}).get(size)
+            if previous is None:
+                continue
+            time_change = current.seconds / previous.seconds - 1 if previous.seconds else 0.0
+            memory_change = current.peak_bytes / previous.peak_bytes - 1 if previous.peak_bytes else 0.0
+            flag = ""
+            slower = time_change > threshold and current.seconds - previous.seconds > min_seconds
+            if slower or memory_change > threshold:
+                regressions += 1
+                flag = "  REGRESSION"
+            lines.append(f"{name:<32} {size:>8} {current.seconds:>9.4f}s {time_change:>+8.1%} "
+                         f"{current.peak_bytes / 1e6:>9.2f} {memory_change:>+8.1%}{flag}")
+    return lines, regressions
+
+
+def print_measurement(name, size, measurement):
+    print(f"{name:<32} {size:>8} {measurement.seconds:>9.4f}s {measurement.peak_bytes / 1e6:>9.2f} MB peak "
+          f"{measurement.output_bytes / 1e6:>9.2f} MB out", flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the KML generators and conversion helpers.")
+    parser.add_argument("--only", help="Comma-separated benchmark names, all by default: " + ", ".join(BENCHMARKS))
+    parser.add_argument("--sizes", help="Comma-separated sizes, 10^2 to 10^6 by default")
+    parser.add_argument("--max-size", type=int, help="Largest size for every benchmark, overriding their own limits")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per size, the best one counts")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare with the results in this JSON file")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative slowdown or memory growth reported as a regression")
+    args = parser.parse_args(argv)
+
+    names = args.only.split(",") if args.only else None
+    unknown = [name for name in names or [] if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"Unknown benchmarks {', '.join(unknown)}")
+    sizes = [int(size) for size in args.sizes.split(",")] if args.sizes else SIZES
+    results = run_benchmarks(names, sizes, args.repeat, args.max_size, progress=print_measurement)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(to_json(results), file, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = from_json(json.load(file))
+        lines, regressions = compare(baseline, results, args.threshold)
+        print("\n".join(lines))
+        print(f"{regressions} regressions above {args.threshold:.0%}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+# Description: Level-of-detail circle and segment geometry.
+# Circles are written in several resolution tiers, each in a Folder with a KML Region whose Lod
+# range selects the tier by the projected size of the circle, so distant circles cost a handful
+# of vertices and circles smaller than a few pixels are not drawn at all. The unit-circle
+# cos/sin tables are computed once per number of points and shared by every circle, and
+# many circles are placed with one vectorized geodesy call.
+
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+
+from geodesy import offset_to_geodetic
+from kmlWriter import BLUE, GREEN, RED, RELATIVE_TO_GROUND, Region, with_alpha
+
+# One resolution tier: the circle has num_points segments while its projected size in pixels
+# is between min_lod_pixels and max_lod_pixels (-1 for no upper limit).
+LodTier = namedtuple("LodTier", ["num_points", "min_lod_pixels", "max_lod_pixels"])
+
+# Hidden below 16 pixels, then 8, 32 and 128 points as the circle grows on screen
+DEFAULT_TIERS = (LodTier(8, 16, 128), LodTier(32, 128, 512), LodTier(128, 512, -1))
+
+
+@lru_cache(maxsize=64)
+def unit_circle(num_points):
+    """
+    Returns the (cos, sin) tables of num_points + 1 angles evenly spaced counterclockwise from
+    east, with the last angle equal to the first so the ring is closed. The arrays are cached
+    and read-only.
+    """
+    angles = np.arange(num_points + 1) * (2 * np.pi / num_points)
+    cos, sin = np.cos(angles), np.sin(angles)
+    cos[-1], sin[-1] = cos[0], sin[0]
+    cos.flags.writeable = False
+    sin.flags.writeable = False
+    return cos, sin
+
+
+def circle_rings(latitude, longitude, radius, num_points):
+    """
+    Returns the (lat, lon) rings of many circles at once.
+
+    Parameters:
+    - latitude, longitude: Centers in degrees, scalars or arrays of the circles.
+    - radius: Radii in meters, broadcast with the centers.
+    - num_points: Number of segments of every ring.
+
+    Returns:
+    - lat, lon arrays of shape circles + (num_points + 1,), closed rings counterclockwise from east.
+    """
+    cos, sin = unit_circle(num_points)
+    latitude, longitude, radius = (np.asarray(a, dtype=float)[..., None] for a in np.broadcast_arrays(latitude, longitude, radius))
+    return offset_to_geodetic(latitude, longitude, radius * cos, radius * sin)
+
+
+def circle_regions(latitude, longitude, radius, tier):
+    """Returns the Region of every circle for a tier, the bounding box of the circle with the Lod of the tier."""
+    latitude, longitude, radius = np.broadcast_arrays(*(np.asarray(a, dtype=float) for a in (latitude, longitude, radius)))
+    # North, south, east and west extremes of the circles
+    lat, lon = offset_to_geodetic(latitude[..., None], longitude[..., None],
+                                  radius[..., None] * np.array([0.0, 0.0, 1.0, -1.0]),
+                                  radius[..., None] * np.array([1.0, -1.0, 0.0, 0.0]))
+    return [Region(north, south, east, west, tier.min_lod_pixels, tier.max_lod_pixels)
+            for north, south, east, west in zip(lat[..., 0].ravel().tolist(), lat[..., 1].ravel().tolist(),
+                                                lon[..., 2].ravel().tolist(), lon[..., 3].ravel().tolist())]
+
+
+def write_lod_circles(writer, latitude, longitude, altitude, radius, tiers=DEFAULT_TIERS, names=None, begin=None, end=None):
+    """
+    Writes circle polygons at every level of detail.
+
+    Every circle gets one Folder per tier with a Region around the circle, so a viewer loads
+    exactly one tier of a circle, matching its size on screen.
+
+    Parameters:
+    - writer: Open kmlWriter.KmlStreamWriter.
+    - latitude, longitude, altitude, radius: Centers in degrees, heights and radii in meters,
+      scalars or arrays broadcast into the circles.
+    - tiers: LodTier list from coarse to fine.
+    - names: Optional circle names, "Circle" for all by default.
+    - begin, end: Optional KML time span of all circles.
+    """
+    latitude, longitude, altitude, radius = (np.ravel(a).astype(float) for a in np.broadcast_arrays(latitude, longitude, altitude, radius))
+    style_id = writer.style(line_color=BLUE, line_width=2, poly_color=with_alpha(150, RED), poly_fill=1, poly_outline=1)
+    for tier in tiers:
+        lat, lon = circle_rings(latitude, longitude, radius, tier.num_points)
+        regions = circle_regions(latitude, longitude, radius, tier)
+        for index, region in enumerate(regions):
+            writer.begin_folder(region=region)
+            writer.polygon(zip(lon[index].tolist(), lat[index].tolist(), [altitude[index]] * lat.shape[1]),
+                           name=names[index] if names else "Circle", begin=begin, end=end, style_id=style_id,
+                           altitudemode=RELATIVE_TO_GROUND, extrude=0)
+            writer.end_folder()
+    return writer
+
+
+def write_lod_segments(writer, latitude, longitude, altitude, radius, spans, tiers=DEFAULT_TIERS, with_vectors=True):
+    """
+    Writes the timed segments of a circle at every level of detail.
+
+    Segment i covers the angles from i to i + 1 times 360 / len(spans) degrees, counterclockwise
+    from east, and is shown during spans[i]. Coarse tiers draw each segment as a triangle, finer
+    tiers follow the arc with more points, and the vectors from the center to the segment edges
+    are only drawn in the finest tier.
+
+    Parameters:
+    - writer: Open kmlWriter.KmlStreamWriter.
+    - latitude, longitude, altitude, radius: Center in degrees, height and radius in meters.
+    - spans: List of (begin, end) KML times, one per segment.
+    - tiers: LodTier list from coarse to fine. The segments of a tier share its num_points,
+      at least one per segment.
+    - with_vectors: Also draw the vectors radiating from the center.
+    """
+    count = len(spans)
+    center = (longitude, latitude, altitude)
+    segment_style = writer.style(line_color=BLUE, line_width=2, poly_color=with_alpha(150, RED), poly_fill=1, poly_outline=1)
+    vector_style = writer.style(line_color=with_alpha(200, GREEN), line_width=4) if with_vectors else None
+    region = circle_regions(latitude, longitude, radius, tiers[0])[0]
+    for tier_index, tier in enumerate(tiers):
+        per_segment = max(1, tier.num_points // count)
+        lat, lon = circle_rings(latitude, longitude, radius, per_segment * count)
+        lon, lat = lon.tolist(), lat.tolist()
+        writer.begin_folder(region=region._replace(min_lod_pixels=tier.min_lod_pixels, max_lod_pixels=tier.max_lod_pixels))
+        for i, (begin, end) in enumerate(spans):
+            arc = range(i * per_segment, (i + 1) * per_segment + 1)
+            coords = [center] + [(lon[k], lat[k], altitude) for k in arc] + [center]
+            writer.polygon(coords, name=f"Segment {i+1}", begin=begin, end=end, style_id=segment_style,
+                           altitudemode=RELATIVE_TO_GROUND, extrude=0)
+            if with_vectors and tier_index == len(tiers) - 1:
+                for k, angle_deg in ((arc[0], i * 360 / count), (arc[-1], (i + 1) * 360 / count)):
+                    writer.linestring([center, (lon[k], lat[k], altitude)], name=f"Vector from Segment {i+1} at {angle_deg} degrees",
+                                      begin=begin, end=end, style_id=vector_style)
+        writer.end_folder()
+    return writer
@@ -1,5 +1,41 @@
+import numpy as np
+
 def pressure(area, force):
     return force / area
 
 def pressureInLiquid(density, depth, patm=101325):
-    return density * 9.80 * depth
\ No newline at end of file
+    return density * 9.80 * depth
+
+# International Standard Atmosphere (ISA), valid from sea level to 20 km.
+# The functions accept scalars or NumPy arrays of altitudes in meters.
+SEA_LEVEL_PRESSURE = 101325.0  # Pa
+SEA_LEVEL_TEMPERATURE = 288.15  # K
+SEA_LEVEL_DENSITY = 1.225  # kg/m^3
+LAPSE_RATE = 0.0065  # Temperature drop per meter in the troposphere (K/m)
+TROPOPAUSE_ALTITUDE = 11000.0  # m
+GAS_CONSTANT_AIR = 287.05287  # Specific gas constant of dry air (J/(kg K))
+STANDARD_GRAVITY = 9.80665  # m/s^2
+
+# Air temperature in K at an altitude in meters
+def airTemperature(altitude):
+    altitude = np.minimum(np.maximum(altitude, 0.0), 20000.0)
+    return SEA_LEVEL_TEMPERATURE - LAPSE_RATE * np.minimum(altitude, TROPOPAUSE_ALTITUDE)
+
+# Air pressure in Pa at an altitude in meters
+def airPressure(altitude):
+    altitude = np.minimum(np.maximum(altitude, 0.0), 20000.0)
+    exponent = STANDARD_GRAVITY / (GAS_CONSTANT_AIR * LAPSE_RATE)
+    tropopauseTemperature = SEA_LEVEL_TEMPERATURE - LAPSE_RATE * TROPOPAUSE_ALTITUDE
+    troposphere = SEA_LEVEL_PRESSURE * (airTemperature(altitude) / SEA_LEVEL_TEMPERATURE) ** exponent
+    tropopausePressure = SEA_LEVEL_PRESSURE * (tropopauseTemperature / SEA_LEVEL_TEMPERATURE) ** exponent
+    # Isothermal layer above the tropopause
+    stratosphere = tropopausePressure * np.exp(-STANDARD_GRAVITY * (altitude - TROPOPAUSE_ALTITUDE) / (GAS_CONSTANT_AIR * tropopauseTemperature))
+    return np.where(altitude <= TROPOPAUSE_ALTITUDE, troposphere, stratosphere)
+
+# Air density in kg/m^3 at an altitude in meters (ideal gas law)
+def airDensity(altitude):
+    return airPressure(altitude) / (GAS_CONSTANT_AIR * airTemperature(altitude))
+
+# Drag force magnitude in N: F = 1/2 * rho * v^2 * Cd * A
+def dragForce(density, speed, dragCoefficient, area):
+    return 0.5 * density * speed**2 * dragCoefficient * area
@@ -0,0 +1,192 @@
+# Description: Conversions between local east/north/up offsets and WGS84 coordinates.
+# Exact conversions go through Earth-centered Earth-fixed (ECEF) coordinates on the WGS84
+# ellipsoid. The local frame of an origin is cached, so repeated conversions around the same
+# launch point cost a few array operations. A flat approximation using the local radii of
+# curvature is used instead when its error is within a given budget.
+
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+
+# WGS84 ellipsoid
+WGS84_A = 6378137.0  # Semi-major axis (m)
+WGS84_F = 1 / 298.257223563  # Flattening
+WGS84_B = WGS84_A * (1 - WGS84_F)  # Semi-minor axis (m)
+WGS84_E2 = WGS84_F * (2 - WGS84_F)  # First eccentricity squared
+WGS84_EP2 = WGS84_E2 / (1 - WGS84_E2)  # Second eccentricity squared
+
+# Default error budget in meters for offset_to_geodetic, below which the flat approximation is used
+DEFAULT_MAX_ERROR = 0.01
+
+# Local east/north/up frame at an origin. Fields are floats for a scalar origin, arrays otherwise.
+# - lat, lon, h: origin in degrees and meters above the ellipsoid
+# - x, y, z: origin in ECEF meters
+# - sin_lat, cos_lat, sin_lon, cos_lon: trigonometry of the origin, reused by every conversion
+# - meridian_radius, normal_radius: north-south and east-west radii of curvature at the origin in meters
+LocalFrame = namedtuple(
+    "LocalFrame",
+    ["lat", "lon", "h", "x", "y", "z", "sin_lat", "cos_lat", "sin_lon", "cos_lon", "meridian_radius", "normal_radius"],
+)
+
+
+def radii_of_curvature(lat):
+    """Returns the meridian and prime vertical radii of curvature in meters at latitudes in degrees."""
+    sin_lat = np.sin(np.radians(lat))
+    w2 = 1 - WGS84_E2 * sin_lat**2
+    normal_radius = WGS84_A / np.sqrt(w2)
+    return normal_radius * (1 - WGS84_E2) / w2, normal_radius
+
+
+def geodetic_to_ecef(lat, lon, h):
+    """Converts latitudes and longitudes in degrees and heights above the ellipsoid in meters to ECEF x, y, z."""
+    lat_rad = np.radians(lat)
+    lon_rad = np.radians(lon)
+    sin_lat, cos_lat = np.sin(lat_rad), np.cos(lat_rad)
+    normal_radius = WGS84_A / np.sqrt(1 - WGS84_E2 * sin_lat**2)
+    x = (normal_radius + h) * cos_lat * np.cos(lon_rad)
+    y = (normal_radius + h) * cos_lat * np.sin(lon_rad)
+    z = (normal_radius * (1 - WGS84_E2) + h) * sin_lat
+    return x, y, z
+
+
+def ecef_to_geodetic(x, y, z):
+    """
+    Converts ECEF coordinates to latitudes, longitudes and heights above the ellipsoid.
+
+    Uses Bowring's closed form, accurate to well under a millimeter for points near the surface.
+    """
+    x, y, z = np.asarray(x, dtype=float), np.asarray(y, dtype=float), np.asarray(z, dtype=float)
+    p = np.hypot(x, y)
+    theta = np.arctan2(z * WGS84_A, p * WGS84_B)
+    lat_rad = np.arctan2(z + WGS84_EP2 * WGS84_B * np.sin(theta)**3, p - WGS84_E2 * WGS84_A * np.cos(theta)**3)
+    sin_lat = np.sin(lat_rad)
+    h = p * np.cos(lat_rad) + z * sin_lat - WGS84_A * np.sqrt(1 - WGS84_E2 * sin_lat**2)
+    return np.degrees(lat_rad), np.degrees(np.arctan2(y, x)), h
+
+
+def compute_frame(lat, lon, h=0.0):
+    """Builds the LocalFrame of an origin, or of arrays of origins."""
+    lat_rad = np.radians(lat)
+    lon_rad = np.radians(lon)
+    x, y, z = geodetic_to_ecef(lat, lon, h)
+    meridian_radius, normal_radius = radii_of_curvature(lat)
+    return LocalFrame(lat, lon, h, x, y, z, np.sin(lat_rad), np.cos(lat_rad), np.sin(lon_rad), np.cos(lon_rad),
+                      meridian_radius, normal_radius)
+
+
+@lru_cache(maxsize=256)
+def cached_frame(lat, lon, h):
+    return LocalFrame(*(float(value) for value in compute_frame(lat, lon, h)))
+
+
+def local_frame(lat, lon, h=0.0):
+    """
+    Returns the LocalFrame of an origin.
+
+    Scalar origins are cached, so converting many arrays around the same launch point computes
+    the frame once. Array origins (one per launch) are computed every call.
+    """
+    if np.ndim(lat) == 0 and np.ndim(lon) == 0 and np.ndim(h) == 0:
+        return cached_frame(float(lat), float(lon), float(h))
+    return compute_frame(np.asarray(lat, dtype=float), np.asarray(lon, dtype=float), np.asarray(h, dtype=float))
+
+
+def enu_to_geodetic(lat0, lon0, h0, east, north, up):
+    """
+    Converts east/north/up offsets in meters from an origin to WGS84 coordinates.
+
+    Parameters:
+    - lat0, lon0, h0: Origin in degrees and meters above the ellipsoid, scalars or arrays broadcast with the offsets.
+    - east, north, up: Offsets in meters along the tangent plane axes of the origin.
+
+    Returns:
+    - (lat, lon, h) arrays.
+    """
+    frame = local_frame(lat0, lon0, h0)
+    east, north, up = np.asarray(east, dtype=float), np.asarray(north, dtype=float), np.asarray(up, dtype=float)
+    # Rotate from the tangent plane to ECEF axes
+    t = frame.cos_lat * up - frame.sin_lat * north
+    x = frame.x + frame.cos_lon * t - frame.sin_lon * east
+    y = frame.y + frame.sin_lon * t + frame.cos_lon * east
+    z = frame.z + frame.sin_lat * up + frame.cos_lat * north
+    return ecef_to_geodetic(x, y, z)
+
+
+def geodetic_to_enu(lat0, lon0, h0, lat, lon, h):
+    """
+    Converts WGS84 coordinates to east/north/up offsets in meters from an origin.
+
+    Parameters:
+    - lat0, lon0, h0: Origin in degrees and meters above the ellipsoid.
+    - lat, lon, h: Points in degrees and meters above the ellipsoid.
+
+    Returns:
+    - (east, north, up) arrays.
+    """
+    frame = local_frame(lat0, lon0, h0)
+    x, y, z = geodetic_to_ecef(lat, lon, h)
+    dx, dy, dz = x - frame.x, y - frame.y, z - frame.z
+    t = frame.cos_lon * dx + frame.sin_lon * dy
+    east = frame.cos_lon * dy - frame.sin_lon * dx
+    north = frame.cos_lat * dz - frame.sin_lat * t
+    up = frame.cos_lat * t + frame.sin_lat * dz
+    return east, north, up
+
+
+def flat_error(distance, lat0):
+    """
+    Estimates the error in meters of the flat approximation at a horizontal distance from an origin.
+
+    The dominant term is the departure of a straight east-west line from the parallel it starts on,
+    distance^2 * tan(lat) / (2 R), plus the distance^2 / (2 R) drop of the tangent plane.
+    """
+    _, normal_radius = radii_of_curvature(lat0)
+    return distance**2 * (1 + np.abs(np.tan(np.radians(lat0)))) / (2 * normal_radius)
+
+
+def flat_offset_to_geodetic(lat0, lon0, east, north):
+    """
+    Converts horizontal offsets to coordinates with the local radii of curvature of the origin.
+
+    Accurate for short offsets, see flat_error.
+    """
+    frame = local_frame(lat0, lon0)
+    lat = frame.lat + np.degrees(np.asarray(north, dtype=float) / frame.meridian_radius)
+    lon = frame.lon + np.degrees(np.asarray(east, dtype=float) / (frame.normal_radius * frame.cos_lat))
+    return lat, lon
+
+
+def offset_to_geodetic(lat0, lon0, east, north, max_error=DEFAULT_MAX_ERROR):
+    """
+    Converts horizontal east/north offsets in meters from an origin on the ground to latitudes and longitudes.
+
+    The result is the ground point directly below the tangent plane point (east, north, 0), so
+    heights stay relative to the ground like in the simulations, while the horizontal position
+    follows the curvature of the ellipsoid over long ranges.
+
+    Parameters:
+    - lat0, lon0: Origin in degrees, scalars or arrays broadcast with the offsets.
+    - east, north: Offsets in meters.
+    - max_error: Error budget in meters. When the flat approximation is within it for every offset
+      it is used instead of the exact conversion. None always uses the exact conversion.
+
+    Returns:
+    - (lat, lon) arrays.
+    """
+    east, north = np.asarray(east, dtype=float), np.asarray(north, dtype=float)
+    if max_error is not None:
+        distance = np.max(np.hypot(east, north), initial=0.0)
+        if np.all(flat_error(distance, lat0) <= max_error):
+            return flat_offset_to_geodetic(lat0, lon0, east, north)
+    lat, lon, _ = enu_to_geodetic(lat0, lon0, 0.0, east, north, 0.0)
+    return lat, lon
+
+
+def geodetic_to_offset(lat0, lon0, lat, lon):
+    """Converts latitudes and longitudes to horizontal east/north offsets in meters from an origin, the inverse of offset_to_geodetic."""
+    east, north, up = geodetic_to_enu(lat0, lon0, 0.0, lat, lon, 0.0)
+    # Follow the ellipsoid normal of the ground point up or down to the tangent plane
+    east_1, north_1, up_1 = geodetic_to_enu(lat0, lon0, 0.0, lat, lon, 1.0)
+    scale = -up / (up_1 - up)
+    return east + scale * (east_1 - east), north + scale * (north_1 - north)
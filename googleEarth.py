@@ -1,103 +1,141 @@
-import simplekml
+import argparse
 from datetime import datetime, timedelta
-import time
 import random
-import math
-from math import pi, cos, sin, radians
-
-import sys
-sys.path.append('../')
-# We should implement this somewhere: https://geodesy.noaa.gov/api/gravd/gp?lat=40.0&lon=-80.0&eht=100.0
-# This is the gravity API. It returns the gravity at a given lat, long, and height. We can use this to get the gravity constant for a given location.
+from math import cos, sin, radians
+
+import numpy as np
+
+from circleLod import DEFAULT_TIERS, circle_rings, write_lod_circles, write_lod_segments
+from geodesy import offset_to_geodetic
+from instrumentation import BUILD, FORMAT_TIMES, METRICS, PHYSICS, PLACEMARKS, SAMPLES, WRITE, count, enable, stage
+from kmlOutput import open_kml_output, output_path, save_kml
+from kmlStyles import shared_style
+from kmlWriter import KmlStreamWriter, RED, GREEN, BLUE, RELATIVE_TO_GROUND, with_alpha
+from lazyImport import lazy_import
+from resultCache import ResultCache, cached_call
+from vectorChain import chain_coords, chain_vertices
+
+# Loaded on first use, importing this module only defines the functions
+simplekml = lazy_import("simplekml")
+liveUpdate = lazy_import("liveUpdate")
+# Location-dependent gravity (normal gravity, or the NOAA gravd API behind a cache) is in gravity.py.
 default_icon = "http://maps.google.com/mapfiles/kml/shapes/donut.png"
 GRAVITY_CONSTANT = 9.80
-DEGREE_OF_RADIUS_LINE = 111139
-
-def meters_to_lat_change(meters):
-    """Converts meters to a change in latitude in degrees."""
-    return meters / DEGREE_OF_RADIUS_LINE
 
-def meters_to_long_change(meters, lat):
-    """Converts meters to a change in longitude in degrees, given a latitude."""
-    return meters / (DEGREE_OF_RADIUS_LINE * math.cos(math.radians(lat)))
+def offset_lat_long(lat, long, north, east):
+    """Returns the (lat, long) reached by moving north and east meters from (lat, long)."""
+    new_lat, new_long = offset_to_geodetic(lat, long, east, north)
+    return float(new_lat), float(new_long)
 
 
 class Particle:
-    def vector_operations(vectors):
+    def vector_operations(vectors, stream=False, output_format="kml", multigeometry=False):
+        """
+        Writes vectors to vector_operations.kml and returns their (end_lat, end_long, h1, h2).
+        The endpoints of all vectors are computed with one vectorized geodesy call.
+
+        Parameters:
+        - vectors: Dicts with name, lat, long, i (meters north), j (meters east) and optional h1, h2.
+        - stream: Write the file one vector at a time instead of building a simplekml document.
+        - multigeometry: Write all vectors as one Placemark with a MultiGeometry, much faster to
+          load than a Placemark per vector.
+        """
+        # lat, long, i and j are required, a vector without them raises KeyError
+        lat, long, i, j = (np.array([vector[key] for vector in vectors], dtype=float) for key in ("lat", "long", "i", "j"))
+        h1, h2 = (np.array([vector.get(key, 0) for vector in vectors], dtype=float) for key in ("h1", "h2"))
+        with stage(PHYSICS):
+            end_lat, end_long = offset_to_geodetic(lat, long, j, i)
+        # Plain floats, as the vectors were converted one by one before
+        results = list(zip(end_lat.tolist(), end_long.tolist(), [vector.get('h1', 0) for vector in vectors],
+                           [vector.get('h2', 0) for vector in vectors]))
+        lines = [[(start_long, start_lat, start_h), (stop_long, stop_lat, stop_h)] for start_lat, start_long, start_h, stop_lat, stop_long, stop_h
+                 in zip(lat.tolist(), long.tolist(), h1.tolist(), end_lat.tolist(), end_long.tolist(), h2.tolist())]
+        # With stream=True the vectors are written to the file one by one instead of building a simplekml document
+        if stream:
+            with stage(WRITE), open_kml_output(output_path("vector_operations", output_format)) as output, KmlStreamWriter(output) as writer:
+                style_id = writer.style(label_scale=0.6, icon_href=default_icon, icon_scale=0.5)
+                if multigeometry:
+                    writer.multi_linestring(lines, name="Vectors", style_id=style_id, altitudemode=RELATIVE_TO_GROUND)
+                else:
+                    for vector, coords in zip(vectors, lines):
+                        writer.linestring(coords, name=vector['name'], style_id=style_id, altitudemode=RELATIVE_TO_GROUND)
+            return results
         kml = simplekml.Kml()
-        results = []  # To store the final coordinates and k values for each vector
-        for vector in vectors:
-            name = vector['name']
-            lat = vector['lat']
-            long = vector['long']
-            i = vector['i']
-            j = vector['j']
-            h1 = vector.get('h1', 0)  # Default value if h1 is not provided
-            h2 = vector.get('h2', 0)  # Default value if h2 is not provided
-
-            
-            point = kml.newlinestring()
-            point.name = name
-            delta_lat = meters_to_lat_change(i)
-            delta_long = meters_to_long_change(j, lat)
-            print(f"{lat + delta_lat}, {long + delta_long}")
-            point.coords = [(long, lat, h1), (long + delta_long, lat + delta_lat, h2)]
-            point.style.labelstyle.scale = 0.6
-            # Assuming 'default_icon' is defined somewhere globally
-            point.style.iconstyle.icon.href = default_icon
-            point.style.iconstyle.scale = 0.5
-            point.altitudemode = simplekml.AltitudeMode.relativetoground
-           
-
-            results.append((lat + delta_lat, long + delta_long, h1, h2))
-        kml.save(f"vector_operations.kml")
+        with stage(BUILD):
+            style = shared_style(kml, label_scale=0.6, icon_href=default_icon, icon_scale=0.5)
+            if multigeometry:
+                multi = kml.newmultigeometry(name="Vectors")
+                multi.style = style
+                for coords in lines:
+                    line = multi.newlinestring(coords=coords)
+                    line.altitudemode = simplekml.AltitudeMode.relativetoground
+            else:
+                for vector, coords in zip(vectors, lines):
+                    point = kml.newlinestring()
+                    point.name = vector['name']
+                    point.coords = coords
+                    point.style = style
+                    point.altitudemode = simplekml.AltitudeMode.relativetoground
+        count(PLACEMARKS, 1 if multigeometry else len(lines))
+        save_kml(kml, output_path("vector_operations", output_format))
         return results
     def vector(name, lat, long, i, j, h1=0, h2=0):
         kml = simplekml.Kml()
         point = kml.newlinestring()
         point.name = name
-        delta_lat = meters_to_lat_change(i)
-        delta_long = meters_to_long_change(j, lat)
-        print(str(lat + delta_lat) + ", " + str(long + delta_long))
-        point.coords = [(long, lat, h1), (long + delta_long, lat + delta_lat, h2)]
-        point.style.labelstyle.scale = 0.6
-        point.style.iconstyle.icon.href = default_icon
-        point.style.iconstyle.scale = 0.5
+        end_lat, end_long = offset_lat_long(lat, long, i, j)
+        point.coords = [(long, lat, h1), (end_long, end_lat, h2)]
+        point.style = shared_style(kml, label_scale=0.6, icon_href=default_icon, icon_scale=0.5)
         point.altitudemode = simplekml.AltitudeMode.relativetoground
         # kml.save(f"{name}.kml")
         # Need to implement recursion for vectors, pass an array of matrices and use recursion to get a resultant KML. This is just a placeholder.
-        return lat + delta_lat, long + delta_long, i, j, h1, h2
+        return end_lat, end_long, i, j, h1, h2
 
-    def freefall(lat, long, height, name, duration, intervals=100):
+    def freefall(lat, long, height, name, duration, intervals=100, track=False, output_format="kml"):
+        # With track=True the fall is emitted as a single gx:Track instead of one Placemark per interval
         kml = simplekml.Kml()
+        whens = []
+        coords = []
         start_time = datetime.utcnow()
         previous_time = None
         previous_keight = None
         velocity = 0
-        # Split the freefall into intervals
-        for i in range(intervals + 1):
-            fraction = i / intervals
-            current_time = start_time + timedelta(seconds=duration * fraction)
-            current_keight = height - ((1/2) * GRAVITY_CONSTANT * (duration * fraction)**2)  # Simple linear interpolation
-            # if (current_keight < 0):
-            #     current_keight = 0
-            #     return
-            # Create a new point for each interval
-            # Calculate velocity
-            if previous_time and previous_keight:
-                velocity = (current_keight - previous_keight) / (current_time - previous_time).total_seconds()
-            point = kml.newpoint()
-            point.name = f"h: {current_keight:.2f}m, v: {velocity:.2f} m/s"
-            point.coords = [(long, lat, current_keight)]
-            point.style.labelstyle.scale = 0.6
-            point.style.iconstyle.icon.href = default_icon
-            point.style.iconstyle.scale = 0.5
-            point.altitudemode = simplekml.AltitudeMode.relativetoground
-            # point.timestamp.begin = start_time.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
-            point.timestamp.when = current_time.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
-            previous_time = current_time
-            previous_keight = current_keight
-        kml.save(f"freefall_{name}.kml")
+        # Split the freefall into intervals. Physics, timestamps and simplekml objects are computed
+        # together per interval, so the whole loop is timed as the build stage.
+        with stage(BUILD):
+            for i in range(intervals + 1):
+                fraction = i / intervals
+                current_time = start_time + timedelta(seconds=duration * fraction)
+                current_keight = height - ((1/2) * GRAVITY_CONSTANT * (duration * fraction)**2)  # Simple linear interpolation
+                # if (current_keight < 0):
+                #     current_keight = 0
+                #     return
+                # Create a new point for each interval
+                # Calculate velocity
+                if previous_time and previous_keight:
+                    velocity = (current_keight - previous_keight) / (current_time - previous_time).total_seconds()
+                if track:
+                    whens.append(current_time.strftime('%Y-%m-%dT%H:%M:%S.%fZ'))
+                    coords.append((long, lat, current_keight))
+                else:
+                    point = kml.newpoint()
+                    point.name = f"h: {current_keight:.2f}m, v: {velocity:.2f} m/s"
+                    point.coords = [(long, lat, current_keight)]
+                    point.style = shared_style(kml, label_scale=0.6, icon_href=default_icon, icon_scale=0.5)
+                    point.altitudemode = simplekml.AltitudeMode.relativetoground
+                    # point.timestamp.begin = start_time.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+                    point.timestamp.when = current_time.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+                previous_time = current_time
+                previous_keight = current_keight
+        if track:
+            fall = kml.newgxtrack(name=name)
+            fall.newwhen(whens)
+            fall.newgxcoord(coords)
+            fall.altitudemode = simplekml.AltitudeMode.relativetoground
+            fall.style = shared_style(kml, label_scale=0.6, icon_href=default_icon, icon_scale=0.5)
+        count(SAMPLES, intervals + 1)
+        count(PLACEMARKS, 1 if track else intervals + 1)
+        save_kml(kml, output_path(f"freefall_{name}", output_format))
 
     def horizontal_projection(lat, long, height, name, duration):
         kml = simplekml.Kml()
@@ -117,174 +155,211 @@ class Particle:
         newPoint.timespan.begin = start_time_str
         newPoint.timespan.end = end_time_str
         kml.save("horizontal_projection_" + name + ".kml")
-def create_circle(latitude, longitude, altitude, radius, num_points, start_time, end_time):
-    kml = simplekml.Kml()
-    pol = kml.newpolygon(name="Circle")
-    pol.extrude = 0
-    pol.altitudemode = simplekml.AltitudeMode.relativetoground
-    # Style
-    polstyle = simplekml.PolyStyle(color=simplekml.Color.red, fill=1, outline=1)
-    linestyle = simplekml.LineStyle(color=simplekml.Color.blue, width=5)
-    pol.style.polystyle = polstyle
-    pol.style.linestyle = linestyle
-
-    # Time span
-    pol.timespan.begin = start_time  # Start time in YYYY-MM-DD format
-    pol.timespan.end = end_time  # End time in YYYY-MM-DD format
-    # Generate the points on the circle and automatically include the first point at the end to close the circle
-    coords = [(longitude + (cos(radians(angle_deg)) * radius / 111319.5),
-               latitude + (sin(radians(angle_deg)) * radius * math.cos(radians(latitude)) / 111319.5),
-               altitude) for angle_deg in (i * 360 / num_points for i in range(num_points + 1))]  # +1 to close the circle
-
-    # Assign the points to the polygon's outer boundary
-    pol.outerboundaryis.coords = coords
+def create_circle(latitude, longitude, altitude, radius, num_points, start_time, end_time, writer=None, tiers=None):
+    # With tiers (circleLod.LodTier list, e.g. circleLod.DEFAULT_TIERS) the circle is written to the
+    # writer at several levels of detail inside Regions, and num_points is not used
+    if writer is not None and tiers is not None:
+        return write_lod_circles(writer, latitude, longitude, altitude, radius, tiers, begin=start_time, end=end_time)
+    # Points on the circle from the shared cos/sin table, the first point repeated at the end to close it
+    with stage(PHYSICS):
+        lats, longs = circle_rings(latitude, longitude, radius, num_points)
+    coords = [(lon, lat, altitude) for lon, lat in zip(longs.tolist(), lats.tolist())]
+
+    # Stream straight into an open KmlStreamWriter instead of building a simplekml document
+    if writer is not None:
+        style_id = writer.style(line_color=BLUE, line_width=5, poly_color=RED, poly_fill=1, poly_outline=1)
+        writer.polygon(coords, name="Circle", begin=start_time, end=end_time, style_id=style_id,
+                       altitudemode=RELATIVE_TO_GROUND, extrude=0)
+        return writer
 
-    return kml
-
-def create_timed_segments_circle(latitude, longitude, altitude, radius, num_points, start_time, end_time):
     kml = simplekml.Kml()
-    total_days = (end_time - start_time).days
-    segment_days = total_days / num_points
-
-    for i in range(num_points):
-        # Calculate start and end times for this segment
-        segment_start_time = start_time + timedelta(days=i * segment_days)
-        segment_end_time = segment_start_time + timedelta(days=segment_days)
-
-        # Create a new polygon for each segment
-        pol = kml.newpolygon(name=f"Segment {i+1}")
+    with stage(BUILD):
+        pol = kml.newpolygon(name="Circle")
         pol.extrude = 0
         pol.altitudemode = simplekml.AltitudeMode.relativetoground
-        pol.style.polystyle = simplekml.PolyStyle(color=simplekml.Color.changealphaint(150, simplekml.Color.red), fill=1, outline=1)
-        pol.style.linestyle = simplekml.LineStyle(color=simplekml.Color.blue, width=2)
-        pol.timespan.begin = segment_start_time.strftime('%Y-%m-%d')
-        pol.timespan.end = segment_end_time.strftime('%Y-%m-%d')
+        # Style
+        pol.style = shared_style(kml, poly_color=simplekml.Color.red, poly_fill=1, poly_outline=1,
+                                 line_color=simplekml.Color.blue, line_width=5)
 
-        # Calculate the coordinates for this segment
-        coords = []
-        angle_step = 360 / num_points
-        start_deg = i * angle_step
-        end_deg = (i + 1) * angle_step
-        coords.append((longitude, latitude, altitude))  # Center point
-        for angle_deg in [start_deg, end_deg]:
-            angle_rad = radians(angle_deg)
-            lon = longitude + (cos(angle_rad) * radius / 111319.5)
-            lat = latitude + (sin(angle_rad) * radius * math.cos(radians(latitude)) / 111319.5)
-            coords.append((lon, lat, altitude))
+        # Time span
+        pol.timespan.begin = start_time  # Start time in YYYY-MM-DD format
+        pol.timespan.end = end_time  # End time in YYYY-MM-DD format
 
-        coords.append((longitude, latitude, altitude))  # Close back to center
+        # Assign the points to the polygon's outer boundary
         pol.outerboundaryis.coords = coords
+    count(PLACEMARKS)
 
     return kml
- 
 
-def create_timed_segments_circle(latitude, longitude, altitude, radius, num_points, start_time, end_time):
+def create_timed_segments_circle(latitude, longitude, altitude, radius, num_points, start_time, end_time, writer=None,
+                                 with_vectors=True):
+    # With an open KmlStreamWriter every segment is written as soon as it is computed.
+    # with_vectors adds the two vectors from the center to the edges of every segment.
+    if writer is not None:
+        return stream_timed_segments_circle(writer, latitude, longitude, altitude, radius, num_points, start_time, end_time,
+                                            with_vectors)
     kml = simplekml.Kml()
     total_days = (end_time - start_time).days
     segment_days = total_days / num_points
 
+    # Times, geometry and simplekml objects are computed together per segment, timed as the build stage
+    with stage(BUILD):
+        for i in range(num_points):
+            # Calculate start and end times for this segment
+            segment_start_time = start_time + timedelta(days=i * segment_days)
+            segment_end_time = segment_start_time + timedelta(days=segment_days)
+
+            # Create a new polygon for each segment
+            pol = kml.newpolygon(name=f"Segment {i+1}")
+            pol.extrude = 0
+            pol.altitudemode = simplekml.AltitudeMode.relativetoground
+            pol.style = shared_style(kml, poly_color=simplekml.Color.changealphaint(150, simplekml.Color.red), poly_fill=1, poly_outline=1,
+                                     line_color=simplekml.Color.blue, line_width=2)
+            pol.timespan.begin = segment_start_time.strftime('%Y-%m-%d')
+            pol.timespan.end = segment_end_time.strftime('%Y-%m-%d')
+
+            # Calculate the coordinates for this segment
+            coords = []
+            angle_step = 360 / num_points
+            start_deg = i * angle_step
+            end_deg = (i + 1) * angle_step
+            coords.append((longitude, latitude, altitude))  # Center point
+            for angle_deg in [start_deg, end_deg]:
+                angle_rad = radians(angle_deg)
+                lat, lon = offset_lat_long(latitude, longitude, sin(angle_rad) * radius, cos(angle_rad) * radius)
+                coords.append((lon, lat, altitude))
+                if not with_vectors:
+                    continue
+
+                # Create vectors radiating out from the center
+                vector_line = kml.newlinestring(name=f"Vector from Segment {i+1} at {angle_deg} degrees")
+                vector_line.timespan.begin = segment_start_time.strftime('%Y-%m-%d')
+                vector_line.timespan.end = segment_end_time.strftime('%Y-%m-%d')
+                vector_line.coords = [(longitude, latitude, altitude), (lon, lat, altitude)]
+                pol.altitudemode = simplekml.AltitudeMode.relativetoground
+                vector_line.style = shared_style(kml, line_color=simplekml.Color.changealphaint(200, simplekml.Color.green), line_width=4)
+
+            coords.append((longitude, latitude, altitude))  # Close back to center
+            pol.outerboundaryis.coords = coords
+    count(PLACEMARKS, num_points * (3 if with_vectors else 1))
+
+    return kml
+
+def random_vector_chain(lat, long, first_i=0, first_j=0, length=15):
+    """
+    Builds a chain of vectors as LiveFeatures, each starting where the previous one ends.
+    The first vector goes from 0 to 25 m high, the others have random offsets and end heights.
+    i is meters north and j meters east, like offset_lat_long.
+    """
+    i, j, h2 = [first_i], [first_j], [25]
+    for _ in range(length - 1):
+        i.append(random.randrange(100)*random.randrange(-1, 1))
+        j.append(random.randrange(100)*random.randrange(-1, 1))
+        h2.append(random.randrange(100))
+    chain = chain_vertices(lat, long, 0, j, i, np.diff(h2, prepend=0))
+    coords = chain_coords(chain)
+    return [liveUpdate.LiveFeature(f"vector-{index}", f"Vector {index}", coords[index - 1:index + 1])
+            for index in range(1, length + 1)]
+
+def segment_time_spans(start_time, end_time, num_points):
+    """Returns the (begin, end) dates of the num_points segments splitting the time span, whole days apart."""
+    segment_days = (end_time - start_time).days / num_points
+    spans = []
     for i in range(num_points):
-        # Calculate start and end times for this segment
         segment_start_time = start_time + timedelta(days=i * segment_days)
         segment_end_time = segment_start_time + timedelta(days=segment_days)
-
-        # Create a new polygon for each segment
-        pol = kml.newpolygon(name=f"Segment {i+1}")
-        pol.extrude = 0
-        pol.altitudemode = simplekml.AltitudeMode.relativetoground
-        pol.style.polystyle = simplekml.PolyStyle(color=simplekml.Color.changealphaint(150, simplekml.Color.red), fill=1, outline=1)
-        pol.style.linestyle = simplekml.LineStyle(color=simplekml.Color.blue, width=2)
-        pol.timespan.begin = segment_start_time.strftime('%Y-%m-%d')
-        pol.timespan.end = segment_end_time.strftime('%Y-%m-%d')
-
-        # Calculate the coordinates for this segment
-        coords = []
-        angle_step = 360 / num_points
-        start_deg = i * angle_step
-        end_deg = (i + 1) * angle_step
-        coords.append((longitude, latitude, altitude))  # Center point
+        spans.append((segment_start_time.strftime('%Y-%m-%d'), segment_end_time.strftime('%Y-%m-%d')))
+    return spans
+
+def stream_timed_segments_circle(writer, latitude, longitude, altitude, radius, num_points, start_time, end_time,
+                                 with_vectors=True, tiers=None):
+    with stage(FORMAT_TIMES):
+        spans = segment_time_spans(start_time, end_time, num_points)
+    if tiers is not None:
+        # Several levels of detail inside Regions, see circleLod.write_lod_segments
+        return write_lod_segments(writer, latitude, longitude, altitude, radius, spans, tiers, with_vectors)
+    angle_step = 360 / num_points
+    # All segment edges at once, from the shared cos/sin table
+    with stage(PHYSICS):
+        edge_lats, edge_lons = circle_rings(latitude, longitude, radius, num_points)
+    edge_lats, edge_lons = edge_lats.tolist(), edge_lons.tolist()
+    segment_style = writer.style(line_color=BLUE, line_width=2, poly_color=with_alpha(150, RED), poly_fill=1, poly_outline=1)
+    vector_style = writer.style(line_color=with_alpha(200, GREEN), line_width=4) if with_vectors else None
+
+    for i, (begin, end) in enumerate(spans):
+        coords = [(longitude, latitude, altitude)]  # Center point
         vectors = []
-        for angle_deg in [start_deg, end_deg]:
-            angle_rad = radians(angle_deg)
-            lon = longitude + (cos(angle_rad) * radius / 111319.5)
-            lat = latitude + (sin(angle_rad) * radius * math.cos(radians(latitude)) / 111319.5)
+        for angle_deg, edge in [(i * angle_step, i), ((i + 1) * angle_step, i + 1)]:
+            lon, lat = edge_lons[edge], edge_lats[edge]
             coords.append((lon, lat, altitude))
-
-            # Create vectors radiating out from the center
-            vector_line = kml.newlinestring(name=f"Vector from Segment {i+1} at {angle_deg} degrees")
-            vector_line.timespan.begin = segment_start_time.strftime('%Y-%m-%d')
-            vector_line.timespan.end = segment_end_time.strftime('%Y-%m-%d')
-            vector_line.coords = [(longitude, latitude, altitude), (lon, lat, altitude)]
-            pol.altitudemode = simplekml.AltitudeMode.relativetoground
-            vector_line.style.linestyle.color = simplekml.Color.changealphaint(200, simplekml.Color.green)
-            vector_line.style.linestyle.width = 4
-
+            vectors.append((angle_deg, lon, lat))
         coords.append((longitude, latitude, altitude))  # Close back to center
-        pol.outerboundaryis.coords = coords
-
-    return kml
-
-# Define the parameters for the circle and time span
-start_lat = 38.662463
-start_long = -121.125643
-circle_altitude = 100  # Altitude in meters
-circle_radius = 100  # Radius in meters
-points_on_circle = 36  # Number of segments
-start_time = datetime(2024, 1, 1)
-end_time = datetime(2025, 1, 1)
-
-# Generate the KML
-circle_kml = create_timed_segments_circle(start_lat, start_long, circle_altitude, circle_radius, points_on_circle, start_time, end_time)
-circle_kml.save("timed_circle_segments.kml")
-circle_kml = create_timed_segments_circle(start_lat, start_long, circle_altitude, circle_radius, points_on_circle, start_time, end_time)
-circle_kml.save("timed_circle_with_vectors.kml")
-# For some reason these are switched. x gives a change in the value of the longitude, and y gives a change in the value of the latitude.
-i = 0
-j = 0
-# Path: googleEarth.py
-Particle.freefall(start_lat, start_long, random.randrange(100)*random.randrange(-1, 1), "Group 8", 10, 100)
-   # Generate the KML
-circle_kml = create_circle(start_lat, start_long, circle_altitude, circle_radius, points_on_circle, start_time, end_time)
-circle_kml.save("circle.kml")
-# Need to implement recursion for vectors
-while True: 
-    vector_1_lat, vector_1_lon, vector_1_i, vector_1_j, vector_1_k1, vector_1_k2 = Particle.vector("Vector 1", start_lat, start_long, i, j, 0, 25)
-    vector_2_lat, vector_2_lon, vector_2_i, vector_2_j, vector_2_k1, vector_2_k2 = Particle.vector("Vector 2", vector_1_lat, vector_1_lon, random.randrange(100)*random.randrange(-1, 1), random.randrange(100)*random.randrange(-1, 1), vector_1_k2, random.randrange(100))
-    vector_3_lat, vector_3_lon, vector_3_i, vector_3_j, vector_3_k1, vector_3_k2 = Particle.vector("Vector 3", vector_2_lat, vector_2_lon, random.randrange(100)*random.randrange(-1, 1), random.randrange(100)*random.randrange(-1, 1), vector_2_k2, random.randrange(100))
-    vector_4_lat, vector_4_lon, vector_4_i, vector_4_j, vector_4_k1, vector_4_k2 = Particle.vector("Vector 4", vector_3_lat, vector_3_lon, random.randrange(100)*random.randrange(-1, 1), random.randrange(100)*random.randrange(-1, 1), vector_3_k2, random.randrange(100))
-    vector_5_lat, vector_5_lon, vector_5_i, vector_5_j, vector_5_k1, vector_5_k2 = Particle.vector("Vector 5", vector_4_lat, vector_4_lon, random.randrange(100)*random.randrange(-1, 1), random.randrange(100)*random.randrange(-1, 1), vector_4_k2, random.randrange(100))
-    vector_6_lat, vector_6_lon, vector_6_i, vector_6_j, vector_6_k1, vector_6_k2 = Particle.vector("Vector 6", vector_5_lat, vector_5_lon, random.randrange(100)*random.randrange(-1, 1), random.randrange(100)*random.randrange(-1, 1), vector_5_k2, random.randrange(100))
-    vector_7_lat, vector_7_lon, vector_7_i, vector_7_j, vector_7_k1, vector_7_k2 = Particle.vector("Vector 7", vector_6_lat, vector_6_lon, random.randrange(100)*random.randrange(-1, 1), random.randrange(100)*random.randrange(-1, 1), vector_6_k2, random.randrange(100))
-    vector_8_lat, vector_8_lon, vector_8_i, vector_8_j, vector_8_k1, vector_8_k2 = Particle.vector("Vector 8", vector_7_lat, vector_7_lon, random.randrange(100)*random.randrange(-1, 1), random.randrange(100)*random.randrange(-1, 1), vector_7_k2, random.randrange(100))
-    vector_9_lat, vector_9_lon, vector_9_i, vector_9_j, vector_9_k1, vector_9_k2 = Particle.vector("Vector 9", vector_8_lat, vector_8_lon, random.randrange(100)*random.randrange(-1, 1), random.randrange(100)*random.randrange(-1, 1), vector_8_k2, random.randrange(100))
-    vector_10_lat, vector_10_lon, vector_10_i, vector_10_j, vector_10_k1, vector_10_k2 = Particle.vector("Vector 10", vector_9_lat, vector_9_lon, random.randrange(100)*random.randrange(-1, 1), random.randrange(100)*random.randrange(-1, 1), vector_9_k2, random.randrange(100))
-    vector_11_lat, vector_11_lon, vector_11_i, vector_11_j, vector_11_k1, vector_11_k2 = Particle.vector("Vector 11", vector_10_lat, vector_10_lon, random.randrange(100)*random.randrange(-1, 1), random.randrange(100)*random.randrange(-1, 1), vector_10_k2, random.randrange(100))
-    vector_12_lat, vector_12_lon, vector_12_i, vector_12_j, vector_12_k1, vector_12_k2 = Particle.vector("Vector 12", vector_11_lat, vector_11_lon, random.randrange(100)*random.randrange(-1, 1), random.randrange(100)*random.randrange(-1, 1), vector_11_k2, random.randrange(100))
-    vector_13_lat, vector_13_lon, vector_13_i, vector_13_j, vector_13_k1, vector_13_k2 = Particle.vector("Vector 13", vector_12_lat, vector_12_lon, random.randrange(100)*random.randrange(-1, 1), random.randrange(100)*random.randrange(-1, 1), vector_12_k2, random.randrange(100))
-    vector_14_lat, vector_14_lon, vector_14_i, vector_14_j, vector_14_k1, vector_14_k2 = Particle.vector("Vector 14", vector_13_lat, vector_13_lon, random.randrange(100)*random.randrange(-1, 1), random.randrange(100)*random.randrange(-1, 1), vector_13_k2, random.randrange(100))
-    vector_15_lat, vector_15_lon, vector_15_i, vector_15_j, vector_15_k1, vector_15_k2 = Particle.vector("Vector 15", vector_14_lat, vector_14_lon, random.randrange(100)*random.randrange(-1, 1), random.randrange(100)*random.randrange(-1, 1), vector_14_k2, random.randrange(100))
-    vector_16_lat, vector_16_lon, vector_16_i, vector_16_j, vector_16_k1, vector_16_k2 = Particle.vector("Vector 16", vector_15_lat, vector_15_lon, random.randrange(100)*random.randrange(-1, 1), random.randrange(100)*random.randrange(-1, 1), vector_15_k2, random.randrange(100))
-
-
-
-    # Particle.horizontal_projectioan(38.66226127273164, -121.1262282178109, 10, "Group 8", 10)
-    vectors = [
-        {"name": "Vector 1", "lat": start_lat, "long": start_long, "i": vector_1_i, "j": vector_1_j, "h1": 0, "h2": 25},
-        {"name": "Vector 2", "lat": vector_1_lat, "long": vector_1_lon, "i": vector_2_i, "j": vector_2_j, "h1": vector_1_k2, "h2": vector_2_k2},
-        {"name": "Vector 3", "lat": vector_2_lat, "long": vector_2_lon, "i": vector_3_i, "j": vector_3_j, "h1": vector_2_k2, "h2": vector_3_k2},
-        {"name": "Vector 4", "lat": vector_3_lat, "long": vector_3_lon, "i": vector_4_i, "j": vector_4_j, "h1": vector_3_k2, "h2": vector_4_k2},
-        {"name": "Vector 5", "lat": vector_4_lat, "long": vector_4_lon, "i": vector_5_i, "j": vector_5_j, "h1": vector_4_k2, "h2": vector_5_k2},
-        {"name": "Vector 6", "lat": vector_5_lat, "long": vector_5_lon, "i": vector_6_i, "j": vector_6_j, "h1": vector_5_k2, "h2": vector_6_k2},
-        {"name": "Vector 7", "lat": vector_6_lat, "long": vector_6_lon, "i": vector_7_i, "j": vector_7_j, "h1": vector_6_k2, "h2": vector_7_k2},
-        {"name": "Vector 8", "lat": vector_7_lat, "long": vector_7_lon, "i": vector_8_i, "j": vector_8_j, "h1": vector_7_k2, "h2": vector_8_k2},
-        {"name": "Vector 9", "lat": vector_8_lat, "long": vector_8_lon, "i": vector_9_i, "j": vector_9_j, "h1": vector_8_k2, "h2": vector_9_k2},
-        {"name": "Vector 10", "lat": vector_9_lat, "long": vector_9_lon, "i": vector_10_i, "j": vector_10_j, "h1": vector_9_k2, "h2": vector_10_k2},
-        {"name": "Vector 11", "lat": vector_10_lat, "long": vector_10_lon, "i": vector_11_i, "j": vector_11_j, "h1": vector_10_k2, "h2": vector_11_k2},
-        {"name": "Vector 12", "lat": vector_11_lat, "long": vector_11_lon, "i": vector_12_i, "j": vector_12_j, "h1": vector_11_k2, "h2": vector_12_k2},
-        {"name": "Vector 13", "lat": vector_12_lat, "long": vector_12_lon, "i": vector_13_i, "j": vector_13_j, "h1": vector_12_k2, "h2": vector_13_k2},
-        {"name": "Vector 14", "lat": vector_13_lat, "long": vector_13_lon, "i": vector_14_i, "j": vector_14_j, "h1": vector_13_k2, "h2": vector_14_k2},
-        {"name": "Vector 15", "lat": vector_14_lat, "long": vector_14_lon, "i": vector_15_i, "j": vector_15_j, "h1": vector_14_k2, "h2": vector_15_k2},
-        ]
-    results = Particle.vector_operations(vectors)
-    time.sleep(1)
 
+        # Same order as the simplekml version: the segment polygon, then the vectors radiating out from the center
+        writer.polygon(coords, name=f"Segment {i+1}", begin=begin, end=end, style_id=segment_style,
+                       altitudemode=RELATIVE_TO_GROUND, extrude=0)
+        if not with_vectors:
+            continue
+        for angle_deg, lon, lat in vectors:
+            writer.linestring([(longitude, latitude, altitude), (lon, lat, altitude)],
+                              name=f"Vector from Segment {i+1} at {angle_deg} degrees", begin=begin, end=end, style_id=vector_style)
+    return writer
+
+def save_timed_segments_circle(path, latitude, longitude, altitude, radius, num_points, start_time, end_time, cache=None,
+                               with_vectors=True, tiers=None):
+    # Streams the timed segments into path. With a resultCache.ResultCache as cache, the same circle
+    # and time span is copied from the cache instead of being generated again.
+    if cache is not None:
+        cached_call(cache, save_timed_segments_circle, locals(), path, ignore=("path",))
+        return
+    with stage(WRITE), open_kml_output(path) as output, KmlStreamWriter(output) as writer:
+        stream_timed_segments_circle(writer, latitude, longitude, altitude, radius, num_points, start_time, end_time,
+                                     with_vectors, tiers)
+
+def main(argv=None):
+    import asyncio
+    parser = argparse.ArgumentParser(description="Generate the demo circle, freefall and live vector KML files.")
+    parser.add_argument("--interval", type=float, default=1.0, help="Seconds between vector chain updates")
+    parser.add_argument("--iterations", type=int, default=None, help="Stop after this many updates (forever by default)")
+    parser.add_argument("--no-live", action="store_true", help="Only generate the static files")
+    parser.add_argument("--cache-dir", help="Reuse unchanged static files from this result cache directory")
+    parser.add_argument("--lod", action="store_true", help="Write the circle segments at several levels of detail inside Regions")
+    parser.add_argument("--metrics", help="Write stage timings and counters of the static files to this file, "
+                                          "in the Prometheus text format for a .prom file and as JSON otherwise")
+    args = parser.parse_args(argv)
+    if args.metrics:
+        enable()
+
+    # Define the parameters for the circle and time span
+    start_lat = 38.662463
+    start_long = -121.125643
+    circle_altitude = 100  # Altitude in meters
+    circle_radius = 100  # Radius in meters
+    points_on_circle = 36  # Number of segments
+    start_time = datetime(2024, 1, 1)
+    end_time = datetime(2025, 1, 1)
+
+    # Generate the KML
+    cache = ResultCache(args.cache_dir) if args.cache_dir else None
+    tiers = DEFAULT_TIERS if args.lod else None
+    for path in ("timed_circle_segments.kml", "timed_circle_with_vectors.kml"):
+        save_timed_segments_circle(path, start_lat, start_long, circle_altitude, circle_radius, points_on_circle, start_time, end_time,
+                                   cache, tiers=tiers)
+    # For some reason these are switched. x gives a change in the value of the longitude, and y gives a change in the value of the latitude.
+    i = 0
+    j = 0
+    Particle.freefall(start_lat, start_long, random.randrange(100)*random.randrange(-1, 1), "Group 8", 10, 100)
+    # Generate the KML
+    circle_kml = create_circle(start_lat, start_long, circle_altitude, circle_radius, points_on_circle, start_time, end_time)
+    save_kml(circle_kml, "circle.kml")
+    if args.metrics:
+        METRICS.save(args.metrics)
+    if args.no_live:
+        return
+    # Regenerate the vector chain on an event loop, with atomic writes and a NetworkLink
+    # (vector_operations_link.kml) that polls small updates, see liveUpdate.py
+    live_vectors = liveUpdate.LiveUpdateService(lambda: random_vector_chain(start_lat, start_long, i, j), "vector_operations", interval=args.interval)
+    asyncio.run(live_vectors.run(args.iterations))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+# Description: Location-dependent gravitational acceleration.
+# Normal gravity on the WGS84 ellipsoid (Somigliana formula with a second-order height
+# correction) is computed analytically by default. Measured values can come from the NOAA
+# gravd API (https://geodesy.noaa.gov/api/gravd/gp?lat=40.0&lon=-80.0&eht=100.0) through a
+# persistent cache keyed by quantized coordinates, so repeated launches from the same area
+# never hit the network. gravityStub.StubGravityServer stands in for the API locally.
+
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from geodesy import WGS84_A, WGS84_E2, WGS84_F
+from kmlOutput import keep_mode, temporary_file
+from lazyImport import lazy_import
+
+# Only loaded for network lookups, see load_urllib
+urllib_parse = lazy_import("urllib.parse")
+urllib_request = lazy_import("urllib.request")
+
+# WGS84 normal gravity constants
+GRAVITY_EQUATOR = 9.7803253359  # Normal gravity at the equator (m/s^2)
+SOMIGLIANA_K = 0.00193185265241  # (b * gamma_pole) / (a * gamma_equator) - 1
+GRAVITY_M = 0.00344978650684  # omega^2 a^2 b / GM
+
+NOAA_GRAVD_URL = "https://geodesy.noaa.gov/api/gravd/gp"
+GRAVITY_FIELD = "gravity"  # JSON field of the gravity value in the API responses, in mGal
+MGAL = 1e-5  # m/s^2
+
+# Quantization of cache keys: 0.01 degrees (about 1 km) and 10 m of height
+DEFAULT_DEGREE_STEP = 0.01
+DEFAULT_HEIGHT_STEP = 10.0
+
+
+def normal_gravity(lat, h=0.0):
+    """
+    Returns the normal gravity in m/s^2 of the WGS84 ellipsoid.
+
+    Parameters:
+    - lat: Latitudes in degrees, scalar or array.
+    - h: Heights above the ellipsoid in meters, broadcast with lat.
+    """
+    sin2 = np.sin(np.radians(lat))**2
+    surface = GRAVITY_EQUATOR * (1 + SOMIGLIANA_K * sin2) / np.sqrt(1 - WGS84_E2 * sin2)
+    h = np.asarray(h, dtype=float)
+    # Second-order free-air correction
+    return surface * (1 - 2 / WGS84_A * (1 + WGS84_F + GRAVITY_M - 2 * WGS84_F * sin2) * h + 3 * h**2 / WGS84_A**2)
+
+
+def parse_gravity_response(payload, key=GRAVITY_FIELD):
+    """
+    Extracts the gravity in m/s^2 from a JSON response of the gravity API.
+
+    Parameters:
+    - payload: Response body, or the already decoded JSON object.
+    - key: Field holding the gravity in mGal.
+
+    Raises ValueError if the field is missing or not a number.
+    """
+    data = json.loads(payload) if isinstance(payload, (str, bytes)) else payload
+    value = data.get(key) if isinstance(data, dict) else None
+    if not isinstance(value, (int, float)) or isinstance(value, bool):
+        raise ValueError(f"No numeric {key!r} field in gravity response {data!r}")
+    return float(value) * MGAL
+
+
+def load_urllib():
+    """
+    Executes the lazily imported urllib modules. LazyLoader is not thread-safe: threads touching
+    a lazy module for the first time at once can see it half executed, so this runs before any
+    lookup starts in a worker thread.
+    """
+    return urllib_parse.urlencode, urllib_request.urlopen
+
+
+class NoaaGravityBackend:
+    """
+    Looks up gravity from the NOAA gravd API, one request per point.
+
+    Parameters:
+    - base_url: Endpoint of the API, replaceable with a local stand-in such as gravityStub.StubGravityServer.
+    - key: JSON field of the gravity value in mGal.
+    - timeout: Request timeout in seconds.
+    - workers: Number of concurrent requests for batch lookups.
+    """
+
+    def __init__(self, base_url=NOAA_GRAVD_URL, key=GRAVITY_FIELD, timeout=10.0, workers=8):
+        self.base_url = base_url
+        self.key = key
+        self.timeout = timeout
+        self.workers = workers
+
+    def lookup(self, lat, lon, h):
+        query = urllib_parse.urlencode({"lat": f"{lat:.6f}", "lon": f"{lon:.6f}", "eht": f"{h:.2f}"})
+        with urllib_request.urlopen(f"{self.base_url}?{query}", timeout=self.timeout) as response:
+            return parse_gravity_response(response.read(), self.key)
+
+    def lookup_many(self, points):
+        """Looks up a list of (lat, lon, h) points concurrently and returns their gravity values in order."""
+        if len(points) < 2:
+            return [self.lookup(*point) for point in points]
+        load_urllib()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(lambda point: self.lookup(*point), points))
+
+
+class GravityCache:
+    """
+    Persistent gravity values keyed by quantized (lat, lon, h), with least recently used eviction.
+
+    Parameters:
+    - path: JSON file the cache is loaded from and saved to, None for an in-memory cache.
+    - max_entries: Maximum number of cached points.
+    - degree_step, height_step: Quantization of the keys. Points closer than a step share a value.
+    """
+
+    def __init__(self, path=None, max_entries=100000, degree_step=DEFAULT_DEGREE_STEP, height_step=DEFAULT_HEIGHT_STEP):
+        self.path = path
+        self.max_entries = max_entries
+        self.degree_step = degree_step
+        self.height_step = height_step
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.changes = 0  # Number of puts, the cache is dirty while it differs from saved_changes
+        self.saved_changes = 0
+        if path is not None and os.path.exists(path):
+            with open(path, encoding="utf-8") as file:
+                data = json.load(file)
+            if data.get("degree_step") == degree_step and data.get("height_step") == height_step:
+                for key, value in data["entries"]:
+                    self.entries[tuple(key)] = value
+
+    def quantize(self, lat, lon, h):
+        """Returns the integer cache keys of arrays of points as a (N, 3) array."""
+        return np.column_stack((
+            np.round(np.ravel(lat) / self.degree_step),
+            np.round(np.ravel(lon) / self.degree_step),
+            np.round(np.ravel(h) / self.height_step),
+        )).astype(np.int64)
+
+    def key_point(self, key):
+        """Returns the (lat, lon, h) at the center of a quantized key."""
+        return key[0] * self.degree_step, key[1] * self.degree_step, key[2] * self.height_step
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self.changes += 1
+
+    def save(self):
+        """Writes the cache to its file, atomically replacing the previous one."""
+        if self.path is None or self.changes == self.saved_changes:
+            return
+        with self.lock:
+            data = {
+                "degree_step": self.degree_step,
+                "height_step": self.height_step,
+                "entries": [[list(key), value] for key, value in self.entries.items()],
+            }
+            changes = self.changes
+        directory = os.path.dirname(os.path.abspath(self.path))
+        temporary = temporary_file(directory)
+        try:
+            with open(temporary, "w", encoding="utf-8") as file:
+                json.dump(data, file)
+            keep_mode(self.path, temporary)
+            os.replace(temporary, self.path)
+        except BaseException:
+            os.remove(temporary)
+            raise
+        with self.lock:
+            # Entries put during the write still need a save
+            self.saved_changes = max(self.saved_changes, changes)
+
+
+class GravityProvider:
+    """
+    Resolves gravitational acceleration for arrays of launch points.
+
+    Usage:
+        provider = GravityProvider()  # Analytic normal gravity
+        provider = GravityProvider(NoaaGravityBackend(), cache=GravityCache("gravity_cache.json"))
+        g = provider.gravity(lat, lon, h)
+
+    Parameters:
+    - backend: Optional lookup backend with a lookup_many(points) method. Without one, normal gravity is used.
+    - cache: GravityCache for the backend, an in-memory cache by default.
+    - fallback: Use normal gravity for points the backend fails to resolve instead of raising.
+    """
+
+    def __init__(self, backend=None, cache=None, fallback=True):
+        self.backend = backend
+        self.cache = cache if cache is not None else GravityCache()
+        self.fallback = fallback
+
+    def gravity(self, lat, lon, h=0.0):
+        """
+        Returns the gravity in m/s^2 at every point, broadcast from lat, lon and h.
+
+        Backend lookups are batched: points are deduplicated by their quantized key, cached keys
+        are served from the cache and only the remaining keys are requested, concurrently.
+        """
+        lat, lon, h = np.broadcast_arrays(np.asarray(lat, dtype=float), np.asarray(lon, dtype=float), np.asarray(h, dtype=float))
+        if self.backend is None:
+            return normal_gravity(lat, h)
+
+        keys, inverse = np.unique(self.cache.quantize(lat, lon, h), axis=0, return_inverse=True)
+        keys = [tuple(key) for key in keys.tolist()]
+        values = np.empty(len(keys))
+        missing = []
+        for index, key in enumerate(keys):
+            value = self.cache.get(key)
+            if value is None:
+                missing.append(index)
+            else:
+                values[index] = value
+        if missing:
+            points = [self.cache.key_point(keys[index]) for index in missing]
+            try:
+                resolved = self.backend.lookup_many(points)
+            except (OSError, ValueError):
+                if not self.fallback:
+                    raise
+                resolved = [float(normal_gravity(point[0], point[2])) for point in points]
+            else:
+                for index, value in zip(missing, resolved):
+                    self.cache.put(keys[index], value)
+                self.cache.save()
+            values[missing] = resolved
+        return values[inverse.ravel()].reshape(lat.shape)
+
+    def __call__(self, lat, lon, h=0.0):
+        return self.gravity(lat, lon, h)
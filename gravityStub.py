@@ -0,0 +1,65 @@
+# Description: Local stand-in for the NOAA gravd API.
+# Answers /api/gravd/gp?lat=..&lon=..&eht=.. with WGS84 normal gravity in mGal, so the cached
+# gravity lookups can run offline and in tests without touching the real service.
+
+import json
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from gravity import GRAVITY_FIELD, MGAL, normal_gravity
+
+
+class StubGravityHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+        try:
+            lat, lon, h = (float(query[name][0]) for name in ("lat", "lon", "eht"))
+        except (KeyError, ValueError):
+            self.send_error(400, "lat, lon and eht are required")
+            return
+        self.server.requests += 1
+        # Normal gravity in mGal, the unit of the real API
+        body = json.dumps({"lat": lat, "lon": lon, "eht": h, GRAVITY_FIELD: float(normal_gravity(lat, h)) / MGAL}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubGravityServer:
+    """
+    Local stand-in for the NOAA gravd API answering with normal gravity, for offline runs and tests.
+
+    Usage:
+        with StubGravityServer() as server:
+            provider = gravity.GravityProvider(gravity.NoaaGravityBackend(server.url))
+
+    The number of requests served is available as server.requests.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self.server = ThreadingHTTPServer((host, port), StubGravityHandler)
+        self.server.requests = 0
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/api/gravd/gp"
+
+    @property
+    def requests(self):
+        return self.server.requests
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,217 @@
+# Description: Stage timers and counters for the KML generators.
+# The generators time their stages (physics, timestamp formatting, KML object construction,
+# serialization and disk writes) and count the samples, Placemarks and bytes they write.
+# Instrumentation is off by default: stage() then returns one shared no-op context manager and
+# count() returns after a single attribute check, so the hooks cost well under a microsecond per
+# call and are only placed around whole stages, never inside per-sample loops. Snapshots can be
+# dumped as JSON or in the Prometheus text exposition format, and listeners receive every stage
+# timing as it is recorded.
+#
+# Usage:
+#     with instrumentation.instrumented() as metrics:
+#         simulate_projectile_motion(...)
+#     print(metrics.to_prometheus())
+
+import json
+import re
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager, nullcontext
+
+# Stage names used by the generators. Stages can nest, e.g. "physics" runs inside "write" while
+# streaming, and each stage reports its own inclusive wall time.
+PHYSICS = "physics"  # Trajectory and geometry computation
+FORMAT_TIMES = "format_times"  # Timestamp formatting, strftime or format_kml_times
+BUILD = "build"  # simplekml object construction
+SAVE = "save"  # simplekml serialization and the disk write of save_kml
+WRITE = "write"  # Streaming KmlStreamWriter output, including the stages it drives
+
+# Counter names used by the generators
+SAMPLES = "samples"  # Trajectory samples simulated, once per simulation even when streaming computes them twice
+PLACEMARKS = "placemarks"  # Placemarks written
+BYTES_WRITTEN = "bytes_written"  # Bytes of the output files on disk, after compression
+
+# Accumulated timing of one stage.
+# - calls: number of times the stage ran
+# - seconds: total wall time
+# - max_seconds: longest single run
+StageTiming = namedtuple("StageTiming", ["calls", "seconds", "max_seconds"])
+
+NULL_STAGE = nullcontext()
+
+
+class StageTimer:
+    """Context manager recording the wall time of one run of a stage."""
+
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.metrics.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class Metrics:
+    """
+    Stage timings and counters of a process.
+
+    Parameters:
+    - enabled: Record from the start. Disabled metrics ignore stage() and count().
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.timings = {}  # Stage name -> StageTiming
+        self.counters = {}  # Counter name -> total
+        self.listeners = []  # Functions called with (stage name, seconds) after every stage run
+        self.lock = threading.Lock()
+
+    def stage(self, name):
+        """Returns a context manager timing the stage name, a shared no-op one while disabled."""
+        if not self.enabled:
+            return NULL_STAGE
+        return StageTimer(self, name)
+
+    def timed_iter(self, name, iterable):
+        """
+        Yields the items of iterable, timing every step of it as the stage name, e.g. the chunks of
+        a trajectory computed lazily. Returns iterable itself while disabled.
+        """
+        if not self.enabled:
+            return iterable
+        return self.iter_timed(name, iter(iterable))
+
+    def iter_timed(self, name, iterator):
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.record(name, time.perf_counter() - start)
+                return
+            self.record(name, time.perf_counter() - start)
+            yield item
+
+    def count(self, name, amount=1):
+        """Adds amount to the counter name."""
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def record(self, name, seconds):
+        """Adds one run of seconds to the stage name and notifies the listeners."""
+        with self.lock:
+            calls, total, longest = self.timings.get(name, (0, 0.0, 0.0))
+            self.timings[name] = StageTiming(calls + 1, total + seconds, max(longest, seconds))
+        for listener in self.listeners:
+            listener(name, seconds)
+
+    def add_listener(self, listener):
+        """Calls listener(stage name, seconds) after every stage run, e.g. to feed another metrics client."""
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self.listeners.remove(listener)
+
+    def reset(self):
+        with self.lock:
+            self.timings.clear()
+            self.counters.clear()
+
+    def snapshot(self):
+        """Returns {"stages": {name: {calls, seconds, max_seconds}}, "counters": {name: total}}."""
+        with self.lock:
+            return {
+                "stages": {name: timing._asdict() for name, timing in sorted(self.timings.items())},
+                "counters": dict(sorted(self.counters.items())),
+            }
+
+    def to_json(self, indent=2):
+        return json.dumps(self.snapshot(), indent=indent)
+
+    def to_prometheus(self, prefix="ge_physics"):
+        """Returns the metrics in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = []
+        stage_metrics = (
+            ("stage_seconds_total", "counter", "Wall time spent in each generator stage.", "seconds"),
+            ("stage_calls_total", "counter", "Runs of each generator stage.", "calls"),
+            ("stage_max_seconds", "gauge", "Longest single run of each generator stage.", "max_seconds"),
+        )
+        for suffix, kind, description, field in stage_metrics:
+            if not snapshot["stages"]:
+                break
+            metric = f"{prefix}_{suffix}"
+            lines += [f"# HELP {metric} {description}", f"# TYPE {metric} {kind}"]
+            lines += [f'{metric}{{stage="{name}"}} {timing[field]!r}' for name, timing in snapshot["stages"].items()]
+        for name, total in snapshot["counters"].items():
+            metric = f"{prefix}_{metric_name(name)}_total"
+            lines += [f"# HELP {metric} Total {name.replace('_', ' ')}.", f"# TYPE {metric} counter", f"{metric} {total!r}"]
+        return "\n".join(lines) + "\n"
+
+    def save(self, path):
+        """Writes the metrics to path, in the Prometheus text format for a .prom file and as JSON otherwise."""
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(self.to_prometheus() if str(path).endswith(".prom") else self.to_json())
+
+
+def metric_name(name):
+    """Replaces the characters Prometheus does not allow in metric names with underscores."""
+    return re.sub(r"[^a-zA-Z0-9_:]", "_", name)
+
+
+# Metrics of this process, used by the generators
+METRICS = Metrics()
+
+
+def stage(name):
+    return METRICS.stage(name)
+
+
+def timed_iter(name, iterable):
+    return METRICS.timed_iter(name, iterable)
+
+
+def count(name, amount=1):
+    if METRICS.enabled:
+        METRICS.count(name, amount)
+
+
+def enabled():
+    return METRICS.enabled
+
+
+def enable():
+    METRICS.enabled = True
+
+
+def disable():
+    METRICS.enabled = False
+
+
+@contextmanager
+def instrumented(reset=True):
+    """
+    Enables the process metrics for the duration of a with block and yields them.
+
+    Parameters:
+    - reset: Clear earlier timings and counters first.
+    """
+    previous = METRICS.enabled
+    if reset:
+        METRICS.reset()
+    METRICS.enabled = True
+    try:
+        yield METRICS
+    finally:
+        METRICS.enabled = previous
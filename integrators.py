@@ -0,0 +1,122 @@
+# Description: Numerical ODE integrators for vectorized state arrays.
+# The state can hold any number of bodies at once, e.g. an (N, 6) array of positions and
+# velocities, so one integrator step advances every body together.
+
+import numpy as np
+
+# Dormand-Prince 5(4) coefficients
+DP_C = (0.0, 1 / 5, 3 / 10, 4 / 5, 8 / 9, 1.0, 1.0)
+DP_A = (
+    (),
+    (1 / 5,),
+    (3 / 40, 9 / 40),
+    (44 / 45, -56 / 15, 32 / 9),
+    (19372 / 6561, -25360 / 2187, 64448 / 6561, -212 / 729),
+    (9017 / 3168, -355 / 33, 46732 / 5247, 49 / 176, -5103 / 18656),
+    (35 / 384, 0.0, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84),
+)
+# Fifth order weights are the last row of DP_A, these are the fifth minus fourth order weights
+DP_E = (71 / 57600, 0.0, -71 / 16695, 71 / 1920, -17253 / 339200, 22 / 525, -1 / 40)
+
+
+def rk4_step(f, t, y, dt):
+    """Advances y' = f(t, y) by one classic fourth order Runge-Kutta step."""
+    k1 = f(t, y)
+    k2 = f(t + dt / 2, y + dt / 2 * k1)
+    k3 = f(t + dt / 2, y + dt / 2 * k2)
+    k4 = f(t + dt, y + dt * k3)
+    return y + dt / 6 * (k1 + 2 * k2 + 2 * k3 + k4)
+
+
+def integrate_rk4(f, y0, t0, t1, dt, stop=None):
+    """
+    Integrates y' = f(t, y) with fixed RK4 steps.
+
+    Parameters:
+    - f: Derivative function of (t, y), returning an array shaped like y.
+    - y0: Initial state array.
+    - t0, t1: Time range in seconds.
+    - dt: Step size in seconds, the last step is shortened to end at t1.
+    - stop: Optional function of (t, y) returning True to end the integration early.
+
+    Returns:
+    - (times, states) with times of shape (T,) and states of shape (T,) + y0.shape.
+    """
+    y = np.asarray(y0, dtype=float)
+    t = t0
+    times = [t]
+    states = [y]
+    while t < t1 and not (stop is not None and stop(t, y)):
+        step = min(dt, t1 - t)
+        y = rk4_step(f, t, y, step)
+        t += step
+        times.append(t)
+        states.append(y)
+    return np.array(times), np.stack(states)
+
+
+def rk45_step(f, t, y, dt, k1):
+    """
+    One Dormand-Prince step.
+
+    Returns:
+    - (y_new, error, k_last) where error estimates the local error of every component and
+      k_last is the derivative at the new point, reused as k1 of the next step.
+    """
+    k = [k1]
+    for stage in range(1, 7):
+        increment = sum(a * k_i for a, k_i in zip(DP_A[stage], k))
+        k.append(f(t + DP_C[stage] * dt, y + dt * increment))
+    y_new = y + dt * sum(b * k_i for b, k_i in zip(DP_A[6], k))
+    # k[6] is f at y_new (first same as last), so it becomes k1 of the next step
+    error = dt * sum(e * k_i for e, k_i in zip(DP_E, k))
+    return y_new, error, k[6]
+
+
+def integrate_rk45(f, y0, t0, t1, rtol=1e-6, atol=1e-6, dt=None, max_step=None, max_steps=1000000, stop=None):
+    """
+    Integrates y' = f(t, y) with adaptive Dormand-Prince RK45 steps.
+
+    All bodies in the state share one step size, chosen so that the worst of them meets the
+    tolerances, which keeps every step a single vectorized evaluation over all bodies.
+
+    Parameters:
+    - f: Derivative function of (t, y), returning an array shaped like y.
+    - y0: Initial state array.
+    - t0, t1: Time range in seconds.
+    - rtol, atol: Relative and absolute error tolerances per component.
+    - dt: Optional first step size, (t1 - t0) / 100 by default.
+    - max_step: Optional upper bound on the step size, to keep the output densely sampled.
+    - max_steps: Upper bound on the number of accepted and rejected steps.
+    - stop: Optional function of (t, y) returning True to end the integration early.
+
+    Returns:
+    - (times, states) with times of shape (T,) and states of shape (T,) + y0.shape.
+    """
+    y = np.asarray(y0, dtype=float)
+    t = t0
+    dt = dt or (t1 - t0) / 100
+    times = [t]
+    states = [y]
+    k1 = f(t, y)
+    for _ in range(max_steps):
+        if t >= t1 or (stop is not None and stop(t, y)):
+            break
+        dt = min(dt, t1 - t)
+        y_new, error, k_last = rk45_step(f, t, y, dt, k1)
+        scale = atol + rtol * np.maximum(np.abs(y), np.abs(y_new))
+        error_norm = float(np.max(np.abs(error) / scale)) if error.size else 0.0
+        if error_norm <= 1.0:
+            t += dt
+            y = y_new
+            k1 = k_last
+            times.append(t)
+            states.append(y)
+        # Standard step size controller with safety factor and growth limits
+        factor = 5.0 if error_norm == 0 else min(5.0, max(0.2, 0.9 * error_norm ** -0.2))
+        dt *= factor
+        if max_step is not None:
+            dt = min(dt, max_step)
+    else:
+        raise RuntimeError(f"integrate_rk45 did not reach t1 = {t1} in {max_steps} steps")
+    return np.array(times), np.stack(states)
@@ -0,0 +1,189 @@
+# Description: Output layer for generated KML documents.
+# Writes plain .kml, zipped .kmz or gzip-compressed .kml.gz files, streaming the text
+# through the compressor, and compresses many existing files across a worker pool.
+# atomic_kml_output replaces a file in one step, so readers never see a half-written document.
+
+import gzip
+import io
+import os
+import shutil
+import stat
+import zipfile
+from contextlib import contextmanager
+
+from instrumentation import BYTES_WRITTEN, SAVE, count, enabled, stage
+
+KML = "kml"
+KMZ = "kmz"
+GZIP = "gzip"
+
+EXTENSIONS = {KML: ".kml", KMZ: ".kmz", GZIP: ".kml.gz"}
+
+# Name of the document inside a .kmz archive, Google Earth opens the first .kml entry
+KMZ_DOCUMENT = "doc.kml"
+
+
+def output_format_for(path):
+    """Infers the output format from a file name."""
+    lower = str(path).lower()
+    if lower.endswith(".kmz"):
+        return KMZ
+    if lower.endswith(".gz"):
+        return GZIP
+    return KML
+
+
+def output_path(name, output_format=KML):
+    """Returns the file name for a document called name, e.g. output_path("freefall", "kmz") == "freefall.kmz"."""
+    if output_format not in EXTENSIONS:
+        raise ValueError(f"Unknown output format {output_format!r}, expected one of {sorted(EXTENSIONS)}")
+    return f"{name}{EXTENSIONS[output_format]}"
+
+
+@contextmanager
+def open_kml_output(path, output_format=None, compresslevel=6):
+    """
+    Opens path for writing KML text, compressing on the fly.
+
+    Parameters:
+    - path: File to write.
+    - output_format: "kml", "kmz" or "gzip", inferred from the extension of path by default.
+    - compresslevel: zlib compression level from 1 (fastest) to 9 (smallest).
+
+    Yields:
+    - A text file-like object, usable as the target of a KmlStreamWriter.
+    """
+    output_format = output_format or output_format_for(path)
+    if output_format == KMZ:
+        with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=compresslevel) as archive:
+            with archive.open(KMZ_DOCUMENT, "w") as entry:
+                with io.TextIOWrapper(entry, encoding="utf-8") as text:
+                    yield text
+    elif output_format == GZIP:
+        with gzip.open(path, "wt", encoding="utf-8", compresslevel=compresslevel) as text:
+            yield text
+    elif output_format == KML:
+        with open(path, "w", encoding="utf-8") as text:
+            yield text
+    else:
+        raise ValueError(f"Unknown output format {output_format!r}, expected one of {sorted(EXTENSIONS)}")
+    count_bytes(path)
+
+
+def count_bytes(path):
+    """Adds the size of a written file to the bytes_written counter while instrumentation is enabled."""
+    if enabled():
+        count(BYTES_WRITTEN, os.path.getsize(path))
+
+
+def temporary_file(directory, suffix=".tmp"):
+    """
+    Creates an empty hidden file with a unique name in directory and returns its path.
+
+    Unlike tempfile.mkstemp, which creates its files with mode 0o600, the file gets the mode of
+    any new file, 0o666 minus the umask, applied by the kernel. Reading the umask would mean
+    setting it, which races with other threads creating files.
+    """
+    while True:
+        path = os.path.join(directory, f".{os.urandom(8).hex()}{suffix}")
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666))
+        except FileExistsError:
+            continue
+        return path
+
+
+def keep_mode(path, temporary):
+    """Gives temporary the permission bits of path, if it exists, before temporary replaces it."""
+    try:
+        os.chmod(temporary, stat.S_IMODE(os.stat(path).st_mode))
+    except FileNotFoundError:
+        pass
+
+
+@contextmanager
+def atomic_kml_output(path, output_format=None, compresslevel=6):
+    """
+    Like open_kml_output, but writes to a temporary file next to path and renames it over path
+    once the document is complete. If writing fails the previous file is left untouched.
+    """
+    output_format = output_format or output_format_for(path)
+    directory = os.path.dirname(os.path.abspath(path))
+    temporary = temporary_file(directory, EXTENSIONS.get(output_format, ".tmp"))
+    try:
+        with open_kml_output(temporary, output_format, compresslevel) as text:
+            yield text
+        keep_mode(path, temporary)
+        os.replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+
+def save_kml(kml, path, output_format=None):
+    """
+    Saves a simplekml.Kml document as .kml, .kmz or .kml.gz.
+
+    Parameters:
+    - kml: The simplekml.Kml document.
+    - path: File to write.
+    - output_format: "kml", "kmz" or "gzip", inferred from the extension of path by default.
+    """
+    output_format = output_format or output_format_for(path)
+    with stage(SAVE):
+        if output_format == KML:
+            kml.save(path)
+            count_bytes(path)
+            return
+        with open_kml_output(path, output_format) as text:
+            text.write(kml.kml())
+
+
+def compress_file(path, output_format=KMZ, remove=False, compresslevel=6):
+    """
+    Compresses an existing .kml file next to it and returns the new file name.
+
+    Parameters:
+    - path: The .kml file.
+    - output_format: "kmz" or "gzip".
+    - remove: Delete the uncompressed file afterwards.
+    - compresslevel: zlib compression level from 1 (fastest) to 9 (smallest).
+    """
+    stem = path[:-4] if path.lower().endswith(".kml") else path
+    target = output_path(stem, output_format)
+    if output_format == KMZ:
+        with zipfile.ZipFile(target, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=compresslevel) as archive:
+            archive.write(path, KMZ_DOCUMENT)
+    elif output_format == GZIP:
+        with open(path, "rb") as source, gzip.open(target, "wb", compresslevel=compresslevel) as destination:
+            shutil.copyfileobj(source, destination, 1024 * 1024)
+    else:
+        raise ValueError(f"Cannot compress to {output_format!r}, expected {KMZ!r} or {GZIP!r}")
+    if remove:
+        os.remove(path)
+    return target
+
+
+def compress_files(paths, output_format=KMZ, remove=False, workers=None, compresslevel=6):
+    """
+    Compresses many .kml files in parallel across a process pool.
+
+    Parameters:
+    - paths: The .kml files.
+    - output_format: "kmz" or "gzip".
+    - remove: Delete the uncompressed files afterwards.
+    - workers: Number of worker processes, os.cpu_count() by default. 1 compresses in this process.
+    - compresslevel: zlib compression level from 1 (fastest) to 9 (smallest).
+
+    Returns:
+    - List of the compressed file names, in the order of paths.
+    """
+    paths = list(paths)
+    if workers == 1 or len(paths) < 2:
+        return [compress_file(path, output_format, remove, compresslevel) for path in paths]
+    # Imported here, multiprocessing is slow to import and only needed for parallel runs
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(
+            compress_file, paths, [output_format] * len(paths), [remove] * len(paths), [compresslevel] * len(paths)
+        ))
@@ -0,0 +1,257 @@
+# Description: Streaming reader for generated KML files.
+# Parses .kml, .kmz and .kml.gz documents with xml.etree.ElementTree.iterparse, one Placemark at
+# a time, and discards every element once it is read, so memory does not grow with the size of
+# the file. Coordinates, timestamps and time spans come out as NumPy arrays, ready to re-analyse
+# as a trajectory.Trajectory or to re-export with the KML writers.
+
+import gzip
+import os
+import zipfile
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from xml.etree.ElementTree import iterparse
+
+import numpy as np
+
+from kmlOutput import GZIP, KMZ, KMZ_DOCUMENT, output_format_for
+from trajectory import Trajectory, datetime64_to_seconds
+
+# Elements that stay open while the Placemarks inside them are read
+CONTAINERS = {"kml", "Document", "Folder"}
+
+# Geometry elements, the outermost one inside a Placemark names its geometry
+GEOMETRIES = {"Point", "LineString", "LinearRing", "Polygon", "MultiGeometry", "Track", "MultiTrack", "Model"}
+
+NAT = np.datetime64("NaT", "us")
+
+# Number of gx:Track samples buffered as text before they are parsed into arrays
+TRACK_BLOCK = 4096
+
+# One Placemark.
+# - name: Placemark name, "" without one
+# - geometry: outermost geometry element, e.g. "Point", "LineString", "Polygon" or "Track", None without geometry
+# - coords: (N, 3) float64 array of lon, lat, h of all its coordinates in document order
+# - when: datetime64[us] array of N timestamps: the <when> of each gx:Track sample, the TimeStamp
+#   of the Placemark repeated, or NaT
+# - begin, end: datetime64[us] TimeSpan of the Placemark, NaT if absent
+Placemark = namedtuple("Placemark", ["name", "geometry", "coords", "when", "begin", "end"])
+
+# All Placemarks of a document in columnar arrays. The coordinates of Placemark i are
+# lon[offsets[i]:offsets[i + 1]] and so on.
+# - name, geometry: lists with one entry per Placemark
+# - begin, end: datetime64[us] arrays with one entry per Placemark
+# - offsets: int64 array of length Placemarks + 1
+# - lon, lat, h, when: arrays with one entry per coordinate
+KmlDocument = namedtuple("KmlDocument", ["name", "geometry", "begin", "end", "offsets", "lon", "lat", "h", "when"])
+
+
+def local_name(tag):
+    """Strips the namespace, e.g. "{http://www.google.com/kml/ext/2.2}Track" becomes "Track"."""
+    return tag.rpartition("}")[2]
+
+
+def parse_coordinates(text):
+    """Parses the text of a <coordinates> element into an (N, 3) array, with h = 0 where it is missing."""
+    tuples = text.split()
+    if not tuples:
+        return np.empty((0, 3))
+    dimension = tuples[0].count(",") + 1
+    values = np.array(",".join(tuples).split(","), dtype=np.float64)
+    if values.size != dimension * len(tuples):
+        # Mixed 2D and 3D tuples, parsed one by one
+        return np.array([(list(map(float, item.split(","))) + [0.0])[:3] for item in tuples])
+    values = values.reshape(-1, dimension)
+    if dimension == 3:
+        return values
+    coords = np.zeros((len(tuples), 3))
+    coords[:, :min(dimension, 3)] = values[:, :3]
+    return coords
+
+
+def parse_times(values):
+    """
+    Parses KML time strings (dateTime, date, gYearMonth or gYear) into datetime64[us], in UTC.
+    Times with a UTC offset are converted to UTC.
+    """
+    stripped = [value.strip().removesuffix("Z") for value in values]
+    try:
+        return np.array(stripped, dtype="datetime64[us]")
+    except ValueError:
+        return np.array([parse_time(value) for value in values], dtype="datetime64[us]")
+
+
+def parse_time(value):
+    value = value.strip()
+    try:
+        return np.datetime64(value.removesuffix("Z"), "us")
+    except ValueError:
+        parsed = datetime.fromisoformat(value)
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+        return np.datetime64(parsed, "us")
+
+
+@contextmanager
+def open_kml_input(path):
+    """Opens a .kml, .kmz or .kml.gz file for binary reading, the KML document of a .kmz archive."""
+    input_format = output_format_for(path)
+    if input_format == KMZ:
+        with zipfile.ZipFile(path) as archive:
+            names = archive.namelist()
+            document = KMZ_DOCUMENT if KMZ_DOCUMENT in names else next(name for name in names if name.lower().endswith(".kml"))
+            with archive.open(document) as file:
+                yield file
+    elif input_format == GZIP:
+        with gzip.open(path, "rb") as file:
+            yield file
+    else:
+        with open(path, "rb") as file:
+            yield file
+
+
+def iter_placemarks(source):
+    """
+    Yields the Placemarks of a KML document in document order.
+
+    Parameters:
+    - source: Path of a .kml, .kmz or .kml.gz file, or a binary file object of KML.
+
+    Elements are removed from the tree as soon as they are read, so a document of any size
+    is parsed in constant memory.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open_kml_input(source) as file:
+            yield from iter_placemarks(file)
+        return
+
+    stack = []  # (tag, element) of the open elements
+    placemark = None
+    for event, element in iterparse(source, events=("start", "end")):
+        tag = local_name(element.tag)
+        if event == "start":
+            stack.append((tag, element))
+            if tag == "Placemark":
+                placemark = {"name": "", "geometry": None, "coords": [], "track_coords": [], "track_when": [],
+                             "when": [], "timestamp": None, "begin": NAT, "end": NAT}
+            elif placemark is not None and placemark["geometry"] is None and tag in GEOMETRIES:
+                placemark["geometry"] = tag
+            continue
+
+        stack.pop()
+        parent, parent_element = stack[-1] if stack else (None, None)
+        if placemark is not None:
+            text = element.text or ""
+            if tag == "coordinates":
+                placemark["coords"].append(parse_coordinates(text))
+            elif tag == "coord":  # gx:coord of a gx:Track, "lon lat h"
+                placemark["track_coords"].append(",".join(text.split()))
+                if len(placemark["track_coords"]) >= TRACK_BLOCK:
+                    flush_track(placemark)
+            elif tag == "when":
+                if parent == "Track":
+                    placemark["track_when"].append(text)
+                    if len(placemark["track_when"]) >= TRACK_BLOCK:
+                        flush_track(placemark)
+                elif parent == "TimeStamp":
+                    placemark["timestamp"] = parse_time(text)
+            elif tag in ("begin", "end") and parent == "TimeSpan":
+                placemark[tag] = parse_time(text)
+            elif tag == "name" and parent == "Placemark":
+                placemark["name"] = text.strip()
+            elif tag == "Placemark":
+                yield build_placemark(placemark)
+                placemark = None
+        if tag not in CONTAINERS:
+            # Read elements are emptied, and detached from the containers that stay open, so
+            # neither they nor their children accumulate
+            element.clear()
+            if parent in CONTAINERS:
+                parent_element.remove(element)
+
+
+def flush_track(placemark):
+    """Parses the buffered gx:Track text into array blocks."""
+    if placemark["track_coords"]:
+        placemark["coords"].append(parse_coordinates(" ".join(placemark["track_coords"])))
+        placemark["track_coords"] = []
+    if placemark["track_when"]:
+        placemark["when"].append(parse_times(placemark["track_when"]))
+        placemark["track_when"] = []
+
+
+def build_placemark(placemark):
+    flush_track(placemark)
+    coords = np.concatenate(placemark["coords"]) if placemark["coords"] else np.empty((0, 3))
+    if placemark["when"]:
+        when = np.concatenate(placemark["when"])
+        if when.size != len(coords):
+            raise ValueError(f"gx:Track {placemark['name']!r} has {when.size} <when> and {len(coords)} <gx:coord> elements")
+    else:
+        timestamp = placemark["timestamp"] if placemark["timestamp"] is not None else NAT
+        when = np.full(len(coords), timestamp, dtype="datetime64[us]")
+    return Placemark(placemark["name"], placemark["geometry"], coords, when, placemark["begin"], placemark["end"])
+
+
+def read_kml(source):
+    """
+    Reads all Placemarks of a KML document into one KmlDocument of columnar arrays.
+
+    Parameters:
+    - source: Path of a .kml, .kmz or .kml.gz file, or a binary file object of KML.
+    """
+    names, geometries, begins, ends, counts, coords, whens = [], [], [], [], [0], [], []
+    for placemark in iter_placemarks(source):
+        names.append(placemark.name)
+        geometries.append(placemark.geometry)
+        begins.append(placemark.begin)
+        ends.append(placemark.end)
+        counts.append(len(placemark.coords))
+        coords.append(placemark.coords)
+        whens.append(placemark.when)
+    coords = np.concatenate(coords) if coords else np.empty((0, 3))
+    return KmlDocument(
+        name=names,
+        geometry=geometries,
+        begin=np.array(begins, dtype="datetime64[us]"),
+        end=np.array(ends, dtype="datetime64[us]"),
+        offsets=np.cumsum(counts, dtype=np.int64),
+        lon=np.ascontiguousarray(coords[:, 0]),
+        lat=np.ascontiguousarray(coords[:, 1]),
+        h=np.ascontiguousarray(coords[:, 2]),
+        when=np.concatenate(whens) if whens else np.array([], dtype="datetime64[us]"),
+    )
+
+
+def timed_trajectory(document):
+    """
+    Returns the timestamped coordinates of a KmlDocument as a trajectory.Trajectory sorted by time,
+    e.g. the points of simulate_projectile_motion or the samples of a gx:Track. Untimed geometry,
+    like the path LineString, is left out.
+    """
+    timed = ~np.isnat(document.when)
+    order = np.argsort(document.when[timed], kind="stable")
+    return Trajectory.from_columns(
+        datetime64_to_seconds(document.when[timed][order]),
+        document.lon[timed][order], document.lat[timed][order], document.h[timed][order],
+    )
+
+
+def read_many(paths, workers=None):
+    """
+    Reads many KML files in parallel across a process pool.
+
+    Parameters:
+    - paths: Paths of .kml, .kmz or .kml.gz files.
+    - workers: Number of worker processes, os.cpu_count() by default. 1 reads in this process.
+
+    Returns:
+    - List of KmlDocument, in the order of paths.
+    """
+    paths = list(paths)
+    if workers == 1 or len(paths) < 2:
+        return [read_kml(path) for path in paths]
+    # Imported here, multiprocessing is slow to import and only needed for parallel runs
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(read_kml, paths))
@@ -0,0 +1,60 @@
+# Description: Shared, content-deduplicated styles for simplekml documents.
+# Placemarks that look the same reference one <Style> through styleUrl instead of
+# each carrying its own copy.
+
+import weakref
+
+from lazyImport import lazy_import
+
+simplekml = lazy_import("simplekml")
+
+# One {style key: simplekml.Style} dictionary per document, dropped with the document
+_document_styles = weakref.WeakKeyDictionary()
+
+
+def style_key(label_scale=None, icon_href=None, icon_scale=None, line_color=None, line_width=None,
+              poly_color=None, poly_fill=None, poly_outline=None):
+    """Returns the hashable content of a style, used to deduplicate it."""
+    return (label_scale, icon_href, icon_scale, line_color, line_width, poly_color, poly_fill, poly_outline)
+
+
+def build_style(label_scale=None, icon_href=None, icon_scale=None, line_color=None, line_width=None,
+                poly_color=None, poly_fill=None, poly_outline=None):
+    """Builds a simplekml.Style with only the given properties set."""
+    style = simplekml.Style()
+    if label_scale is not None:
+        style.labelstyle.scale = label_scale
+    if icon_href is not None:
+        style.iconstyle.icon.href = icon_href
+    if icon_scale is not None:
+        style.iconstyle.scale = icon_scale
+    if line_color is not None:
+        style.linestyle.color = line_color
+    if line_width is not None:
+        style.linestyle.width = line_width
+    if poly_color is not None:
+        style.polystyle.color = poly_color
+    if poly_fill is not None:
+        style.polystyle.fill = poly_fill
+    if poly_outline is not None:
+        style.polystyle.outline = poly_outline
+    return style
+
+
+def shared_style(kml, **properties):
+    """
+    Returns the style of kml with the given content, creating it on first use.
+
+    Assign the result to feature.style; simplekml then writes the <Style> once and
+    every feature using it refers to it with styleUrl.
+
+    Parameters:
+    - kml: The simplekml.Kml document the style belongs to.
+    - properties: label_scale, icon_href, icon_scale, line_color, line_width, poly_color, poly_fill, poly_outline.
+    """
+    styles = _document_styles.setdefault(kml, {})
+    key = style_key(**properties)
+    style = styles.get(key)
+    if style is None:
+        style = styles[key] = build_style(**properties)
+    return style
@@ -0,0 +1,344 @@
+# Description: Streaming KML writer.
+# Writes Placemarks straight to a file or file-like object as they are produced, instead of
+# building a simplekml object tree and serializing it at the end. The document layout
+# follows what simplekml produces (Document > Style / Placemark > TimeStamp/TimeSpan, styleUrl, geometry).
+
+from collections import namedtuple
+from html import escape as html_escape
+
+from instrumentation import PLACEMARKS, count
+
+KML_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<kml xmlns="http://www.opengis.net/kml/2.2" xmlns:gx="http://www.google.com/kml/ext/2.2">\n'
+)
+KML_FOOTER = "</kml>\n"
+INDENT = "    "
+
+# Altitude modes
+RELATIVE_TO_GROUND = "relativeToGround"
+CLAMP_TO_GROUND = "clampToGround"
+ABSOLUTE = "absolute"
+
+# Colors in KML aabbggrr notation, same values as simplekml.Color
+RED = "ff0000ff"
+GREEN = "ff008000"
+BLUE = "ffff0000"
+
+# KML Region: a bounding box in degrees, and the range of its projected size in pixels within which
+# the features of its Folder or NetworkLink are shown. max_lod_pixels = -1 means no upper limit.
+Region = namedtuple("Region", ["north", "south", "east", "west", "min_lod_pixels", "max_lod_pixels"], defaults=[0, -1])
+
+
+def escape(text):
+    """Escapes &, < and > like xml.sax.saxutils.escape, which is slow to import."""
+    return html_escape(text, quote=False)
+
+
+def with_alpha(alpha, color):
+    """Returns the color with its alpha channel replaced by an integer from 0 to 255."""
+    return f"{alpha:02x}{color[2:]}"
+
+
+def format_coords(coords, separator=","):
+    """Formats (lon, lat, h) tuples the way simplekml does."""
+    return " ".join(separator.join(str(value) for value in coord) for coord in coords)
+
+
+class KmlStreamWriter:
+    """
+    Incremental KML writer with bounded memory.
+
+    Usage:
+        with KmlStreamWriter("track.kml") as writer:
+            writer.point((lon, lat, h), name="A", when="2024-01-01T00:00:00Z")
+
+    Parameters:
+    - target: File path, or an open text file-like object (it is not closed by the writer).
+    - chunk_size: Number of coordinates formatted per write call for long geometries.
+    - document_id: Optional fixed id of the Document element, numbered like the other elements by default.
+    """
+
+    def __init__(self, target, chunk_size=4096, document_id=None):
+        if hasattr(target, "write"):
+            self.file = target
+            self.owns_file = False
+        else:
+            self.file = open(target, "w", encoding="utf-8")
+            self.owns_file = True
+        self.chunk_size = chunk_size
+        self.next_id = 1
+        self.placemarks = 0
+        self.styles = {}  # Style content -> id, so identical styles are written once
+        self.nesting = 0  # Open Folders, indent everything inside them
+        self.closed = False
+        self.file.write(KML_HEADER)
+        self.document_id = document_id or self.new_id()
+        self.file.write(f'{INDENT}<Document id="{escape(self.document_id)}">\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def new_id(self):
+        """Returns the next element id, numbered like simplekml."""
+        element_id = str(self.next_id)
+        self.next_id += 1
+        return element_id
+
+    def close(self):
+        """Finishes the document and closes the file if the writer opened it."""
+        if self.closed:
+            return
+        self.closed = True
+        while self.nesting:
+            self.end_folder()
+        self.file.write(f"{INDENT}</Document>\n")
+        self.file.write(KML_FOOTER)
+        if self.owns_file:
+            self.file.close()
+        count(PLACEMARKS, self.placemarks)
+
+    def write_lines(self, depth, *lines):
+        indent = INDENT * (depth + self.nesting)
+        self.file.write("".join(f"{indent}{line}\n" for line in lines))
+
+    def region_lines(self, region):
+        return [
+            "<Region>",
+            f"{INDENT}<LatLonAltBox>",
+            f"{INDENT * 2}<north>{region.north}</north>",
+            f"{INDENT * 2}<south>{region.south}</south>",
+            f"{INDENT * 2}<east>{region.east}</east>",
+            f"{INDENT * 2}<west>{region.west}</west>",
+            f"{INDENT}</LatLonAltBox>",
+            f"{INDENT}<Lod>",
+            f"{INDENT * 2}<minLodPixels>{region.min_lod_pixels}</minLodPixels>",
+            f"{INDENT * 2}<maxLodPixels>{region.max_lod_pixels}</maxLodPixels>",
+            f"{INDENT}</Lod>",
+            "</Region>",
+        ]
+
+    def begin_folder(self, name=None, region=None):
+        """
+        Opens a Folder, closed by end_folder. With a Region, viewers only show its content while the
+        region is in view and its projected size is within the Lod range.
+        """
+        lines = [f'<Folder id="{self.new_id()}">']
+        if name is not None:
+            lines.append(f"{INDENT}<name>{escape(str(name))}</name>")
+        if region is not None:
+            lines += [INDENT + line for line in self.region_lines(region)]
+        self.write_lines(2, *lines)
+        self.nesting += 1
+
+    def end_folder(self):
+        self.nesting -= 1
+        self.write_lines(2, "</Folder>")
+
+    def network_link(self, href, name=None, region=None, begin=None, end=None):
+        """
+        Writes a NetworkLink to another KML file. With a Region the file is only fetched once the
+        region is in view and large enough on screen (viewRefreshMode onRegion), with a time span
+        it is hidden outside of it.
+        """
+        lines = [f'<NetworkLink id="{self.new_id()}">']
+        if name is not None:
+            lines.append(f"{INDENT}<name>{escape(str(name))}</name>")
+        if begin is not None or end is not None:
+            lines.append(f"{INDENT}<TimeSpan>")
+            if begin is not None:
+                lines.append(f"{INDENT * 2}<begin>{begin}</begin>")
+            if end is not None:
+                lines.append(f"{INDENT * 2}<end>{end}</end>")
+            lines.append(f"{INDENT}</TimeSpan>")
+        if region is not None:
+            lines += [INDENT + line for line in self.region_lines(region)]
+        lines += [f"{INDENT}<Link>", f"{INDENT * 2}<href>{escape(href)}</href>"]
+        if region is not None:
+            lines.append(f"{INDENT * 2}<viewRefreshMode>onRegion</viewRefreshMode>")
+        lines += [f"{INDENT}</Link>", "</NetworkLink>"]
+        self.write_lines(2, *lines)
+
+    def style(self, label_scale=None, icon_href=None, icon_scale=None, line_color=None, line_width=None,
+              poly_color=None, poly_fill=None, poly_outline=None):
+        """
+        Returns the id of the style with the given content for use as style_id of a placemark.
+        The Style element is written the first time the content is seen and reused afterwards.
+        """
+        key = (label_scale, icon_href, icon_scale, line_color, line_width, poly_color, poly_fill, poly_outline)
+        if key in self.styles:
+            return self.styles[key]
+        style_id = self.styles[key] = self.new_id()
+        lines = [f'<Style id="{style_id}">']
+        if icon_href is not None or icon_scale is not None:
+            lines.append(f"{INDENT}<IconStyle>")
+            lines.append(f"{INDENT * 2}<colorMode>normal</colorMode>")
+            if icon_scale is not None:
+                lines.append(f"{INDENT * 2}<scale>{icon_scale}</scale>")
+            lines.append(f"{INDENT * 2}<heading>0</heading>")
+            if icon_href is not None:
+                lines.append(f"{INDENT * 2}<Icon>")
+                lines.append(f"{INDENT * 3}<href>{escape(icon_href)}</href>")
+                lines.append(f"{INDENT * 2}</Icon>")
+            lines.append(f"{INDENT}</IconStyle>")
+        if label_scale is not None:
+            lines.append(f"{INDENT}<LabelStyle>")
+            lines.append(f"{INDENT * 2}<colorMode>normal</colorMode>")
+            lines.append(f"{INDENT * 2}<scale>{label_scale}</scale>")
+            lines.append(f"{INDENT}</LabelStyle>")
+        if line_color is not None or line_width is not None:
+            lines.append(f"{INDENT}<LineStyle>")
+            if line_color is not None:
+                lines.append(f"{INDENT * 2}<color>{line_color}</color>")
+            lines.append(f"{INDENT * 2}<colorMode>normal</colorMode>")
+            if line_width is not None:
+                lines.append(f"{INDENT * 2}<width>{line_width}</width>")
+            lines.append(f"{INDENT}</LineStyle>")
+        if poly_color is not None or poly_fill is not None or poly_outline is not None:
+            lines.append(f"{INDENT}<PolyStyle>")
+            if poly_color is not None:
+                lines.append(f"{INDENT * 2}<color>{poly_color}</color>")
+            lines.append(f"{INDENT * 2}<colorMode>normal</colorMode>")
+            if poly_fill is not None:
+                lines.append(f"{INDENT * 2}<fill>{poly_fill}</fill>")
+            if poly_outline is not None:
+                lines.append(f"{INDENT * 2}<outline>{poly_outline}</outline>")
+            lines.append(f"{INDENT}</PolyStyle>")
+        lines.append("</Style>")
+        self.write_lines(2, *lines)
+        return style_id
+
+    def begin_placemark(self, name=None, when=None, begin=None, end=None, style_id=None, placemark_id=None):
+        """
+        Opens a Placemark with its name, time primitive and style reference.
+        placemark_id gives the Placemark a fixed id, e.g. to target it from a KML Update.
+        """
+        self.placemarks += 1
+        lines = [f'<Placemark id="{escape(placemark_id or self.new_id())}">']
+        if name is not None:
+            lines.append(f"{INDENT}<name>{escape(str(name))}</name>")
+        if when is not None:
+            lines += [f"{INDENT}<TimeStamp>", f"{INDENT * 2}<when>{when}</when>", f"{INDENT}</TimeStamp>"]
+        elif begin is not None or end is not None:
+            lines.append(f"{INDENT}<TimeSpan>")
+            if begin is not None:
+                lines.append(f"{INDENT * 2}<begin>{begin}</begin>")
+            if end is not None:
+                lines.append(f"{INDENT * 2}<end>{end}</end>")
+            lines.append(f"{INDENT}</TimeSpan>")
+        if style_id is not None:
+            lines.append(f"{INDENT}<styleUrl>#{style_id}</styleUrl>")
+        self.write_lines(2, *lines)
+
+    def end_placemark(self):
+        self.write_lines(2, "</Placemark>")
+
+    def write_coordinates(self, depth, coords):
+        """Writes a <coordinates> element, formatting the iterable chunk by chunk."""
+        self.file.write(f"{INDENT * (depth + self.nesting)}<coordinates>")
+        chunk = []
+        first = True
+        for coord in coords:
+            chunk.append(coord)
+            if len(chunk) >= self.chunk_size:
+                self.file.write(("" if first else " ") + format_coords(chunk))
+                first = False
+                chunk = []
+        if chunk:
+            self.file.write(("" if first else " ") + format_coords(chunk))
+        self.file.write("</coordinates>\n")
+
+    def point(self, coords, name=None, when=None, begin=None, end=None, style_id=None, altitudemode=None):
+        """Writes a Placemark with a Point at coords = (lon, lat, h)."""
+        self.begin_placemark(name, when, begin, end, style_id)
+        self.write_lines(3, f'<Point id="{self.new_id()}">')
+        self.write_coordinates(4, [coords])
+        if altitudemode is not None:
+            self.write_lines(4, f"<altitudeMode>{altitudemode}</altitudeMode>")
+        self.write_lines(3, "</Point>")
+        self.end_placemark()
+
+    def linestring(self, coords, name=None, when=None, begin=None, end=None, style_id=None, altitudemode=None,
+                   placemark_id=None, geometry_id=None):
+        """
+        Writes a Placemark with a LineString. coords may be any iterable, including a generator.
+        placemark_id and geometry_id give the Placemark and the LineString fixed ids.
+        """
+        self.begin_placemark(name, when, begin, end, style_id, placemark_id)
+        self.write_lines(3, f'<LineString id="{escape(geometry_id or self.new_id())}">')
+        if altitudemode is not None:
+            self.write_lines(4, f"<altitudeMode>{altitudemode}</altitudeMode>")
+        self.write_coordinates(4, coords)
+        self.write_lines(3, "</LineString>")
+        self.end_placemark()
+
+    def multi_linestring(self, lines, name=None, when=None, begin=None, end=None, style_id=None, altitudemode=None):
+        """
+        Writes a single Placemark with a MultiGeometry of LineStrings, one per coordinate iterable of lines.
+        Many lines in one Placemark load and render much faster than one Placemark each.
+        """
+        self.begin_placemark(name, when, begin, end, style_id)
+        self.write_lines(3, f'<MultiGeometry id="{self.new_id()}">')
+        for coords in lines:
+            self.write_lines(4, f'<LineString id="{self.new_id()}">')
+            if altitudemode is not None:
+                self.write_lines(5, f"<altitudeMode>{altitudemode}</altitudeMode>")
+            self.write_coordinates(5, coords)
+            self.write_lines(4, "</LineString>")
+        self.write_lines(3, "</MultiGeometry>")
+        self.end_placemark()
+
+    def polygon(self, coords, name=None, when=None, begin=None, end=None, style_id=None, altitudemode=None, extrude=None):
+        """Writes a Placemark with a Polygon whose outer boundary is coords."""
+        self.begin_placemark(name, when, begin, end, style_id)
+        self.write_lines(3, f'<Polygon id="{self.new_id()}">')
+        if extrude is not None:
+            self.write_lines(4, f"<extrude>{extrude}</extrude>")
+        if altitudemode is not None:
+            self.write_lines(4, f"<altitudeMode>{altitudemode}</altitudeMode>")
+        self.write_lines(4, "<outerBoundaryIs>", f'{INDENT}<LinearRing id="{self.new_id()}">')
+        self.write_coordinates(6, coords)
+        self.write_lines(4, f"{INDENT}</LinearRing>", "</outerBoundaryIs>")
+        self.write_lines(3, "</Polygon>")
+        self.end_placemark()
+
+    def write_track(self, depth, whens, coords, altitudemode=None):
+        """Writes a gx:Track element, consuming the whens and then the coords iterable."""
+        self.write_lines(depth, "<gx:Track>")
+        if altitudemode is not None:
+            self.write_lines(depth + 1, f"<altitudeMode>{altitudemode}</altitudeMode>")
+        prefix = INDENT * (depth + 1 + self.nesting)
+        chunk = []
+        for when in whens:
+            chunk.append(f"{prefix}<when>{when}</when>\n")
+            if len(chunk) >= self.chunk_size:
+                self.file.write("".join(chunk))
+                chunk = []
+        for coord in coords:
+            chunk.append(f"{prefix}<gx:coord>{format_coords([coord], ' ')}</gx:coord>\n")
+            if len(chunk) >= self.chunk_size:
+                self.file.write("".join(chunk))
+                chunk = []
+        self.file.write("".join(chunk))
+        self.write_lines(depth, "</gx:Track>")
+
+    def track(self, whens, coords, name=None, style_id=None, altitudemode=None):
+        """
+        Writes a Placemark with a single gx:Track, the parallel <when>/<gx:coord> form of a time-stamped path.
+        whens and coords may be generators; all whens are written before the first coordinate.
+        """
+        self.begin_placemark(name, style_id=style_id)
+        self.write_track(3, whens, coords, altitudemode)
+        self.end_placemark()
+
+    def multitrack(self, tracks, name=None, style_id=None, altitudemode=None):
+        """Writes a Placemark with a gx:MultiTrack made of (whens, coords) pairs."""
+        self.begin_placemark(name, style_id=style_id)
+        self.write_lines(3, f'<gx:MultiTrack id="{self.new_id()}">')
+        for whens, coords in tracks:
+            self.write_track(4, whens, coords, altitudemode)
+        self.write_lines(3, "</gx:MultiTrack>")
+        self.end_placemark()
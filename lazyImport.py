@@ -0,0 +1,33 @@
+# Description: Lazy module imports.
+# The module is created at import time but only executed on first attribute access, so heavy
+# dependencies like simplekml cost nothing for callers that never use them.
+
+import importlib.util
+import sys
+
+
+def lazy_import(name):
+    """
+    Returns the module called name, executed the first time one of its attributes is used.
+
+    Usage:
+        simplekml = lazy_import("simplekml")
+        kml = simplekml.Kml()  # simplekml is loaded here
+
+    Raises ModuleNotFoundError right away if the module is not installed.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    parent, _, child = name.rpartition(".")
+    if parent:
+        # Like a regular import, so "import urllib.request" elsewhere finds urllib.request
+        setattr(sys.modules[parent], child, module)
+    return module
@@ -0,0 +1,277 @@
+# Description: Live-updating KML output for Google Earth.
+# LiveUpdateService regenerates a set of LineString features on a schedule or when input files
+# change, on an asyncio event loop instead of a blocking sleep loop. Every file is replaced
+# atomically, and a NetworkLink document lets viewers poll a small KML Update that changes the
+# coordinates of the features they already loaded instead of reloading the whole document.
+# An optional HTTP server answers repeated polls of unchanged files with 304 Not Modified.
+
+import asyncio
+import os
+import time
+from collections import namedtuple
+from email.utils import formatdate
+
+from kmlOutput import atomic_kml_output, output_path
+from kmlWriter import INDENT, KML_FOOTER, KML_HEADER, RELATIVE_TO_GROUND, KmlStreamWriter, escape, format_coords
+
+# One generated LineString.
+# - feature_id: stable id, the Placemark gets this id and its LineString f"{feature_id}-line"
+# - name: Placemark name
+# - coords: list of (lon, lat, h) tuples
+LiveFeature = namedtuple("LiveFeature", ["feature_id", "name", "coords"])
+
+DOCUMENT_ID = "live"
+DEFAULT_STYLE = {"label_scale": 0.6, "icon_href": "http://maps.google.com/mapfiles/kml/shapes/donut.png", "icon_scale": 0.5}
+
+CONTENT_TYPES = {".kml": "application/vnd.google-earth.kml+xml", ".kmz": "application/vnd.google-earth.kmz",
+                 ".gz": "application/gzip"}
+
+
+def geometry_id(feature_id):
+    return f"{feature_id}-line"
+
+
+def write_features(path, features, style=None, output_format=None):
+    """Atomically writes a full document with one LineString Placemark per LiveFeature."""
+    with atomic_kml_output(path, output_format) as output, KmlStreamWriter(output, document_id=DOCUMENT_ID) as writer:
+        style_id = writer.style(**(style or DEFAULT_STYLE))
+        for feature in features:
+            writer.linestring(feature.coords, name=feature.name, style_id=style_id, altitudemode=RELATIVE_TO_GROUND,
+                              placemark_id=feature.feature_id, geometry_id=geometry_id(feature.feature_id))
+
+
+def write_update(path, target_href, features):
+    """
+    Atomically writes a NetworkLinkControl Update that sets the coordinates of the given features
+    in the document loaded from target_href. The coordinates are absolute, so applying the same
+    update twice, or skipping an older one, leaves the viewer in the right state.
+    """
+    with atomic_kml_output(path) as output:
+        output.write(KML_HEADER)
+        output.write(f"{INDENT}<NetworkLinkControl>\n{INDENT * 2}<Update>\n")
+        output.write(f"{INDENT * 3}<targetHref>{escape(target_href)}</targetHref>\n")
+        for feature in features:
+            output.write(
+                f'{INDENT * 3}<Change>\n'
+                f'{INDENT * 4}<LineString targetId="{escape(geometry_id(feature.feature_id))}">\n'
+                f'{INDENT * 5}<coordinates>{format_coords(feature.coords)}</coordinates>\n'
+                f'{INDENT * 4}</LineString>\n'
+                f'{INDENT * 3}</Change>\n'
+            )
+        output.write(f"{INDENT * 2}</Update>\n{INDENT}</NetworkLinkControl>\n")
+        output.write(KML_FOOTER)
+
+
+def write_network_link(path, name, links):
+    """
+    Writes a document of NetworkLinks.
+
+    Parameters:
+    - path: File to write.
+    - name: Document name.
+    - links: List of (name, href, refresh_mode, refresh_interval) with refresh_mode "onChange",
+      "onInterval" or "onExpire" and refresh_interval in seconds (ignored unless "onInterval").
+    """
+    with atomic_kml_output(path) as output:
+        output.write(KML_HEADER)
+        output.write(f"{INDENT}<Document>\n{INDENT * 2}<name>{escape(name)}</name>\n")
+        for link_name, href, refresh_mode, refresh_interval in links:
+            output.write(f"{INDENT * 2}<NetworkLink>\n{INDENT * 3}<name>{escape(link_name)}</name>\n")
+            output.write(f"{INDENT * 3}<Link>\n{INDENT * 4}<href>{escape(href)}</href>\n")
+            output.write(f"{INDENT * 4}<refreshMode>{refresh_mode}</refreshMode>\n")
+            if refresh_mode == "onInterval":
+                output.write(f"{INDENT * 4}<refreshInterval>{refresh_interval}</refreshInterval>\n")
+            output.write(f"{INDENT * 3}</Link>\n{INDENT * 2}</NetworkLink>\n")
+        output.write(f"{INDENT}</Document>\n")
+        output.write(KML_FOOTER)
+
+
+class LiveUpdateService:
+    """
+    Regenerates live KML output without blocking the event loop.
+
+    Files written in directory, all replaced atomically:
+    - {name}.kml: the latest full document, for readers that open the file directly.
+    - {name}_base.kml: the document NetworkLink viewers load, rewritten only when the set of
+      features changes or every resync_interval seconds.
+    - {name}_update.kml: a KML Update with the coordinates of every feature that differs from the base.
+    - {name}_link.kml: the NetworkLinks to open in Google Earth, loading the base and polling the update.
+
+    Usage:
+        service = LiveUpdateService(generate, "vector_operations", interval=1.0)
+        asyncio.run(service.run())
+
+    Parameters:
+    - generate: Function returning a list of LiveFeature. It runs in a worker thread so the event
+      loop, and the HTTP server, stay responsive while it computes.
+    - name: Base name of the output files.
+    - directory: Output directory.
+    - interval: Seconds between regenerations, or None to regenerate only when a watched file changes.
+    - watch: Paths of input files, a change of their modification time triggers a regeneration.
+    - poll_interval: Seconds between checks of the watched files.
+    - resync_interval: Seconds after which the base document is rewritten even if no feature was added or removed.
+    - base_url: URL prefix of the hrefs in the NetworkLink document, e.g. the address of serve().
+      Relative file names by default.
+    - style: Style properties of the LineStrings, as KmlStreamWriter.style keyword arguments.
+    """
+
+    def __init__(self, generate, name, directory=".", interval=1.0, watch=(), poll_interval=0.5,
+                 resync_interval=60.0, base_url="", style=None):
+        if interval is None and not watch:
+            raise ValueError("LiveUpdateService needs an interval, files to watch, or both")
+        self.generate = generate
+        self.name = name
+        self.directory = directory
+        self.interval = interval
+        self.watch = list(watch)
+        self.poll_interval = poll_interval
+        self.resync_interval = resync_interval
+        self.base_url = base_url
+        self.style = style
+        self.features = None  # Latest generation
+        self.base = None  # Feature id -> coords of the base document
+        self.previous_base = None  # The base document before the last rebase
+        self.base_time = 0.0
+        self.generations = 0
+        self.stopped = None
+
+    def path(self, suffix=""):
+        return os.path.join(self.directory, output_path(f"{self.name}{suffix}"))
+
+    def watched_state(self):
+        state = []
+        for path in self.watch:
+            try:
+                stat = os.stat(path)
+                state.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                state.append(None)
+        return state
+
+    def publish(self, features):
+        """Writes the output files for a new generation of features. Returns False if nothing changed."""
+        if features == self.features:
+            return False
+        self.features = features
+        self.generations += 1
+        write_features(self.path(), features, self.style)
+
+        now = time.monotonic()
+        ids = [feature.feature_id for feature in features]
+        if self.base is None or list(self.base) != ids or now - self.base_time >= self.resync_interval:
+            # Rebase. Viewers reload the base document on their own schedule, up to resync_interval
+            # later, not when it is rewritten, so the update carries every feature. Its coordinates
+            # are absolute, applying them to the new base as well changes nothing.
+            write_features(self.path("_base"), features, self.style)
+            self.previous_base = self.base
+            self.base = {feature.feature_id: feature.coords for feature in features}
+            self.base_time = now
+            changed = list(features)
+        else:
+            # Until the next rebase some viewers may still show the previous base
+            previous = self.previous_base if self.previous_base is not None else self.base
+            changed = [feature for feature in features
+                       if self.base[feature.feature_id] != feature.coords or previous.get(feature.feature_id) != feature.coords]
+        write_update(self.path("_update"), self.href("_base"), changed)
+        return True
+
+    def href(self, suffix=""):
+        return f"{self.base_url}{output_path(f'{self.name}{suffix}')}"
+
+    def write_link(self):
+        update_interval = self.interval if self.interval is not None else self.poll_interval
+        write_network_link(self.path("_link"), self.name, [
+            (self.name, self.href("_base"), "onInterval", self.resync_interval),
+            (f"{self.name} updates", self.href("_update"), "onInterval", update_interval),
+        ])
+
+    async def regenerate(self):
+        features = await asyncio.get_running_loop().run_in_executor(None, self.generate)
+        return self.publish(list(features))
+
+    async def run(self, iterations=None):
+        """
+        Regenerates until stop() is called, or for a number of iterations.
+
+        With an interval the output is regenerated on that schedule, with watched files it is
+        regenerated as soon as one of them changes, whichever comes first.
+        """
+        self.stopped = asyncio.Event()
+        self.write_link()
+        state = self.watched_state()
+        count = 0
+        while not self.stopped.is_set():
+            await self.regenerate()
+            count += 1
+            if iterations is not None and count >= iterations:
+                break
+            deadline = None if self.interval is None else time.monotonic() + self.interval
+            while not self.stopped.is_set():
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                wait = remaining if not self.watch else min(self.poll_interval, remaining or self.poll_interval)
+                try:
+                    await asyncio.wait_for(self.stopped.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                if self.watch:
+                    new_state = self.watched_state()
+                    if new_state != state:
+                        state = new_state
+                        break
+
+    def stop(self):
+        if self.stopped is not None:
+            self.stopped.set()
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        """
+        Starts an HTTP server for the files of the output directory and returns the asyncio server.
+
+        Responses carry an ETag from the modification time and size of the file, so a viewer
+        polling an unchanged file gets an empty 304 Not Modified response.
+        """
+        return await asyncio.start_server(self.handle_request, host, port)
+
+    async def handle_request(self, reader, writer):
+        try:
+            request = await reader.readline()
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                key, _, value = line.decode("latin-1").partition(":")
+                headers[key.strip().lower()] = value.strip()
+            parts = request.decode("latin-1").split()
+            if len(parts) < 2 or parts[0] not in ("GET", "HEAD"):
+                await self.respond(writer, 405, "Method Not Allowed")
+                return
+            # Only plain file names inside the output directory are served
+            file_name = parts[1].split("?", 1)[0].lstrip("/")
+            path = os.path.join(self.directory, file_name)
+            if not file_name or os.path.basename(file_name) != file_name or not os.path.isfile(path):
+                await self.respond(writer, 404, "Not Found")
+                return
+            stat = os.stat(path)
+            etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+            response_headers = {"ETag": etag, "Cache-Control": "no-cache",
+                                "Last-Modified": formatdate(stat.st_mtime, usegmt=True)}
+            if headers.get("if-none-match") == etag:
+                await self.respond(writer, 304, "Not Modified", response_headers)
+                return
+            with open(path, "rb") as file:
+                body = file.read()
+            response_headers["Content-Type"] = CONTENT_TYPES.get(os.path.splitext(path)[1], "application/octet-stream")
+            await self.respond(writer, 200, "OK", response_headers, body if parts[0] == "GET" else b"", len(body))
+        finally:
+            writer.close()
+
+    async def respond(self, writer, status, reason, headers=None, body=b"", length=None):
+        lines = [f"HTTP/1.1 {status} {reason}"]
+        lines += [f"{key}: {value}" for key, value in (headers or {}).items()]
+        lines.append(f"Content-Length: {len(body) if length is None else length}")
+        lines.append("Connection: close")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
@@ -0,0 +1,437 @@
+# Description: Many-particle simulation in a shared scene.
+# Particles are stored as struct-of-arrays (position, velocity, mass, radius and drag arrays in
+# local east/north/up meters around one scene origin) and advanced together with vectorized
+# steps that are exact for constant acceleration. Collisions and proximity queries use a
+# uniform-grid spatial hash: particles are sorted by cell key and the particles of neighbouring
+# cells are found with np.searchsorted, so a step costs about O(N) pair checks instead of
+# O(N^2). Ground contact lands or bounces particles at h = 0. Runs come out as the BatchTracks of
+# simulate_projectile_batch, ready for the trajectory and KML writers.
+#
+# Usage:
+#     system = ParticleSystem(38.66, -121.13, restitution=0.8)
+#     system.launch(lat, lon, 0, 120, 45, azimuths, mass=2.0, radius=0.5)
+#     run = system.run(60, 0.01, record_every=10)
+#     save_particle_tracks("particles.kml", run, start_time)
+
+import argparse
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+
+from fluids import airDensity
+from geodesy import geodetic_to_offset, offset_to_geodetic
+from instrumentation import PHYSICS, SAMPLES, count, stage
+from kmlOutput import open_kml_output
+from kmlWriter import RED, RELATIVE_TO_GROUND, KmlStreamWriter
+from trajectory import Trajectory, datetime64_to_seconds
+from trajectoryEngine import GRAVITY_CONSTANT, BatchTracks, elapsed_to_datetime64, format_kml_times
+
+# Neighbour cell offsets lexicographically after (0, 0, 0). With the pairs inside each cell, they
+# visit every pair of neighbouring cells exactly once.
+FORWARD_OFFSETS = tuple((dx, dy, dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1) if (dx, dy, dz) > (0, 0, 0))
+
+# Largest number of candidate pairs expanded at once, bounds the temporary arrays of close_pairs
+PAIR_BLOCK = 1 << 20
+
+# Results of ParticleSystem.run.
+# - tracks: BatchTracks of the recorded frames, NaN where a particle was not in flight
+# - landed_time: (N,) seconds at which each particle came to rest on the ground, NaN if still moving
+# - impact_lat, impact_lon: (N,) coordinates where each particle came to rest, NaN if still moving
+# - collisions: number of particle collisions during the run
+# - ground_contacts: number of ground contacts, bounces included, during the run
+ParticleRun = namedtuple("ParticleRun", ["tracks", "landed_time", "impact_lat", "impact_lon", "collisions", "ground_contacts"])
+
+
+def cell_keys(cells):
+    """
+    Packs (N, 3) integer cell coordinates into int64 keys. A margin of one cell on every side
+    keeps the keys of neighbouring cells from wrapping into another row.
+
+    Returns:
+    - (keys, span): the keys and the number of cells along each axis, margins included.
+    """
+    low = cells.min(axis=0) - 1
+    span = cells.max(axis=0) - low + 2
+    if np.prod(span.astype(float)) >= 2.0**62:
+        raise ValueError("The scene spans too many cells, use a larger cell_size")
+    shifted = cells - low
+    return (shifted[:, 0] * span[1] + shifted[:, 1]) * span[2] + shifted[:, 2], span
+
+
+def candidate_blocks(starts, ends, block=PAIR_BLOCK):
+    """
+    Expands the ranges [starts[k], ends[k]) of sorted positions into (first, second) arrays of
+    candidate pairs, at most about block pairs at a time.
+    """
+    counts = np.maximum(ends - starts, 0)
+    cumulative = np.cumsum(counts)
+    total = int(cumulative[-1]) if counts.size else 0
+    if total == 0:
+        return
+    bounds = np.concatenate(([0], np.searchsorted(cumulative, np.arange(block, total, block), side="right"), [counts.size]))
+    for low, high in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+        block_counts = counts[low:high]
+        size = int(block_counts.sum())
+        if size == 0:
+            continue
+        first = np.repeat(np.arange(low, high), block_counts)
+        offsets = np.arange(size) - np.repeat(np.cumsum(block_counts) - block_counts, block_counts)
+        yield first, np.repeat(starts[low:high], block_counts) + offsets
+
+
+def close_pairs(position, distance, cell_size=None):
+    """
+    Finds all pairs of points closer than distance with a uniform-grid spatial hash.
+
+    Parameters:
+    - position: (N, 3) array of points in meters.
+    - distance: Largest distance of a pair in meters.
+    - cell_size: Grid cell size in meters, at least distance, distance by default.
+
+    Returns:
+    - (i, j, d): indices of the two points of every pair, each pair once, and their distances.
+    """
+    position = np.asarray(position, dtype=float)
+    cell_size = distance if cell_size is None else cell_size
+    if cell_size < distance or cell_size <= 0:
+        raise ValueError(f"cell_size must be positive and at least distance, got {cell_size} for distance {distance}")
+    if len(position) < 2:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+
+    keys, span = cell_keys(np.floor(position / cell_size).astype(np.int64))
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    sorted_position = position[order]
+    rank = np.arange(len(order))
+
+    # Every particle with the particles after it in its own cell, then with the neighbouring cells
+    ranges = [(rank + 1, np.searchsorted(sorted_keys, sorted_keys, side="right"))]
+    for dx, dy, dz in FORWARD_OFFSETS:
+        target = sorted_keys + (dx * span[1] + dy) * span[2] + dz
+        ranges.append((np.searchsorted(sorted_keys, target, side="left"), np.searchsorted(sorted_keys, target, side="right")))
+
+    firsts, seconds, distances = [], [], []
+    for starts, ends in ranges:
+        for first, second in candidate_blocks(starts, ends):
+            d = np.linalg.norm(sorted_position[first] - sorted_position[second], axis=1)
+            close = d < distance
+            firsts.append(order[first[close]])
+            seconds.append(order[second[close]])
+            distances.append(d[close])
+    if not firsts:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+    return np.concatenate(firsts), np.concatenate(seconds), np.concatenate(distances)
+
+
+class ParticleSystem:
+    """
+    Particles sharing a scene, advanced together.
+
+    Positions are east/north offsets in meters on the tangent plane of the scene origin and
+    heights above the ground, like the other simulations. Particles in flight are moved with
+    gravity and optional quadratic air drag, bounce off each other and land on the ground.
+
+    Parameters:
+    - lat, lon: Scene origin in degrees.
+    - g: Gravitational acceleration in m/s^2.
+    - restitution: Coefficient of restitution of collisions between particles, 1 is elastic.
+    - ground_restitution: Coefficient of restitution of ground contact, 0 lands particles at first contact.
+    - settle_speed: Positive speed in m/s, particles leaving the ground slower than this come to rest instead of bouncing.
+    - cell_size: Spatial hash cell size in meters, twice the largest radius by default.
+    - wind: (east, north, up) wind velocity in m/s, for particles with drag.
+    - ground_altitude: Altitude of the ground above sea level in meters, for the air density.
+    """
+
+    def __init__(self, lat, lon, g=GRAVITY_CONSTANT, restitution=1.0, ground_restitution=0.0, settle_speed=1.0,
+                 cell_size=None, wind=(0.0, 0.0, 0.0), ground_altitude=0.0):
+        self.lat = lat
+        self.lon = lon
+        self.g = g
+        self.restitution = restitution
+        self.ground_restitution = ground_restitution
+        self.settle_speed = settle_speed
+        self.cell_size = cell_size
+        self.wind = np.asarray(wind, dtype=float)
+        self.ground_altitude = ground_altitude
+        self.time = 0.0
+        self.position = np.empty((0, 3))
+        self.velocity = np.empty((0, 3))
+        self.mass = np.empty(0)
+        self.radius = np.empty(0)
+        self.drag_factor = np.empty(0)
+        self.active = np.empty(0, dtype=bool)  # In flight
+        self.landed_time = np.empty(0)
+        self.collisions = 0
+        self.ground_contacts = 0
+
+    def __len__(self):
+        return len(self.mass)
+
+    def add(self, east, north, up, velocity_east, velocity_north, velocity_up, mass=1.0, radius=0.0, drag_factor=0.0):
+        """
+        Adds particles, every argument a scalar or an array broadcast together.
+
+        Parameters:
+        - east, north, up: Positions in meters from the scene origin, up above the ground.
+        - velocity_east, velocity_north, velocity_up: Velocities in m/s.
+        - mass: Masses in kg.
+        - radius: Collision radii in meters, 0 for particles that never collide.
+        - drag_factor: Cd * A / (2 m) in m^2/kg, 0 for a vacuum trajectory.
+
+        Returns:
+        - The slice of the new particles.
+        """
+        arrays = [np.ravel(a).astype(float) for a in np.broadcast_arrays(
+            east, north, up, velocity_east, velocity_north, velocity_up, mass, radius, drag_factor)]
+        start = len(self)
+        self.position = np.concatenate((self.position, np.stack(arrays[0:3], axis=1)))
+        self.velocity = np.concatenate((self.velocity, np.stack(arrays[3:6], axis=1)))
+        self.mass = np.concatenate((self.mass, arrays[6]))
+        self.radius = np.concatenate((self.radius, arrays[7]))
+        self.drag_factor = np.concatenate((self.drag_factor, arrays[8]))
+        self.active = np.concatenate((self.active, arrays[2] >= 0))
+        self.landed_time = np.concatenate((self.landed_time, np.full(arrays[0].size, np.nan)))
+        return slice(start, len(self))
+
+    def launch(self, lat, lon, h0, v0, elevation_angle_deg, azimuth_angle_deg, mass=1.0, radius=0.0, drag_coefficient=0.0,
+               area=0.0):
+        """
+        Adds projectiles with the launch parameters of simulate_projectile_batch, every argument a
+        scalar or an array broadcast together.
+
+        Parameters:
+        - lat, lon, h0: Launch points in degrees and heights in meters.
+        - v0, elevation_angle_deg, azimuth_angle_deg: Launch speeds in m/s and angles in degrees,
+          azimuth from north.
+        - mass, radius: Masses in kg and collision radii in meters.
+        - drag_coefficient, area: Drag coefficients and cross-section areas in m^2, 0 for vacuum.
+
+        Returns:
+        - The slice of the new particles.
+        """
+        lat, lon, h0, v0, elevation, azimuth, mass, radius, drag_coefficient, area = (
+            np.ravel(a).astype(float) for a in np.broadcast_arrays(
+                lat, lon, h0, v0, elevation_angle_deg, azimuth_angle_deg, mass, radius, drag_coefficient, area)
+        )
+        east, north = geodetic_to_offset(self.lat, self.lon, lat, lon)
+        elevation_rad = np.radians(elevation)
+        azimuth_rad = np.radians(azimuth)
+        v0h = v0 * np.cos(elevation_rad)  # Horizontal component
+        return self.add(east, north, h0, v0h * np.sin(azimuth_rad), v0h * np.cos(azimuth_rad), v0 * np.sin(elevation_rad),
+                        mass, radius, drag_coefficient * area / (2 * mass))
+
+    def acceleration(self, index):
+        """Returns the (n, 3) accelerations of the particles at index, gravity plus air drag."""
+        acceleration = np.zeros((len(index), 3))
+        acceleration[:, 2] = -self.g
+        drag_factor = self.drag_factor[index]
+        if np.any(drag_factor):
+            relative = self.velocity[index] - self.wind
+            speed = np.linalg.norm(relative, axis=1)
+            density = airDensity(self.ground_altitude + np.maximum(self.position[index, 2], 0.0))
+            acceleration -= (drag_factor * density * speed)[:, None] * relative
+        return acceleration
+
+    def step(self, dt):
+        """Advances the particles in flight by dt seconds, then resolves ground contact and collisions."""
+        index = np.flatnonzero(self.active)
+        if index.size:
+            position, velocity = self.position[index], self.velocity[index]
+            acceleration = self.acceleration(index)
+            # Exact for constant acceleration, so vacuum flights match the closed-form trajectories
+            self.position[index] = position + velocity * dt + 0.5 * acceleration * dt**2
+            self.velocity[index] = velocity + acceleration * dt
+            below = self.position[index, 2] < 0
+            if below.any():
+                self.ground_contact(index[below], position[below], velocity[below], acceleration[below], dt)
+            self.collide(np.flatnonzero(self.active))
+        self.time += dt
+
+    def ground_contact(self, index, position, velocity, acceleration, dt):
+        """Lands or bounces the particles at index that went below ground during the last step, from their previous state."""
+        self.ground_contacts += index.size
+        z, vz, az = np.maximum(position[:, 2], 0.0), velocity[:, 2], acceleration[:, 2]
+        # First root of z + vz t + az t^2 / 2 = 0, in the form that is stable for az = 0
+        contact = 2 * z / (np.sqrt(np.maximum(vz**2 - 2 * az * z, 0.0)) - vz)
+        contact = np.clip(np.nan_to_num(contact), 0.0, dt)[:, None]
+        contact_position = position + velocity * contact + 0.5 * acceleration * contact**2
+        contact_position[:, 2] = 0.0
+        contact_velocity = velocity + acceleration * contact
+        contact_velocity[:, 2] *= -self.ground_restitution
+        bounce = (contact_velocity[:, 2] >= self.settle_speed) & (self.ground_restitution > 0)
+        if bounce.any():
+            rest = dt - contact[bounce]
+            moved = contact_position[bounce] + contact_velocity[bounce] * rest + 0.5 * acceleration[bounce] * rest**2
+            moved[:, 2] = np.maximum(moved[:, 2], 0.0)
+            self.position[index[bounce]] = moved
+            self.velocity[index[bounce]] = contact_velocity[bounce] + acceleration[bounce] * rest
+        landed = index[~bounce]
+        self.position[landed] = contact_position[~bounce]
+        self.velocity[landed] = 0.0
+        self.active[landed] = False
+        self.landed_time[landed] = self.time + contact[~bounce, 0]
+
+    def collide(self, index):
+        """Exchanges impulses between the approaching particles at index that touch."""
+        radius = self.radius[index]
+        largest = radius.max(initial=0.0)
+        if index.size < 2 or largest <= 0:
+            return
+        first, second, distance = close_pairs(self.position[index], 2 * largest, self.cell_size)
+        touching = (distance < radius[first] + radius[second]) & (distance > 0)
+        first, second, distance = index[first[touching]], index[second[touching]], distance[touching]
+        normal = (self.position[first] - self.position[second]) / distance[:, None]
+        approach = np.einsum("ij,ij->i", self.velocity[first] - self.velocity[second], normal)
+        approaching = approach < 0
+        if not approaching.any():
+            return
+        first, second, normal, approach = first[approaching], second[approaching], normal[approaching], approach[approaching]
+        impulse = -(1 + self.restitution) * approach / (1 / self.mass[first] + 1 / self.mass[second])
+        # np.add.at accumulates the impulses of particles in several pairs
+        np.add.at(self.velocity, first, (impulse / self.mass[first])[:, None] * normal)
+        np.add.at(self.velocity, second, -(impulse / self.mass[second])[:, None] * normal)
+        self.collisions += first.size
+
+    def neighbours(self, distance, in_flight_only=False):
+        """
+        Returns the (i, j, d) pairs of particles closer than distance, each pair once.
+
+        Parameters:
+        - distance: Largest distance in meters.
+        - in_flight_only: Leave out particles that have landed.
+        """
+        index = np.flatnonzero(self.active) if in_flight_only else np.arange(len(self))
+        first, second, d = close_pairs(self.position[index], distance)
+        return index[first], index[second], d
+
+    def geodetic(self):
+        """Returns the (lat, lon, h) arrays of the current particle positions."""
+        lat, lon = offset_to_geodetic(self.lat, self.lon, self.position[:, 0], self.position[:, 1])
+        return lat, lon, self.position[:, 2].copy()
+
+    def run(self, duration, dt, record_every=1):
+        """
+        Advances the system by duration seconds in steps of dt, recording a frame every record_every
+        steps, and stops early once every particle has landed.
+
+        A particle is recorded while it is in flight and once more, at its ground contact point, in
+        the first frame after it lands, so its track ends on the ground.
+
+        Returns:
+        - ParticleRun with the frame before the first step, the recorded frames after it and a
+          frame of the last step if it was not recorded.
+        """
+        steps = int(round(duration / dt))
+        frames = steps // record_every + 2
+        collisions, ground_contacts = self.collisions, self.ground_contacts
+        east, north, up = (np.full((len(self), frames), np.nan) for _ in range(3))
+        elapsed = np.empty(frames)
+        recorded = self.active.copy()  # Particles in flight at the previous frame
+
+        def record(frame):
+            elapsed[frame] = self.time
+            shown = self.active | recorded
+            east[shown, frame], north[shown, frame], up[shown, frame] = self.position[shown].T
+            recorded[:] = self.active
+
+        with stage(PHYSICS):
+            record(0)
+            frame = 0
+            step = 0
+            for step in range(1, steps + 1):
+                self.step(dt)
+                if step % record_every == 0:
+                    frame += 1
+                    record(frame)
+                if not self.active.any():
+                    break
+            if step % record_every != 0:
+                frame += 1
+                record(frame)
+        frames = frame + 1
+        count(SAMPLES, int(np.count_nonzero(~np.isnan(up[:, :frames]))))
+        lat, lon = offset_to_geodetic(self.lat, self.lon, np.nan_to_num(east[:, :frames]), np.nan_to_num(north[:, :frames]))
+        missing = np.isnan(up[:, :frames])
+        tracks = BatchTracks(elapsed[:frames], np.where(missing, np.nan, lon), np.where(missing, np.nan, lat), up[:, :frames])
+
+        landed = ~np.isnan(self.landed_time)
+        impact_lat, impact_lon, _ = self.geodetic()
+        return ParticleRun(tracks, self.landed_time.copy(), np.where(landed, impact_lat, np.nan), np.where(landed, impact_lon, np.nan),
+                           self.collisions - collisions, self.ground_contacts - ground_contacts)
+
+
+def particle_trajectories(run, start_time=None):
+    """
+    Returns one trajectory.Trajectory per particle of a ParticleRun, with POSIX times from
+    start_time, or the elapsed seconds without it.
+    """
+    t = run.tracks.elapsed + (datetime64_to_seconds(np.datetime64(start_time, "us")) if start_time is not None else 0.0)
+    trajectories = []
+    for index in range(run.tracks.h.shape[0]):
+        valid = ~np.isnan(run.tracks.h[index])
+        trajectories.append(Trajectory.from_columns(t[valid], run.tracks.lon[index, valid], run.tracks.lat[index, valid],
+                                                    run.tracks.h[index, valid]))
+    return trajectories
+
+
+def write_particle_tracks(writer, run, start_time=None, names=None):
+    """
+    Writes the particles of a ParticleRun to an open kmlWriter.KmlStreamWriter, one gx:Track per
+    particle, or one path line per particle without start_time.
+
+    Parameters:
+    - names: Optional Placemark names, "Particle 1", "Particle 2", ... by default.
+    """
+    tracks = run.tracks
+    style_id = writer.style(line_color=RED, line_width=3)
+    whens = np.array(format_kml_times(elapsed_to_datetime64(start_time, tracks.elapsed))) if start_time is not None else None
+    for index in range(tracks.h.shape[0]):
+        valid = ~np.isnan(tracks.h[index])
+        if not valid.any():
+            continue
+        name = names[index] if names else f"Particle {index + 1}"
+        coords = zip(tracks.lon[index, valid].tolist(), tracks.lat[index, valid].tolist(), tracks.h[index, valid].tolist())
+        if whens is None:
+            writer.linestring(coords, name=name, style_id=style_id, altitudemode=RELATIVE_TO_GROUND)
+        else:
+            writer.track(whens[valid].tolist(), coords, name=name, style_id=style_id, altitudemode=RELATIVE_TO_GROUND)
+    return writer
+
+
+def save_particle_tracks(path, run, start_time=None, names=None):
+    """
+    Writes the particles of a ParticleRun to a .kml, .kmz or .kml.gz file. The tracks are also
+    accepted by projectileMotion.save_batch_tracks and tiledExport.TiledExporter.add_batch.
+    """
+    with open_kml_output(path) as output, KmlStreamWriter(output) as writer:
+        write_particle_tracks(writer, run, start_time, names)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate many colliding projectiles and write their tracks.")
+    parser.add_argument("--count", type=int, default=1000, help="Number of projectiles")
+    parser.add_argument("--duration", type=float, default=30.0, help="Simulated seconds")
+    parser.add_argument("--dt", type=float, default=0.01, help="Time step in seconds")
+    parser.add_argument("--record-every", type=int, default=10, help="Steps between recorded frames")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the launch parameters")
+    parser.add_argument("--output", default="particles.kml", help="Output .kml, .kmz or .kml.gz file")
+    args = parser.parse_args(argv)
+
+    # Projectiles launched from a ring towards its center, so their paths cross above it. The ring
+    # is 3 km around, so 1000 particles of 1 m radius start apart.
+    start_lat, start_lon = 38.662463, -121.125643
+    rng = np.random.default_rng(args.seed)
+    bearing = rng.uniform(0, 360, args.count)
+    lat, lon = offset_to_geodetic(start_lat, start_lon, 500 * np.sin(np.radians(bearing)), 500 * np.cos(np.radians(bearing)))
+    system = ParticleSystem(start_lat, start_lon, restitution=0.8, ground_restitution=0.3)
+    system.launch(lat, lon, 0, rng.uniform(95, 105, args.count), 45, (bearing + 180) % 360, mass=1.0, radius=1.0)
+    run = system.run(args.duration, args.dt, args.record_every)
+    save_particle_tracks(args.output, run, datetime(2024, 1, 1))
+    print(f"{args.count} particles, {run.collisions} collisions, {run.ground_contacts} ground contacts, "
+          f"{int(np.count_nonzero(np.isnan(run.landed_time)))} still moving, written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
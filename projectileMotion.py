@@ -1,12 +1,31 @@
-import simplekml
-import math
 from datetime import datetime, timedelta
-import random
+
+import numpy as np
+
+from ballistics import simulate_ballistic_batch
+from circleLod import unit_circle
+from geodesy import offset_to_geodetic
+from instrumentation import BUILD, PHYSICS, PLACEMARKS, SAMPLES, WRITE, count, stage, timed_iter
+from kmlOutput import open_kml_output, output_path, save_kml
+from kmlStyles import shared_style
+from kmlWriter import KmlStreamWriter, RED, BLUE, RELATIVE_TO_GROUND, with_alpha
+from lazyImport import lazy_import
+from resultCache import cached_call
+from trajectoryEngine import (
+    freefall_trajectory, projectile_trajectory, iter_freefall_chunks, iter_projectile_chunks,
+    adaptive_projectile_trajectory, concatenate_chunks, iter_coords, format_kml_times, elapsed_to_datetime64,
+    simulate_projectile_batch, TrajectoryArrays,
+)
+from simplify import simplify_trajectory
+from trajectory import Trajectory
+from vectorChain import random_walk, segment_coords
+
+# Only loaded when a simplekml document is built, the streaming writers do not need it
+simplekml = lazy_import("simplekml")
 
 # Constants
 DEFAULT_ICON = "http://maps.google.com/mapfiles/kml/shapes/donut.png"
 GRAVITY_CONSTANT = 9.80  # Acceleration due to gravity (m/s^2)
-DEGREE_OF_RADIUS_LINE = 111139  # Meters per degree latitude
 
 def interpolate_times(start_time, end_time, intervals):
     """
@@ -24,85 +43,161 @@ def interpolate_times(start_time, end_time, intervals):
     # print([start_time + i * delta for i in range(intervals + 1)])
     return [start_time + i * delta for i in range(intervals + 1)]
 
-def meters_to_lat_change(meters):
-    """Converts meters to a change in latitude in degrees."""
-    return meters / DEGREE_OF_RADIUS_LINE
-
-def meters_to_long_change(meters, lat):
-    """Converts meters to a change in longitude in degrees at a given latitude."""
-    return meters / (DEGREE_OF_RADIUS_LINE * math.cos(math.radians(lat)))
-
 def create_vector(kml, name, lat, lon, delta_i, delta_j, h1=0, h2=0, start_time=None, end_time=None):
     """
     Creates a vector in KML from a starting point to an end point defined by delta_i and delta_j, with optional time span.
+    kml may be a simplekml.Kml or a KmlStreamWriter.
     """
-    delta_lat = meters_to_lat_change(delta_j)
-    delta_lon = meters_to_long_change(delta_i, lat)
-    end_lat = lat + delta_lat
-    end_lon = lon + delta_lon
-
-    linestring = kml.newlinestring(name=name)
-    linestring.coords = [(lon, lat, h1), (end_lon, end_lat, h2)]
-    linestring.style.labelstyle.scale = 0.6
-    linestring.style.iconstyle.icon.href = DEFAULT_ICON
-    linestring.style.iconstyle.scale = 0.5
-    linestring.altitudemode = simplekml.AltitudeMode.relativetoground
-    
-    if start_time and end_time:
-        linestring.timespan.begin = start_time.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
-        linestring.timespan.end = end_time.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
-
+    end_lat, end_lon = (float(value) for value in offset_to_geodetic(lat, lon, delta_i, delta_j))
+    write_vector_lines(kml, [name], [[(lon, lat, h1), (end_lon, end_lat, h2)]], start_time, end_time)
     return end_lat, end_lon, h2
 
-def create_vectors(kml, vectors, start_time=None, end_time=None):
+def write_vector_lines(kml, names, lines, start_time=None, end_time=None, multigeometry=False):
+    """
+    Writes vector lines, one Placemark per name or, with multigeometry=True, one Placemark named
+    names[0] with a MultiGeometry of all lines. kml may be a simplekml.Kml or a KmlStreamWriter.
+    """
+    begin = start_time.strftime('%Y-%m-%dT%H:%M:%S.%fZ') if start_time and end_time else None
+    end = end_time.strftime('%Y-%m-%dT%H:%M:%S.%fZ') if start_time and end_time else None
+
+    if isinstance(kml, KmlStreamWriter):
+        style_id = kml.style(label_scale=0.6, icon_href=DEFAULT_ICON, icon_scale=0.5)
+        if multigeometry:
+            kml.multi_linestring(lines, name=names[0], begin=begin, end=end, style_id=style_id, altitudemode=RELATIVE_TO_GROUND)
+            return
+        for name, coords in zip(names, lines):
+            kml.linestring(coords, name=name, begin=begin, end=end, style_id=style_id, altitudemode=RELATIVE_TO_GROUND)
+        return
+
+    style = shared_style(kml, label_scale=0.6, icon_href=DEFAULT_ICON, icon_scale=0.5)
+    if multigeometry:
+        multi = kml.newmultigeometry(name=names[0])
+        multi.style = style
+        features = [multi]
+        for coords in lines:
+            multi.newlinestring(coords=coords).altitudemode = simplekml.AltitudeMode.relativetoground
+    else:
+        features = []
+        for name, coords in zip(names, lines):
+            linestring = kml.newlinestring(name=name)
+            linestring.coords = coords
+            linestring.style = style
+            linestring.altitudemode = simplekml.AltitudeMode.relativetoground
+            features.append(linestring)
+
+    if begin:
+        for feature in features:
+            feature.timespan.begin = begin
+            feature.timespan.end = end
+
+def create_vectors(kml, vectors, start_time=None, end_time=None, multigeometry=False):
     """
     Creates multiple vectors in KML with optional time span for each vector.
+    The endpoints of all vectors are computed with one vectorized geodesy call, and with
+    multigeometry=True all vectors go into one Placemark named "Vectors".
+
+    Returns:
+    - List of (end_lat, end_lon, h2) of every vector.
     """
-    for vector in vectors:
-        create_vector(
-            kml,
-            name=vector['name'],
-            lat=vector['lat'],
-            lon=vector['lon'],
-            delta_i=vector['i'],
-            delta_j=vector['j'],
-            h1=vector.get('h1', 0),
-            h2=vector.get('h2', 0),
-            start_time=start_time,
-            end_time=end_time
-        )
+    # lat, lon, i and j are required, a vector without them raises KeyError
+    lat, lon, delta_i, delta_j = (np.array([vector[key] for vector in vectors], dtype=float) for key in ("lat", "lon", "i", "j"))
+    h1, h2 = (np.array([vector.get(key, 0) for vector in vectors], dtype=float) for key in ("h1", "h2"))
+    end_lat, end_lon = offset_to_geodetic(lat, lon, delta_i, delta_j)
+    end_lat, end_lon = end_lat.tolist(), end_lon.tolist()
+    lines = [[start, end] for start, end in zip(zip(lon.tolist(), lat.tolist(), h1.tolist()), zip(end_lon, end_lat, h2.tolist()))]
+    names = ["Vectors"] if multigeometry else [vector['name'] for vector in vectors]
+    write_vector_lines(kml, names, lines, start_time, end_time, multigeometry)
+    return list(zip(end_lat, end_lon, h2.tolist()))
+
+def create_track(kml, name, trajectory, style=None):
+    """
+    Creates a single gx:Track from TrajectoryArrays, with parallel <when>/<gx:coord> lists
+    instead of one Placemark per sample.
+    """
+    track = kml.newgxtrack(name=name)
+    track.newwhen(format_kml_times(trajectory.when))
+    track.newgxcoord(list(iter_coords(trajectory)))
+    track.altitudemode = simplekml.AltitudeMode.relativetoground
+    if style is not None:
+        track.style = style
+    return track
+
+def instrumented_chunks(chunks, samples=True):
+    """
+    Yields trajectory chunks, timing their computation as the physics stage and counting their
+    samples. samples=False leaves the count alone for a pass recomputing chunks already counted.
+    """
+    for chunk in timed_iter(PHYSICS, chunks):
+        if samples:
+            count(SAMPLES, len(chunk.when))
+        yield chunk
 
-def simulate_freefall(lat, lon, height, duration, intervals, name, start_time=None, end_time=None):
+def simulate_freefall(lat, lon, height, duration, intervals, name, start_time=None, end_time=None, stream=False, track=False, output_format="kml",
+                      g=GRAVITY_CONSTANT, cache=None):
     """
     Simulates free fall and generates a KML file of the trajectory with optional start and end time.
+    With stream=True the points are written to the file as they are computed, with bounded memory.
+    With track=True the trajectory is a single gx:Track instead of one Placemark per sample.
+    output_format selects a plain "kml", zipped "kmz" or "gzip" compressed file.
+    g is the gravitational acceleration in m/s^2, e.g. gravity.normal_gravity(lat, height) for the local value.
+    With a resultCache.ResultCache as cache, a rerun with the same parameters and an explicit start_time
+    copies the stored file instead of simulating again.
+    Returns the samples as a trajectory.Trajectory, or None with stream=True or a cache, which do not keep them.
     """
-    kml = simplekml.Kml()
+    if cache is not None:
+        cached_call(cache, simulate_freefall, locals(), output_path(name, output_format))
+        return
     if not start_time:
         start_time = datetime.utcnow()
     if not end_time:
         end_time = start_time + timedelta(seconds=duration)
-    
-    times = [start_time + timedelta(seconds=duration * i / intervals) for i in range(intervals + 1)]
-
-    for t in times:
-        elapsed_time = (t - start_time).total_seconds()
-        h = height - 0.5 * GRAVITY_CONSTANT * elapsed_time**2
-        if h < 0:
-            h = 0
-            break
-
-        point = kml.newpoint()
-        point.name = f"h: {h:.2f}m"
-        point.coords = [(lon, lat, h)]
-        point.style.labelstyle.scale = 0.6
-        point.style.iconstyle.icon.href = DEFAULT_ICON
-        point.style.iconstyle.scale = 0.5
-        point.altitudemode = simplekml.AltitudeMode.relativetoground
-        point.timestamp.when = t.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
-
-    kml.save(f"{name}.kml")
-
-def simulate_projectile_motion(lat, lon, h0, v0, elevation_angle_deg, azimuth_angle_deg, duration, intervals, name, start_time=None, end_time=None):
+
+    def chunks(samples=True):
+        return instrumented_chunks(iter_freefall_chunks(lat, lon, height, duration, intervals, start_time, g), samples)
+
+    if stream:
+        with stage(WRITE), open_kml_output(output_path(name, output_format)) as output, KmlStreamWriter(output) as writer:
+            if track:
+                writer.track(
+                    (when for chunk in chunks() for when in format_kml_times(chunk.when)),
+                    (coords for chunk in chunks(samples=False) for coords in iter_coords(chunk)), name=name,
+                    style_id=writer.style(label_scale=0.6, icon_href=DEFAULT_ICON, icon_scale=0.5), altitudemode=RELATIVE_TO_GROUND
+                )
+                return
+            for chunk in chunks():
+                for coords, when in zip(iter_coords(chunk), format_kml_times(chunk.when)):
+                    style_id = writer.style(label_scale=0.6, icon_href=DEFAULT_ICON, icon_scale=0.5)
+                    writer.point(coords, name=f"h: {coords[2]:.2f}m", when=when, style_id=style_id, altitudemode=RELATIVE_TO_GROUND)
+        return
+
+    kml = simplekml.Kml()
+    with stage(PHYSICS):
+        trajectory = freefall_trajectory(lat, lon, height, duration, intervals, start_time, g)
+    count(SAMPLES, len(trajectory.when))
+
+    if track:
+        with stage(BUILD):
+            create_track(kml, name, trajectory, shared_style(kml, label_scale=0.6, icon_href=DEFAULT_ICON, icon_scale=0.5))
+        count(PLACEMARKS)
+        save_kml(kml, output_path(name, output_format))
+        return Trajectory.from_arrays(trajectory)
+
+    whens = format_kml_times(trajectory.when)
+    with stage(BUILD):
+        for coords, when in zip(iter_coords(trajectory), whens):
+            point = kml.newpoint()
+            point.name = f"h: {coords[2]:.2f}m"
+            point.coords = [coords]
+            point.style = shared_style(kml, label_scale=0.6, icon_href=DEFAULT_ICON, icon_scale=0.5)
+            point.altitudemode = simplekml.AltitudeMode.relativetoground
+            point.timestamp.when = when
+    count(PLACEMARKS, len(whens))
+
+    save_kml(kml, output_path(name, output_format))
+    return Trajectory.from_arrays(trajectory)
+
+def simulate_projectile_motion(lat, lon, h0, v0, elevation_angle_deg, azimuth_angle_deg, duration, intervals, name, start_time=None, end_time=None, stream=False, track=False, output_format="kml",
+                               tolerance=None, simplify_tolerance=None, g=GRAVITY_CONSTANT, cache=None):
     """
     Simulates projectile motion and generates a KML file of the trajectory with optional time span.
     
@@ -117,84 +212,235 @@ def simulate_projectile_motion(lat, lon, h0, v0, elevation_angle_deg, azimuth_an
     - name: Name of the KML file to be saved.
     - start_time: Optional start datetime (UTC).
     - end_time: Optional end datetime (UTC).
-    """
-    kml = simplekml.Kml()
-    elevation_angle_rad = math.radians(elevation_angle_deg)
-    azimuth_angle_rad = math.radians(azimuth_angle_deg)
-
-    v0h = v0 * math.cos(elevation_angle_rad)  # Horizontal component
-    v0v = v0 * math.sin(elevation_angle_rad)  # Vertical component
-
-    v0x = v0h * math.sin(azimuth_angle_rad)  # East-West component (x)
-    v0y = v0h * math.cos(azimuth_angle_rad)  # North-South component (y)
+    - stream: Write the KML file incrementally with bounded memory instead of building it with simplekml.
+    - track: Emit the trajectory as a single gx:Track instead of timestamped points plus a LineString.
+    - output_format: "kml", "kmz" or "gzip" (.kml.gz).
+    - tolerance: Optional chord error in meters. When given, samples are placed adaptively by
+      geometric error and intervals is ignored.
+    - simplify_tolerance: Optional Douglas-Peucker tolerance in meters applied to the samples before writing.
+    - g: Gravitational acceleration in m/s^2, e.g. from gravity.GravityProvider for the launch point.
+    - cache: Optional resultCache.ResultCache. Requires start_time, a rerun with the same parameters
+      copies the stored file instead of simulating again.
 
+    Returns:
+    - The samples as a trajectory.Trajectory, or None with stream=True or a cache, which do not keep them.
+    """
+    if cache is not None:
+        cached_call(cache, simulate_projectile_motion, locals(), output_path(name, output_format))
+        return
     if not start_time:
         start_time = datetime.utcnow()
     if not end_time:
         end_time = start_time + timedelta(seconds=duration)
 
-    # Generate the interpolated times
-    interpolated_times = interpolate_times(start_time, end_time, intervals)
+    if tolerance is not None or simplify_tolerance is not None:
+        with stage(PHYSICS):
+            if tolerance is not None:
+                trajectory = adaptive_projectile_trajectory(
+                    lat, lon, h0, v0, elevation_angle_deg, azimuth_angle_deg, duration, tolerance,
+                    start_time, end_time, g
+                )
+            else:
+                trajectory = projectile_trajectory(
+                    lat, lon, h0, v0, elevation_angle_deg, azimuth_angle_deg, duration, intervals,
+                    start_time, end_time, g
+                )
+            if simplify_tolerance is not None:
+                trajectory = simplify_trajectory(trajectory, simplify_tolerance)
+        count(SAMPLES, len(trajectory.when))
+
+        def chunks(samples=True):
+            return iter([trajectory])
+    else:
+        def chunks(samples=True):
+            return instrumented_chunks(iter_projectile_chunks(
+                lat, lon, h0, v0, elevation_angle_deg, azimuth_angle_deg, duration, intervals,
+                start_time, end_time, g
+            ), samples)
+
+    if stream:
+        with stage(WRITE), open_kml_output(output_path(name, output_format)) as output, KmlStreamWriter(output) as writer:
+            if track:
+                writer.track(
+                    (when for chunk in chunks() for when in format_kml_times(chunk.when)),
+                    (coords for chunk in chunks(samples=False) for coords in iter_coords(chunk)), name=name,
+                    style_id=writer.style(line_color=RED, line_width=3), altitudemode=RELATIVE_TO_GROUND
+                )
+                return
+            for chunk in chunks():
+                for coords, when in zip(iter_coords(chunk), format_kml_times(chunk.when)):
+                    writer.point(coords, when=when, altitudemode=RELATIVE_TO_GROUND)
+            # The path is recomputed chunk by chunk rather than kept in memory
+            writer.linestring(
+                (coords for chunk in chunks(samples=False) for coords in iter_coords(chunk)), name=name,
+                begin=start_time.strftime('%Y-%m-%dT%H:%M:%S.%fZ'), end=end_time.strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+                style_id=writer.style(line_color=RED, line_width=3), altitudemode=RELATIVE_TO_GROUND
+            )
+        return
+
+    # Compute the whole trajectory as arrays
+    trajectory = concatenate_chunks(chunks())
+    save_projectile_kml(trajectory, name, start_time, end_time, track, output_format)
+    return Trajectory.from_arrays(trajectory)
+
+def save_projectile_kml(trajectory, name, start_time, end_time, track=False, output_format="kml"):
+    """
+    Saves a projectile trajectory as timestamped points plus a path line, or as a single gx:Track.
 
-    positions = []
-    for idx, t in enumerate(interpolated_times):
-        time_elapsed = idx * duration / intervals
-        x = v0x * time_elapsed  # East-West displacement in meters
-        y = v0y * time_elapsed  # North-South displacement in meters
-        z = v0v * time_elapsed - 0.5 * GRAVITY_CONSTANT * time_elapsed**2  # Vertical displacement in meters
-        h = h0 + z
-        if h < 0:
-            h = 0
-            break
+    Parameters:
+    - trajectory: TrajectoryArrays or trajectory.Trajectory of the projectile.
+    - name: Name of the KML file to be saved.
+    - start_time, end_time: Time span of the path line.
+    - track: Emit a single gx:Track instead of points plus a LineString.
+    - output_format: "kml", "kmz" or "gzip" (.kml.gz).
+    """
+    kml = simplekml.Kml()
 
-        delta_lat = meters_to_lat_change(y)
-        delta_lon = meters_to_long_change(x, lat)
+    if track:
+        with stage(BUILD):
+            create_track(kml, name, trajectory, shared_style(kml, line_color=simplekml.Color.red, line_width=3))
+        count(PLACEMARKS)
+        save_kml(kml, output_path(name, output_format))
+        return
+
+    positions = list(iter_coords(trajectory))
+    whens = format_kml_times(trajectory.when)
+
+    with stage(BUILD):
+        for coords, when in zip(positions, whens):
+            # Create point with timestamp
+            point = kml.newpoint()
+            point.coords = [coords]
+            point.timestamp.when = when
+            point.altitudemode = simplekml.AltitudeMode.relativetoground
+
+        # Create a KML line for the projectile path
+        linestring = kml.newlinestring(name=name)
+        linestring.coords = positions
+        linestring.altitudemode = simplekml.AltitudeMode.relativetoground
+        linestring.style = shared_style(kml, line_color=simplekml.Color.red, line_width=3)
+
+        # Set the timespan for the entire line
+        linestring.timespan.begin = start_time.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+        linestring.timespan.end = end_time.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+    count(PLACEMARKS, len(positions) + 1)
 
-        current_lat = lat + delta_lat
-        current_lon = lon + delta_lon
+    save_kml(kml, output_path(name, output_format))
 
-        # Add position and timestamp to the positions list
-        positions.append((current_lon, current_lat, h))
+def simulate_projectile_motion_with_drag(lat, lon, h0, v0, elevation_angle_deg, azimuth_angle_deg, duration, name,
+                                         mass, drag_coefficient, area, wind=(0.0, 0.0, 0.0), method="rk45", dt=0.01,
+                                         start_time=None, end_time=None, track=False, output_format="kml", g=GRAVITY_CONSTANT):
+    """
+    Simulates projectile motion with quadratic air drag and wind and generates a KML file of the trajectory.
 
-        # Create point with timestamp
-        point = kml.newpoint()
-        point.coords = [(current_lon, current_lat, h)]
-        point.timestamp.when = t.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
-        point.altitudemode = simplekml.AltitudeMode.relativetoground
+    Parameters:
+    - lat, lon, h0, v0, elevation_angle_deg, azimuth_angle_deg, duration, name, start_time, end_time, track,
+      output_format, g: Same as simulate_projectile_motion.
+    - mass: Projectile mass in kg.
+    - drag_coefficient: Drag coefficient (about 0.47 for a sphere).
+    - area: Cross-section area in m^2.
+    - wind: (east, north, up) wind velocity in m/s.
+    - method: "rk45" for adaptive steps or "rk4" for fixed steps of dt seconds.
 
-    # Create a KML line for the projectile path
-    linestring = kml.newlinestring(name=name)
-    linestring.coords = positions
-    linestring.altitudemode = simplekml.AltitudeMode.relativetoground
-    linestring.style.linestyle.color = simplekml.Color.red
-    linestring.style.linestyle.width = 3
+    Returns:
+    - The samples as a trajectory.Trajectory.
+    """
+    if not start_time:
+        start_time = datetime.utcnow()
+    if not end_time:
+        end_time = start_time + timedelta(seconds=duration)
 
-    # Set the timespan for the entire line
-    linestring.timespan.begin = start_time.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
-    linestring.timespan.end = end_time.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+    with stage(PHYSICS):
+        result = simulate_ballistic_batch(
+            lat, lon, h0, v0, elevation_angle_deg, azimuth_angle_deg, mass, drag_coefficient, area, duration,
+            wind=wind, g=g, method=method, dt=dt
+        )
+    valid = ~np.isnan(result.h[0])
+    elapsed = result.elapsed[valid]
+    lons, lats, heights = result.lon[0, valid], result.lat[0, valid], result.h[0, valid]
+    if not np.isnan(result.time_of_flight[0]):
+        # End the path on the interpolated impact point
+        elapsed = np.append(elapsed, result.time_of_flight[0])
+        lons = np.append(lons, result.impact_lon[0])
+        lats = np.append(lats, result.impact_lat[0])
+        heights = np.append(heights, 0.0)
+
+    timeline_scale = (end_time - start_time).total_seconds() / duration
+    trajectory = TrajectoryArrays(elapsed_to_datetime64(start_time, elapsed * timeline_scale), lons, lats, heights)
+    count(SAMPLES, len(elapsed))
+    save_projectile_kml(trajectory, name, start_time, end_time, track, output_format)
+    return Trajectory.from_arrays(trajectory)
+
+def save_batch_tracks(tracks, name, launch_names=None, start_time=None, output_format="kml"):
+    """
+    Saves the tracks of simulate_projectile_batch(..., return_tracks=True) as one KML file,
+    with one line per launch.
 
-    kml.save(f"{name}.kml")
+    Parameters:
+    - tracks: BatchTracks returned by simulate_projectile_batch.
+    - name: Name of the KML file to be saved.
+    - launch_names: Optional list of line names, defaults to "Launch 1", "Launch 2", ...
+    - start_time: Optional launch datetime. When given, the launches are saved as one time-animated
+      gx:MultiTrack instead of static lines.
+    - output_format: "kml", "kmz" or "gzip" (.kml.gz).
+    """
+    kml = simplekml.Kml()
+    if start_time is not None:
+        whens = np.array(format_kml_times(elapsed_to_datetime64(start_time, tracks.elapsed)))
+        with stage(BUILD):
+            multitrack = kml.newgxmultitrack(name=name)
+            for index in range(tracks.h.shape[0]):
+                valid = ~np.isnan(tracks.h[index])
+                track = multitrack.newgxtrack(name=launch_names[index] if launch_names else f"Launch {index + 1}")
+                track.newwhen(whens[valid].tolist())
+                track.newgxcoord(list(zip(tracks.lon[index, valid].tolist(), tracks.lat[index, valid].tolist(), tracks.h[index, valid].tolist())))
+                track.altitudemode = simplekml.AltitudeMode.relativetoground
+        count(PLACEMARKS)
+        save_kml(kml, output_path(name, output_format))
+        return
+
+    with stage(BUILD):
+        for index in range(tracks.h.shape[0]):
+            valid = ~np.isnan(tracks.h[index])
+            linestring = kml.newlinestring(name=launch_names[index] if launch_names else f"Launch {index + 1}")
+            linestring.coords = list(zip(tracks.lon[index, valid].tolist(), tracks.lat[index, valid].tolist(), tracks.h[index, valid].tolist()))
+            linestring.altitudemode = simplekml.AltitudeMode.relativetoground
+    count(PLACEMARKS, tracks.h.shape[0])
+    save_kml(kml, output_path(name, output_format))
+
+def circle_coords(latitude, longitude, altitude, radius, num_points):
+    """Returns the closed list of (lon, lat, h) points of a circle."""
+    # Clockwise from north: the shared counterclockwise-from-east table with sin and cos swapped
+    cos, sin = unit_circle(num_points)
+    lat, lon = offset_to_geodetic(latitude, longitude, radius * sin, radius * cos)
+    return [(lon_i, lat_i, altitude) for lon_i, lat_i in zip(lon.tolist(), lat.tolist())]
 
 def create_circle(kml, latitude, longitude, altitude, radius, num_points, start_time=None, end_time=None):
     """
     Creates a circle polygon in KML with optional start and end time.
+    kml may be a simplekml.Kml or a KmlStreamWriter.
     """
+    if isinstance(kml, KmlStreamWriter):
+        coords = circle_coords(latitude, longitude, altitude, radius, num_points)
+        style_id = kml.style(line_color=BLUE, line_width=2, poly_color=with_alpha(150, RED))
+        kml.polygon(
+            coords, name="Circle",
+            begin=start_time.strftime('%Y-%m-%dT%H:%M:%S.%fZ') if start_time and end_time else None,
+            end=end_time.strftime('%Y-%m-%dT%H:%M:%S.%fZ') if start_time and end_time else None,
+            style_id=style_id, altitudemode=RELATIVE_TO_GROUND, extrude=0
+        )
+        return
+
     pol = kml.newpolygon(name="Circle")
     pol.extrude = 0
     pol.altitudemode = simplekml.AltitudeMode.relativetoground
 
-    pol.style.polystyle.color = simplekml.Color.changealphaint(150, simplekml.Color.red)
-    pol.style.linestyle.color = simplekml.Color.blue
-    pol.style.linestyle.width = 2
-
-    coords = []
-    for i in range(num_points + 1):
-        angle = math.radians(float(i) / num_points * 360)
-        delta_lat = meters_to_lat_change(radius * math.cos(angle))
-        delta_lon = meters_to_long_change(radius * math.sin(angle), latitude)
-        coords.append((longitude + delta_lon, latitude + delta_lat, altitude))
+    pol.style = shared_style(
+        kml, poly_color=simplekml.Color.changealphaint(150, simplekml.Color.red),
+        line_color=simplekml.Color.blue, line_width=2
+    )
 
-    pol.outerboundaryis.coords = coords
+    pol.outerboundaryis.coords = circle_coords(latitude, longitude, altitude, radius, num_points)
 
     if start_time and end_time:
         pol.timespan.begin = start_time.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
@@ -233,34 +479,11 @@ def main():
         end_time=end_time
     )
 
-    # Create vectors with time span
+    # Create a random chain of vectors with time span, composed in one pass
     kml_vectors = simplekml.Kml()
-    vectors = []
-    current_lat = start_lat
-    current_lon = start_lon
-    current_h = 0
-
-    for i in range(1, 6):
-        delta_i = random.uniform(-100, 100)
-        delta_j = random.uniform(-100, 100)
-        delta_h = random.uniform(0, 50)
-        vectors.append({
-            'name': f"Vector {i}",
-            'lat': current_lat,
-            'lon': current_lon,
-            'i': delta_i,
-            'j': delta_j,
-            'h1': current_h,
-            'h2': current_h + delta_h
-        })
-        # Update current position
-        delta_lat = meters_to_lat_change(delta_j)
-        delta_lon = meters_to_long_change(delta_i, current_lat)
-        current_lat += delta_lat
-        current_lon += delta_lon
-        current_h += delta_h
-
-    create_vectors(kml_vectors, vectors, start_time=start_time, end_time=end_time)
+    chain = random_walk(start_lat, start_lon, 5)
+    names = [f"Vector {i}" for i in range(1, 6)]
+    write_vector_lines(kml_vectors, names, segment_coords(chain), start_time=start_time, end_time=end_time)
     kml_vectors.save("vectors.kml")
 
 if __name__ == "__main__":
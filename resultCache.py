@@ -0,0 +1,241 @@
+# Description: Content-addressed cache for simulation outputs.
+# Results are stored on disk under the SHA-256 of a canonical encoding of the function name, its
+# parameters and an explicit time base, so an identical rerun copies the stored file (or loads
+# the stored arrays) instead of recomputing it. The cache directory is bounded in size and the
+# least recently used entries are evicted first.
+
+import hashlib
+import json
+import math
+import os
+import shutil
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+from kmlOutput import keep_mode, temporary_file
+
+# Part of every key, bump it when a change to the simulations changes their output
+CACHE_VERSION = 1
+
+DEFAULT_MAX_BYTES = 1024 ** 3  # 1 GiB
+
+
+def canonical(value):
+    """
+    Converts a parameter value to a JSON-compatible canonical form, so that equal parameters
+    always hash the same: 1 and 1.0 are the same number, tuples and lists the same sequence,
+    dictionaries are sorted by key and datetimes are ISO strings.
+    """
+    if value is None or isinstance(value, (bool, str)):
+        return value
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        number = float(value)
+        return repr(number) if math.isfinite(number) else str(number)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, timedelta):
+        return repr(value.total_seconds())
+    if isinstance(value, np.ndarray):
+        return {"dtype": str(value.dtype), "shape": list(value.shape),
+                "sha256": hashlib.sha256(np.ascontiguousarray(value).tobytes()).hexdigest()}
+    if isinstance(value, dict):
+        return {str(key): canonical(value[key]) for key in sorted(value, key=str)}
+    if isinstance(value, (list, tuple)):
+        return [canonical(item) for item in value]
+    raise TypeError(f"Cannot build a cache key from {type(value).__name__} value {value!r}")
+
+
+def cache_key(kind, params, time_base=None):
+    """
+    Returns the hex SHA-256 key of a result.
+
+    Parameters:
+    - kind: Name of the producing function, e.g. "simulate_projectile_motion".
+    - params: Dictionary of every parameter that affects the output.
+    - time_base: The absolute times the output is anchored to, e.g. (start_time, end_time).
+      Outputs with timestamps must pass it, outputs in elapsed seconds may leave it None.
+    """
+    document = {"version": CACHE_VERSION, "kind": kind, "params": canonical(params), "time_base": canonical(time_base)}
+    encoded = json.dumps(document, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    On-disk result store with least recently used eviction.
+
+    Usage:
+        cache = ResultCache("cache", max_bytes=512 * 1024 ** 2)
+        key = cache_key("simulate_freefall", params, (start_time, end_time))
+        cache.run(key, "freefall.kml", lambda: simulate_freefall(...))
+
+    Entries are plain files named by their key. Writes go through a temporary file and a rename,
+    so several processes can share one cache directory.
+
+    Parameters:
+    - directory: Cache directory, created if needed.
+    - max_bytes: Size bound of the directory. Oldest entries by last use are removed beyond it.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def entry_path(self, key, suffix):
+        return os.path.join(self.directory, f"{key}{suffix}")
+
+    def lookup(self, key, suffix):
+        """Returns the path of a cached entry and marks it as used, or None on a miss."""
+        path = self.entry_path(key, suffix)
+        try:
+            os.utime(path)  # The modification time records the last use for eviction
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return path
+
+    def store(self, key, suffix, source):
+        """Copies the file source into the cache under key and evicts old entries if needed."""
+        temporary = temporary_file(self.directory)
+        try:
+            shutil.copyfile(source, temporary)
+            keep_mode(self.entry_path(key, suffix), temporary)
+            os.replace(temporary, self.entry_path(key, suffix))
+        except BaseException:
+            os.remove(temporary)
+            raise
+        self.evict()
+
+    def run(self, key, path, produce):
+        """
+        Makes sure the output file path holds the result for key.
+
+        On a hit the cached file is copied to path, on a miss produce() is called to write path
+        and the file is stored. Returns True on a hit.
+        """
+        suffix = output_suffix(path)
+        cached = self.lookup(key, suffix)
+        if cached is not None:
+            copy_atomic(cached, path)
+            return True
+        produce()
+        self.store(key, suffix, path)
+        return False
+
+    def arrays(self, key, compute):
+        """
+        Returns a dictionary of arrays for key, from the cache or from compute(), the same on a
+        hit and on a miss.
+
+        compute() returns a dictionary of numeric NumPy arrays (or a namedtuple of arrays), stored
+        as .npz. Raises ValueError for any other value, such as None or a nested namedtuple, which
+        could only be stored pickled.
+        """
+        cached = self.lookup(key, ".npz")
+        if cached is not None:
+            with np.load(cached, allow_pickle=False) as data:
+                return {name: data[name] for name in data.files}
+        result = compute()
+        arrays = result._asdict() if hasattr(result, "_asdict") else dict(result)
+        for name, value in arrays.items():
+            if not isinstance(value, np.ndarray) or value.dtype.kind not in "biufc":
+                raise ValueError(f"Cannot cache {name!r}: expected a numeric NumPy array, got {type(value).__name__}"
+                                 + (f" of {value.dtype}" if isinstance(value, np.ndarray) else ""))
+        temporary = temporary_file(self.directory, ".npz")
+        try:
+            with open(temporary, "wb") as file:
+                np.savez(file, **arrays)
+            keep_mode(self.entry_path(key, ".npz"), temporary)
+            os.replace(temporary, self.entry_path(key, ".npz"))
+        except BaseException:
+            os.remove(temporary)
+            raise
+        self.evict()
+        return arrays
+
+    def entries(self):
+        """Returns (last use, size, path) of every entry."""
+        entries = []
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                if entry.name.startswith(".") or not entry.is_file():
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue  # Evicted by another process
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        return entries
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        """Removes the least recently used entries until the directory fits in max_bytes."""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_bytes:
+            return
+        for _, size, path in sorted(entries):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def clear(self):
+        for _, _, path in self.entries():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def cached_call(cache, function, params, path, time_params=("start_time", "end_time"), ignore=()):
+    """
+    Calls function(**params) through cache to produce the output file path.
+
+    Parameters:
+    - cache: ResultCache.
+    - function: Simulation function writing path, called again with cache=None on a miss.
+    - params: Keyword arguments of the call, typically locals() at the top of the function.
+    - path: Output file the function writes.
+    - time_params: Parameters that anchor the output in time. They form the time base of the
+      key, and the first one must be given: outputs timestamped from datetime.utcnow() are never
+      the same twice, so they cannot be cached.
+    - ignore: Parameters that do not change the output, such as the output path, left out of the key.
+
+    Returns True on a cache hit.
+    """
+    params = {key: value for key, value in params.items() if key != "cache"}
+    if not params.get(time_params[0]):
+        raise ValueError(f"{function.__name__} needs an explicit {time_params[0]} to use a result cache")
+    time_base = [params[key] for key in time_params]
+    key_params = {key: value for key, value in params.items() if key not in time_params and key not in ignore}
+    key = cache_key(function.__name__, key_params, time_base)
+    return cache.run(key, path, lambda: function(**params))
+
+
+def output_suffix(path):
+    """Returns the full extension of an output file, e.g. ".kml.gz"."""
+    name = os.path.basename(path)
+    return name[name.index("."):] if "." in name else ""
+
+
+def copy_atomic(source, destination):
+    directory = os.path.dirname(os.path.abspath(destination))
+    temporary = temporary_file(directory)
+    try:
+        shutil.copyfile(source, temporary)
+        keep_mode(destination, temporary)
+        os.replace(temporary, destination)
+    except BaseException:
+        os.remove(temporary)
+        raise
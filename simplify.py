@@ -0,0 +1,84 @@
+# Description: Geometric simplification of emitted coordinate lists.
+# Douglas-Peucker line simplification, with distances measured in meters in a local
+# east/north/up frame around the first coordinate.
+
+import numpy as np
+
+from geodesy import geodetic_to_offset
+from trajectoryEngine import TrajectoryArrays
+
+
+def to_local_meters(lon, lat, h):
+    """Converts lon/lat/h arrays to (N, 3) east/north/up meters relative to the first point."""
+    lon, lat, h = np.asarray(lon, float), np.asarray(lat, float), np.asarray(h, float)
+    east, north = geodetic_to_offset(lat[0], lon[0], lat, lon)
+    return np.column_stack((east, north, h - h[0]))
+
+
+def segment_distances(points, start, end):
+    """Distances in meters of points[start + 1:end] from the line through points[start] and points[end]."""
+    a = points[start]
+    chord = points[end] - a
+    offsets = points[start + 1:end] - a
+    length = np.linalg.norm(chord)
+    if length == 0:
+        return np.linalg.norm(offsets, axis=1)
+    return np.linalg.norm(np.cross(offsets, chord), axis=1) / length
+
+
+def douglas_peucker(points, tolerance):
+    """
+    Douglas-Peucker simplification of a polyline.
+
+    Parameters:
+    - points: (N, 3) array of positions in meters.
+    - tolerance: Maximum distance in meters between the simplified line and any dropped point.
+
+    Returns:
+    - Boolean mask of the points to keep. The first and last points are always kept.
+    """
+    count = len(points)
+    keep = np.zeros(count, dtype=bool)
+    if count == 0:
+        return keep
+    keep[0] = keep[-1] = True
+    # Explicit stack instead of recursion, long tracks would exceed the recursion limit
+    stack = [(0, count - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        distances = segment_distances(points, start, end)
+        index = int(np.argmax(distances))
+        if distances[index] > tolerance:
+            split = start + 1 + index
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return keep
+
+
+def simplify_coords(coords, tolerance):
+    """
+    Simplifies a list of (lon, lat, h) coordinates.
+
+    Parameters:
+    - coords: List of (lon, lat, h) tuples, as emitted to KML.
+    - tolerance: Maximum deviation in meters.
+
+    Returns:
+    - The kept coordinates, in order.
+    """
+    if len(coords) < 3:
+        return list(coords)
+    lon, lat, h = zip(*coords)
+    keep = douglas_peucker(to_local_meters(lon, lat, h), tolerance)
+    return [coord for coord, kept in zip(coords, keep) if kept]
+
+
+def simplify_trajectory(trajectory, tolerance):
+    """Simplifies TrajectoryArrays, keeping the timestamps of the remaining samples."""
+    if trajectory.h.size < 3:
+        return trajectory
+    keep = douglas_peucker(to_local_meters(trajectory.lon, trajectory.lat, trajectory.h), tolerance)
+    return TrajectoryArrays(*(field[keep] for field in trajectory))
@@ -0,0 +1,26 @@
+import json
+
+from benchmark import Measurement, compare, from_json, run_benchmarks, to_json
+
+
+def test_compare_run_against_its_own_baseline():
+    results = run_benchmarks(["offset_to_geodetic", "vector_chain"], sizes=(100,), repeat=1)
+    baseline = from_json(json.loads(json.dumps(to_json(results))))
+    assert baseline == results
+    lines, regressions = compare(baseline, results)
+    assert regressions == 0
+    assert len(lines) == 3
+    assert lines[1].split()[:2] == ["offset_to_geodetic", "100"]
+
+
+def test_compare_flags_regressions():
+    baseline = {"projectile": {100: Measurement(0.010, 1000, 0), 1000: Measurement(0.100, 1000, 0)},
+                "circle": {100: Measurement(0.0001, 1000, 0)}}
+    results = {"projectile": {100: Measurement(0.010, 2000, 0), 1000: Measurement(0.150, 1000, 0), 10000: Measurement(1.0, 1000, 0)},
+               "circle": {100: Measurement(0.0005, 1000, 0)}}
+    lines, regressions = compare(baseline, results)
+    # Twice the memory and 50 % slower count, a 0.4 ms slowdown is below min_seconds and sizes
+    # missing from the baseline are skipped
+    assert regressions == 2
+    assert len(lines) == 4
+    assert sum("REGRESSION" in line for line in lines) == 2
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from geodesy import DEFAULT_MAX_ERROR, enu_to_geodetic, geodetic_to_enu, geodetic_to_offset, offset_to_geodetic
+
+ORIGINS = [(0.0, 0.0), (38.662463, -121.125643), (-60.0, 170.0), (80.0, 10.0)]
+
+
+@pytest.mark.parametrize("lat0, lon0", ORIGINS)
+@pytest.mark.parametrize("distance", [10.0, 1000.0, 50000.0])
+def test_offset_round_trip_within_max_error(lat0, lon0, distance):
+    angles = np.radians(np.arange(0, 360, 30))
+    east, north = distance * np.sin(angles), distance * np.cos(angles)
+    for max_error, tolerance in ((DEFAULT_MAX_ERROR, DEFAULT_MAX_ERROR), (1.0, 1.0), (None, 1e-6)):
+        lat, lon = offset_to_geodetic(lat0, lon0, east, north, max_error=max_error)
+        back_east, back_north = geodetic_to_offset(lat0, lon0, lat, lon)
+        assert np.max(np.hypot(back_east - east, back_north - north)) <= tolerance
+
+
+@pytest.mark.parametrize("lat0, lon0", ORIGINS)
+def test_scalar_and_vectorized_conversions_agree(lat0, lon0):
+    east = np.array([0.0, 120.0, -3500.0, 20000.0])
+    north = np.array([0.0, -80.0, 1500.0, -7000.0])
+    lat, lon = offset_to_geodetic(lat0, lon0, east, north)
+    for index in range(east.size):
+        # A single short offset may take the flat approximation where the array took the exact
+        # conversion, both are within max_error of the exact point
+        scalar_lat, scalar_lon = offset_to_geodetic(lat0, lon0, float(east[index]), float(north[index]))
+        exact_lat, exact_lon = offset_to_geodetic(lat0, lon0, float(east[index]), float(north[index]), max_error=None)
+        for point_lat, point_lon in ((scalar_lat, scalar_lon), (lat[index], lon[index])):
+            error_east, error_north = geodetic_to_enu(exact_lat, exact_lon, 0.0, point_lat, point_lon, 0.0)[:2]
+            assert np.hypot(error_east, error_north) <= DEFAULT_MAX_ERROR
+
+
+def test_enu_round_trip():
+    east, north, up = np.array([10.0, -2500.0, 40000.0]), np.array([5.0, 900.0, -12000.0]), np.array([0.0, 300.0, 8000.0])
+    lat, lon, h = enu_to_geodetic(38.66, -121.13, 120.0, east, north, up)
+    back = geodetic_to_enu(38.66, -121.13, 120.0, lat, lon, h)
+    np.testing.assert_allclose(back, (east, north, up), rtol=0, atol=1e-6)
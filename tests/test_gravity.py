@@ -0,0 +1,94 @@
+import json
+import os
+import stat
+import subprocess
+import sys
+
+import pytest
+
+import gravity
+from gravity import GravityCache, GravityProvider, NoaaGravityBackend, normal_gravity, parse_gravity_response
+from gravityStub import StubGravityServer
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_parse_reads_the_gravity_field_in_mgal():
+    payload = json.dumps({"lat": 40.0, "lon": -80.0, "eht": 980.0, "gravity": 980012.5})
+    assert parse_gravity_response(payload) == pytest.approx(9.800125)
+
+
+def test_parse_ignores_height_in_the_gravity_range():
+    # eht of 975 m scaled to mGal looks like gravity, it must never be picked up
+    with pytest.raises(ValueError):
+        parse_gravity_response({"lat": 40.0, "lon": -80.0, "eht": 975.0})
+
+
+def test_parse_custom_key():
+    assert parse_gravity_response(b'{"g": 979000.0, "eht": 980.0}', key="g") == pytest.approx(9.79)
+
+
+def test_lookup_against_stub():
+    with StubGravityServer() as server:
+        backend = NoaaGravityBackend(server.url)
+        g = backend.lookup(40.0, -80.0, 980.0)
+    assert g == pytest.approx(float(normal_gravity(40.0, 980.0)))
+    assert server.requests == 1
+
+
+def test_provider_caches_stub_lookups():
+    with StubGravityServer() as server:
+        provider = GravityProvider(NoaaGravityBackend(server.url), fallback=False)
+        first = provider.gravity([40.0, 10.0], [-80.0, 5.0], 975.0)
+        second = provider.gravity([40.0, 10.0], [-80.0, 5.0], 975.0)
+    assert first == pytest.approx(normal_gravity([40.0, 10.0], 975.0), abs=1e-4)
+    assert (second == first).all()
+    assert server.requests == 2
+
+
+def test_lookup_many_against_stub():
+    points = [(40.0, -80.0, 980.0), (10.0, 5.0, 975.0), (-33.0, 151.0, 0.0)]
+    with StubGravityServer() as server:
+        values = NoaaGravityBackend(server.url).lookup_many(points)
+    assert values == pytest.approx([float(normal_gravity(lat, h)) for lat, _, h in points])
+    assert server.requests == len(points)
+
+
+def test_lookup_many_first_use_in_threads():
+    # The urllib modules are imported lazily, the first lookup_many of a process executes them
+    # while its worker threads are about to use them
+    script = (
+        "from gravity import NoaaGravityBackend\n"
+        "from gravityStub import StubGravityServer\n"
+        "with StubGravityServer() as server:\n"
+        "    print(NoaaGravityBackend(server.url).lookup_many([(40.0, -80.0, 980.0)] * 8))\n"
+    )
+    result = subprocess.run([sys.executable, "-c", script], cwd=REPOSITORY, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert len(json.loads(result.stdout)) == 8
+
+
+def test_cache_save_permissions_and_failure(tmp_path, monkeypatch):
+    path = tmp_path / "gravity_cache.json"
+    cache = GravityCache(str(path))
+    cache.put((4000, -8000, 98), 9.8)
+    umask = os.umask(0o022)
+    try:
+        cache.save()
+    finally:
+        os.umask(umask)
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o644
+
+    cache.put((1000, 500, 97), 9.78)
+
+    def fail(*args, **kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(gravity.json, "dump", fail)
+    with pytest.raises(OSError):
+        cache.save()
+    assert os.listdir(tmp_path) == ["gravity_cache.json"]
+    monkeypatch.undo()
+    # The failed save left the cache dirty, the next one writes the new entry
+    cache.save()
+    assert (1000, 500, 97) in GravityCache(str(path)).entries
@@ -0,0 +1,17 @@
+from datetime import datetime
+
+import pytest
+
+import instrumentation
+from instrumentation import SAMPLES
+from projectileMotion import simulate_freefall, simulate_projectile_motion
+
+
+@pytest.mark.parametrize("options", [{}, {"track": True}, {"stream": True}, {"stream": True, "track": True}])
+def test_samples_counted_once_per_simulation(tmp_path, monkeypatch, options):
+    monkeypatch.chdir(tmp_path)
+    with instrumentation.instrumented() as metrics:
+        simulate_projectile_motion(38.66, -121.13, 0, 50, 45, 90, 8, 100, "projectile", datetime(2024, 1, 1), **options)
+        simulate_freefall(38.66, -121.13, 100, 4, 100, "freefall", datetime(2024, 1, 1), **options)
+    # The projectile lands after 92 of its 101 samples, the free fall keeps all 101
+    assert metrics.counters[SAMPLES] == 92 + 101
@@ -0,0 +1,25 @@
+import os
+import stat
+
+import pytest
+
+from kmlOutput import atomic_kml_output
+
+
+def test_atomic_output_mode_and_cleanup(tmp_path):
+    path = tmp_path / "out.kml"
+    umask = os.umask(0o027)
+    try:
+        with atomic_kml_output(path) as output:
+            output.write("<kml/>")
+    finally:
+        os.umask(umask)
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o640
+    os.chmod(path, 0o644)
+    with pytest.raises(RuntimeError):
+        with atomic_kml_output(path) as output:
+            output.write("partial")
+            raise RuntimeError
+    assert path.read_text() == "<kml/>"
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o644
+    assert os.listdir(tmp_path) == ["out.kml"]
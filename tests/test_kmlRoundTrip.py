@@ -0,0 +1,41 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from kmlReader import read_kml, timed_trajectory
+from projectileMotion import simulate_projectile_motion
+
+LAUNCH = (38.662463, -121.125643, 5.0, 50.0, 45.0, 90.0, 8.0, 40)
+START_TIME = datetime(2024, 1, 1)
+
+
+def write(directory, monkeypatch, **options):
+    monkeypatch.chdir(directory)
+    trajectory = simulate_projectile_motion(*LAUNCH, "shot", START_TIME, **options)
+    extension = {"kml": ".kml", "kmz": ".kmz", "gzip": ".kml.gz"}[options.get("output_format", "kml")]
+    return read_kml(str(directory / f"shot{extension}")), trajectory
+
+
+@pytest.mark.parametrize("options", [{}, {"track": True, "output_format": "kmz"}, {"output_format": "gzip"}])
+def test_stream_and_simplekml_documents_match(tmp_path, monkeypatch, options):
+    (tmp_path / "tree").mkdir()
+    (tmp_path / "stream").mkdir()
+    built, trajectory = write(tmp_path / "tree", monkeypatch, **options)
+    streamed, _ = write(tmp_path / "stream", monkeypatch, stream=True, **options)
+
+    assert streamed.geometry == built.geometry
+    np.testing.assert_array_equal(streamed.offsets, built.offsets)
+    for column in ("lon", "lat", "h"):
+        np.testing.assert_allclose(getattr(streamed, column), getattr(built, column), rtol=0, atol=1e-9)
+    np.testing.assert_array_equal(streamed.when, built.when)
+    np.testing.assert_array_equal(streamed.begin, built.begin)
+    np.testing.assert_array_equal(streamed.end, built.end)
+
+    # The timed samples read back are the simulated trajectory
+    samples = timed_trajectory(streamed)
+    assert len(samples) == len(trajectory)
+    np.testing.assert_allclose(samples.lon, trajectory.lon, rtol=0, atol=1e-9)
+    np.testing.assert_allclose(samples.lat, trajectory.lat, rtol=0, atol=1e-9)
+    np.testing.assert_allclose(samples.h, trajectory.h, rtol=0, atol=1e-6)
+    np.testing.assert_allclose(samples.t, trajectory.t, rtol=0, atol=1e-6)
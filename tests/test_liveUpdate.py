@@ -0,0 +1,35 @@
+from liveUpdate import LiveFeature, LiveUpdateService
+
+
+def feature(index, h):
+    return LiveFeature(f"vector-{index}", f"Vector {index}", [(-121.0, 38.0, 0.0), (-121.0 + index / 1000, 38.0, h)])
+
+
+def changes(service):
+    with open(service.path("_update"), encoding="utf-8") as file:
+        return file.read().count("<Change>")
+
+
+def test_rebase_update_carries_every_feature(tmp_path):
+    service = LiveUpdateService(lambda: [], "v", directory=tmp_path, resync_interval=0)
+    assert service.publish([feature(1, 10.0), feature(2, 20.0)])
+    assert changes(service) == 2
+    # Every publish rebases, viewers still on the previous base get all coordinates
+    assert service.publish([feature(1, 15.0), feature(2, 20.0)])
+    update = (tmp_path / "v_update.kml").read_text(encoding="utf-8")
+    assert update.count("<Change>") == 2
+    assert "-120.999,38.0,15.0" in update
+
+
+def test_update_after_rebase_includes_changes_from_previous_base(tmp_path):
+    service = LiveUpdateService(lambda: [], "v", directory=tmp_path, resync_interval=3600)
+    service.publish([feature(1, 10.0), feature(2, 20.0)])
+    service.publish([feature(1, 15.0), feature(2, 20.0)])
+    assert changes(service) == 1
+    # New ids rebase, the next updates still cover viewers showing the previous base
+    service.publish([feature(1, 15.0), feature(2, 20.0), feature(3, 30.0)])
+    assert changes(service) == 3
+    service.publish([feature(1, 15.0), feature(2, 20.0), feature(3, 35.0)])
+    assert changes(service) == 2  # 1 differs from the previous base, 3 is not in it
+    service.publish([feature(1, 10.0), feature(2, 20.0), feature(3, 30.0)])
+    assert changes(service) == 2  # 1 differs from the new base, 3 is still not in the previous one
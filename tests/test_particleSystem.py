@@ -0,0 +1,16 @@
+import numpy as np
+
+from particleSystem import ParticleSystem
+
+
+def test_tracks_end_at_ground_contact():
+    system = ParticleSystem(38.66, -121.13, 9.80665)
+    system.launch(38.66, -121.13, 0, [20.0, 30.0, 40.0], 45, 90)
+    # Landings fall between recorded frames, the last one after the last multiple of record_every
+    run = system.run(10, 0.01, record_every=7)
+    for index in range(3):
+        last = np.flatnonzero(~np.isnan(run.tracks.h[index]))[-1]
+        assert run.tracks.h[index, last] == 0.0
+        assert run.tracks.lat[index, last] == run.impact_lat[index]
+        assert run.tracks.lon[index, last] == run.impact_lon[index]
+        assert 0 <= run.tracks.elapsed[last] - run.landed_time[index] < 7 * 0.01
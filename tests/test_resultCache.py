@@ -0,0 +1,50 @@
+import os
+import stat
+
+import numpy as np
+import pytest
+
+from resultCache import ResultCache, copy_atomic
+from trajectoryEngine import simulate_projectile_batch
+
+
+def test_arrays_hit_matches_miss(tmp_path):
+    cache = ResultCache(tmp_path / "cache")
+    summary = simulate_projectile_batch(40.0, -80.0, 0.0, [20.0, 30.0], 45.0, 0.0, 5.0, 50)
+    miss = cache.arrays("batch", lambda: summary._replace(tracks=np.zeros(0)))
+    hit = cache.arrays("batch", lambda: pytest.fail("computed on a hit"))
+    assert type(hit) is type(miss) is dict
+    assert miss.keys() == hit.keys()
+    for name in miss:
+        np.testing.assert_array_equal(miss[name], hit[name])
+
+
+@pytest.mark.parametrize("value", [None, [1.0, 2.0], np.array(["a", "b"]), np.array([None], dtype=object)])
+def test_arrays_rejects_non_numeric_fields(tmp_path, value):
+    cache = ResultCache(tmp_path / "cache")
+    with pytest.raises(ValueError):
+        cache.arrays("bad", lambda: {"range": np.zeros(2), "tracks": value})
+    assert cache.entries() == []
+
+
+def test_arrays_rejects_summary_without_tracks(tmp_path):
+    cache = ResultCache(tmp_path / "cache")
+    summary = simulate_projectile_batch(40.0, -80.0, 0.0, [20.0, 30.0], 45.0, 0.0, 5.0, 50)
+    assert summary.tracks is None
+    with pytest.raises(ValueError, match="tracks"):
+        cache.arrays("batch", lambda: summary)
+
+
+def test_copy_atomic_keeps_permissions(tmp_path):
+    source = tmp_path / "source.kml"
+    source.write_text("<kml/>")
+    destination = tmp_path / "out.kml"
+    umask = os.umask(0o022)
+    try:
+        copy_atomic(source, destination)
+        assert stat.S_IMODE(os.stat(destination).st_mode) == 0o644
+        os.chmod(destination, 0o640)
+        copy_atomic(source, destination)
+        assert stat.S_IMODE(os.stat(destination).st_mode) == 0o640
+    finally:
+        os.umask(umask)
@@ -0,0 +1,52 @@
+import math
+
+import numpy as np
+import pytest
+
+from geodesy import DEFAULT_MAX_ERROR, geodetic_to_offset
+from trajectoryEngine import GRAVITY_CONSTANT, simulate_projectile_batch, solve_projectile
+
+# (h0, v0, elevation, azimuth) of a few launches, including a drop and a shot downwards
+LAUNCHES = [(0.0, 50.0, 45.0, 90.0), (10.0, 80.0, 70.0, 30.0), (100.0, 0.0, 0.0, 0.0), (25.0, 30.0, -10.0, 200.0)]
+LAT, LON = 38.662463, -121.125643
+
+
+def reference(h0, v0, elevation, azimuth, g=GRAVITY_CONSTANT):
+    """Scalar closed form: (time of flight, range, apex, east velocity, north velocity, vertical velocity)."""
+    vh = v0 * math.cos(math.radians(elevation))
+    vz = v0 * math.sin(math.radians(elevation))
+    time_of_flight = (vz + math.sqrt(vz * vz + 2 * g * h0)) / g
+    apex = h0 + vz * vz / (2 * g) if vz > 0 else h0
+    return time_of_flight, vh * time_of_flight, apex, vh * math.sin(math.radians(azimuth)), vh * math.cos(math.radians(azimuth)), vz
+
+
+def test_batch_summaries_match_scalar_closed_form():
+    h0, v0, elevation, azimuth = np.array(LAUNCHES).T
+    summary = simulate_projectile_batch(LAT, LON, h0, v0, elevation, azimuth, 30.0, 300)
+    for index, launch in enumerate(LAUNCHES):
+        time_of_flight, distance, apex, vx, vy, _ = reference(*launch)
+        assert summary.time_of_flight[index] == pytest.approx(time_of_flight, rel=1e-12)
+        assert summary.range[index] == pytest.approx(distance, rel=1e-12, abs=1e-12)
+        assert summary.apex[index] == pytest.approx(apex, rel=1e-12)
+        east, north = geodetic_to_offset(LAT, LON, summary.impact_lat[index], summary.impact_lon[index])
+        assert math.hypot(east - vx * time_of_flight, north - vy * time_of_flight) <= DEFAULT_MAX_ERROR
+
+
+def test_solve_projectile_starting_below_ground():
+    solution = solve_projectile(LAT, LON, -1.0, 10.0, 45.0, 0.0)
+    assert np.isnan(solution.time_of_flight) and np.isnan(solution.range)
+
+
+def test_batch_tracks_match_per_sample_math():
+    h0, v0, elevation, azimuth = np.array(LAUNCHES).T
+    tracks = simulate_projectile_batch(LAT, LON, h0, v0, elevation, azimuth, 30.0, 300, return_tracks=True).tracks
+    for index, launch in enumerate(LAUNCHES):
+        time_of_flight, _, _, vx, vy, vz = reference(*launch)
+        for sample in range(0, tracks.elapsed.size, 7):
+            t = float(tracks.elapsed[sample])
+            if t > time_of_flight:
+                assert np.isnan(tracks.h[index, sample])
+                continue
+            assert tracks.h[index, sample] == pytest.approx(launch[0] + vz * t - 0.5 * GRAVITY_CONSTANT * t * t, abs=1e-9)
+            east, north = geodetic_to_offset(LAT, LON, tracks.lat[index, sample], tracks.lon[index, sample])
+            assert math.hypot(east - vx * t, north - vy * t) <= DEFAULT_MAX_ERROR
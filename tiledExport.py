@@ -0,0 +1,233 @@
+# Description: Tiled export of large multi-trajectory scenes.
+# Trajectories and vectors are bucketed by the Web Mercator tile (quadkey) of their starting
+# point and by time window. Every bucket is written to its own small KML file, and a root
+# document links them with NetworkLinks whose Regions and TimeSpans let Google Earth fetch only
+# the tiles that are in view and in the visible time range.
+#
+# Usage:
+#     exporter = TiledExporter("scene", level=12, window_seconds=3600)
+#     exporter.add_projectile(38.66, -121.13, 0, 200, 45, 90, 60, 600, "Shot 1", start_time)
+#     exporter.write()  # scene/scene.kml links scene/tiles/*.kml
+
+import math
+import os
+from collections import namedtuple
+from datetime import timedelta
+
+import numpy as np
+
+from geodesy import offset_to_geodetic
+from kmlOutput import open_kml_output, output_path
+from kmlWriter import RED, RELATIVE_TO_GROUND, KmlStreamWriter, Region
+from projectileMotion import GRAVITY_CONSTANT, create_vector
+from trajectory import Trajectory, datetime64_to_seconds
+from trajectoryEngine import format_kml_times, projectile_trajectory
+
+# Earth latitude limit of the Web Mercator tiles
+MAX_LATITUDE = 85.05112878
+
+# One feature of the scene.
+# - kind: "trajectory" or "vector"
+# - name: Placemark name
+# - lat, lon: starting point, which decides the tile
+# - begin, end: time span in POSIX seconds, NaN when untimed
+# - north, south, east, west: bounding box in degrees
+# - payload: Trajectory for a trajectory, the create_vector arguments for a vector
+TileItem = namedtuple("TileItem", ["kind", "name", "lat", "lon", "begin", "end", "north", "south", "east", "west", "payload"])
+
+
+def tile_xy(lat, lon, level):
+    """Returns the integer Web Mercator tile x and y at a zoom level for arrays of points."""
+    n = 2 ** level
+    lat = np.radians(np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE))
+    x = np.floor((np.asarray(lon, dtype=float) + 180) / 360 * n)
+    y = np.floor((1 - np.log(np.tan(lat) + 1 / np.cos(lat)) / np.pi) / 2 * n)
+    return np.clip(x, 0, n - 1).astype(np.int64), np.clip(y, 0, n - 1).astype(np.int64)
+
+
+def quadkey(x, y, level):
+    """Returns the Bing Maps quadkey of tile (x, y), e.g. quadkey(3, 5, 3) == "213"."""
+    digits = []
+    for bit in range(level, 0, -1):
+        mask = 1 << (bit - 1)
+        digits.append(str((1 if x & mask else 0) + (2 if y & mask else 0)))
+    return "".join(digits)
+
+
+def quadkey_tile(key):
+    """Returns the tile (x, y, level) of a quadkey, the inverse of quadkey."""
+    x = y = 0
+    for digit in key:
+        x = 2 * x + (int(digit) & 1)
+        y = 2 * y + (int(digit) >> 1)
+    return x, y, len(key)
+
+
+def tile_bounds(x, y, level):
+    """Returns the (north, south, east, west) bounds in degrees of tile (x, y)."""
+    n = 2 ** level
+
+    def latitude(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return latitude(y), latitude(y + 1), (x + 1) / n * 360 - 180, x / n * 360 - 180
+
+
+def format_seconds(seconds):
+    return format_kml_times(np.array([round(seconds * 1e6)], dtype="datetime64[us]"))[0]
+
+
+def write_item(writer, item):
+    if item.kind == "vector":
+        create_vector(writer, item.name, *item.payload)
+        return
+    trajectory = item.payload
+    # The same gx:Track, or path line when untimed, as simulate_projectile_motion(track=True)
+    style_id = writer.style(line_color=RED, line_width=3)
+    if math.isnan(item.begin):
+        writer.linestring(trajectory.coords(), name=item.name, style_id=style_id, altitudemode=RELATIVE_TO_GROUND)
+    else:
+        writer.track(format_kml_times(trajectory.when), trajectory.coords(), name=item.name, style_id=style_id,
+                     altitudemode=RELATIVE_TO_GROUND)
+
+
+def write_tile(path, items):
+    """Writes the features of one tile to path."""
+    with open_kml_output(path) as output, KmlStreamWriter(output) as writer:
+        for item in items:
+            write_item(writer, item)
+    return path
+
+
+class TiledExporter:
+    """
+    Collects trajectories and vectors and writes them as a tiled scene.
+
+    Parameters:
+    - directory: Output directory, the tiles go into its "tiles" subdirectory.
+    - name: Name of the root document, written as directory/{name}.kml.
+    - level: Tile zoom level. Level 12 tiles are about 10 km wide at mid latitudes.
+    - window_seconds: Length of the time windows in seconds, aligned to the Unix epoch. None puts
+      all times in one window.
+    - min_lod_pixels: Projected size in pixels above which a tile is fetched.
+    - output_format: "kml", "kmz" or "gzip" for the tiles.
+    """
+
+    def __init__(self, directory, name="scene", level=12, window_seconds=None, min_lod_pixels=128, output_format="kml"):
+        self.directory = directory
+        self.name = name
+        self.level = level
+        self.window_seconds = window_seconds
+        self.min_lod_pixels = min_lod_pixels
+        self.output_format = output_format
+        self.items = []
+
+    def add_trajectory(self, trajectory, name):
+        """Adds a trajectory.Trajectory whose t column is POSIX time, written as a gx:Track."""
+        self.add_samples(trajectory, name, timed=True)
+
+    def add_untimed_trajectory(self, trajectory, name):
+        """Adds a trajectory.Trajectory whose t column is not a wall-clock time, written as a path line."""
+        self.add_samples(trajectory, name, timed=False)
+
+    def add_samples(self, trajectory, name, timed):
+        if len(trajectory) == 0:
+            return
+        begin, end = (float(trajectory.t[0]), float(trajectory.t[-1])) if timed else (math.nan, math.nan)
+        self.items.append(TileItem(
+            "trajectory", name, float(trajectory.lat[0]), float(trajectory.lon[0]), begin, end,
+            float(trajectory.lat.max()), float(trajectory.lat.min()), float(trajectory.lon.max()), float(trajectory.lon.min()),
+            trajectory,
+        ))
+
+    def add_projectile(self, lat, lon, h0, v0, elevation_angle_deg, azimuth_angle_deg, duration, intervals, name,
+                       start_time, end_time=None, g=GRAVITY_CONSTANT):
+        """Adds the trajectory simulate_projectile_motion would write for the same parameters."""
+        if end_time is None:
+            end_time = start_time + timedelta(seconds=duration)
+        arrays = projectile_trajectory(lat, lon, h0, v0, elevation_angle_deg, azimuth_angle_deg, duration, intervals,
+                                       start_time, end_time, g)
+        self.add_trajectory(Trajectory.from_arrays(arrays), name)
+
+    def add_batch(self, tracks, start_time=None, names=None):
+        """
+        Adds the tracks of simulate_projectile_batch(..., return_tracks=True), one trajectory per launch.
+        Without start_time the tracks are untimed path lines.
+        """
+        t = tracks.elapsed + (datetime64_to_seconds(np.datetime64(start_time, "us")) if start_time is not None else 0.0)
+        for index in range(tracks.h.shape[0]):
+            valid = ~np.isnan(tracks.h[index])
+            trajectory = Trajectory.from_columns(t[valid], tracks.lon[index, valid], tracks.lat[index, valid], tracks.h[index, valid])
+            self.add_samples(trajectory, names[index] if names else f"Launch {index + 1}", timed=start_time is not None)
+
+    def add_vector(self, name, lat, lon, delta_i, delta_j, h1=0, h2=0, start_time=None, end_time=None):
+        """Adds a vector like projectileMotion.create_vector, delta_i meters east and delta_j meters north."""
+        end_lat, end_lon = (float(value) for value in offset_to_geodetic(lat, lon, delta_i, delta_j))
+        timed = start_time is not None and end_time is not None
+        begin = datetime64_to_seconds(np.datetime64(start_time, "us")) if timed else math.nan
+        end = datetime64_to_seconds(np.datetime64(end_time, "us")) if timed else math.nan
+        self.items.append(TileItem(
+            "vector", name, lat, lon, float(begin), float(end),
+            max(lat, end_lat), min(lat, end_lat), max(lon, end_lon), min(lon, end_lon),
+            (lat, lon, delta_i, delta_j, h1, h2, start_time, end_time),
+        ))
+
+    def buckets(self):
+        """Returns {(quadkey, window): [TileItem]} with window None for untimed items."""
+        lat = np.array([item.lat for item in self.items])
+        lon = np.array([item.lon for item in self.items])
+        x, y = tile_xy(lat, lon, self.level)
+        buckets = {}
+        for item, tile_x, tile_y in zip(self.items, x.tolist(), y.tolist()):
+            if math.isnan(item.begin):
+                window = None
+            else:
+                window = int(item.begin // self.window_seconds) if self.window_seconds else 0
+            buckets.setdefault((quadkey(tile_x, tile_y, self.level), window), []).append(item)
+        return buckets
+
+    def write(self, workers=1):
+        """
+        Writes the tiles and the root document and returns the path of the root document.
+
+        Parameters:
+        - workers: Number of worker processes writing tiles, os.cpu_count() for None.
+        """
+        tile_directory = os.path.join(self.directory, "tiles")
+        os.makedirs(tile_directory, exist_ok=True)
+        links = []
+        jobs = []
+        # Tiles in quadkey order, untimed items first, then the time windows in order
+        buckets = self.buckets()
+        for key, window in sorted(buckets, key=lambda bucket: (bucket[0], bucket[1] is not None, bucket[1] or 0)):
+            items = buckets[key, window]
+            file_name = output_path(f"{self.name}_{key}" + ("" if window is None else f"_{window}"), self.output_format)
+            # The tile cell, grown to the features that leave it. A Region from the features alone
+            # would be a sliver for a shot straight east or up, too thin to ever reach min_lod_pixels.
+            north, south, east, west = tile_bounds(*quadkey_tile(key))
+            region = Region(
+                max(north, *(item.north for item in items)), min(south, *(item.south for item in items)),
+                max(east, *(item.east for item in items)), min(west, *(item.west for item in items)),
+                self.min_lod_pixels, -1,
+            )
+            begin = end = None
+            if window is not None:
+                begin = format_seconds(min(item.begin for item in items))
+                end = format_seconds(max(item.end for item in items))
+            links.append((f"tiles/{file_name}", f"{key} {window}" if window is not None else key, region, begin, end))
+            jobs.append((os.path.join(tile_directory, file_name), items))
+
+        if workers == 1 or len(jobs) < 2:
+            for path, items in jobs:
+                write_tile(path, items)
+        else:
+            # Imported here, multiprocessing is slow to import and only needed for parallel runs
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                list(executor.map(write_tile, *zip(*jobs)))
+
+        root = os.path.join(self.directory, output_path(self.name))
+        with open_kml_output(root) as output, KmlStreamWriter(output) as writer:
+            for href, name, region, begin, end in links:
+                writer.network_link(href, name=name, region=region, begin=begin, end=end)
+        return root
@@ -0,0 +1,191 @@
+# Description: Compact array-backed trajectory container.
+# A Trajectory keeps its samples in one C-contiguous float64 block with one row per column
+# (t, lon, lat, h and optionally the east, north and up velocity), so every column is a
+# contiguous array, slices are views and NumPy, buffer consumers and memory-mapped .npy files
+# use the samples without copying them or building a tuple per point.
+
+import numpy as np
+
+from trajectoryEngine import TrajectoryArrays
+
+POSITION_COLUMNS = ("t", "lon", "lat", "h")
+VELOCITY_COLUMNS = ("ve", "vn", "vu")
+
+
+class Trajectory:
+    """
+    Trajectory samples stored column by column in a (columns, samples) float64 array.
+
+    Columns:
+    - t: POSIX time in seconds (UTC), or any other time in seconds for untimed trajectories.
+    - lon, lat: degrees.
+    - h: height above ground in meters.
+    - ve, vn, vu: optional east, north and up velocity in m/s.
+
+    Usage:
+        trajectory = Trajectory.from_arrays(projectile_trajectory(...))
+        trajectory[100:200].h        # View, no copy
+        np.asarray(trajectory)       # (samples, columns) view
+        trajectory.save("shot.npy")
+        Trajectory.load("shot.npy", mmap=True)
+
+    Parameters:
+    - data: Array of shape (4, N) or (7, N), with the velocity rows in the second case. Float64
+      arrays, including views of another Trajectory, are used without copying.
+    """
+
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        data = np.asanyarray(data)
+        if data.ndim != 2 or data.shape[0] not in (len(POSITION_COLUMNS), len(POSITION_COLUMNS) + len(VELOCITY_COLUMNS)):
+            raise ValueError(f"Trajectory data must have shape (4, N) or (7, N), got {data.shape}")
+        if data.dtype != np.float64:
+            data = np.ascontiguousarray(data, dtype=np.float64)
+        self.data = data
+
+    @classmethod
+    def from_columns(cls, t, lon, lat, h, velocity=None):
+        """
+        Builds a Trajectory from 1-D columns, copied into one block.
+
+        Parameters:
+        - t, lon, lat, h: Columns of the same length.
+        - velocity: Optional (ve, vn, vu) columns.
+        """
+        columns = [t, lon, lat, h] + (list(velocity) if velocity is not None else [])
+        return cls(np.stack([np.asarray(column, dtype=np.float64) for column in columns]))
+
+    @classmethod
+    def from_arrays(cls, arrays, velocity=None):
+        """Builds a Trajectory from the TrajectoryArrays of the engine, with optional (ve, vn, vu) columns."""
+        return cls.from_columns(datetime64_to_seconds(arrays.when), arrays.lon, arrays.lat, arrays.h, velocity)
+
+    @classmethod
+    def empty(cls, length, velocity=False):
+        return cls(np.empty((len(columns(velocity)), length)))
+
+    @property
+    def columns(self):
+        return columns(self.has_velocity)
+
+    @property
+    def has_velocity(self):
+        return self.data.shape[0] > len(POSITION_COLUMNS)
+
+    @property
+    def t(self):
+        return self.data[0]
+
+    @property
+    def lon(self):
+        return self.data[1]
+
+    @property
+    def lat(self):
+        return self.data[2]
+
+    @property
+    def h(self):
+        return self.data[3]
+
+    @property
+    def velocity(self):
+        """The (3, N) view of the east, north and up velocity, None without velocity columns."""
+        return self.data[4:] if self.has_velocity else None
+
+    @property
+    def when(self):
+        """The t column as datetime64[us] timestamps."""
+        return seconds_to_datetime64(self.t)
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    def __len__(self):
+        return self.data.shape[1]
+
+    def __getitem__(self, index):
+        """
+        A slice returns a Trajectory viewing the same memory (its columns stay contiguous for a step
+        of 1), an integer returns the sample as a tuple of floats, and an index or boolean array
+        returns a Trajectory copy of the selected samples.
+        """
+        if isinstance(index, (int, np.integer)):
+            return tuple(self.data[:, index].tolist())
+        return Trajectory(self.data[:, index])
+
+    def __array__(self, dtype=None, copy=None):
+        # (samples, columns) view of the column block
+        array = self.data.T
+        if dtype is not None and np.dtype(dtype) != array.dtype:
+            return array.astype(dtype)
+        return array.copy() if copy else array
+
+    def __buffer__(self, flags):
+        # Buffer protocol on Python 3.12+, memoryview(trajectory.data) on older versions.
+        # Sliced views are strided, consumers that need one contiguous buffer use copy() first.
+        return memoryview(self.data)
+
+    def __repr__(self):
+        return f"Trajectory({len(self)} samples, columns={self.columns})"
+
+    def to_arrays(self):
+        """Returns the TrajectoryArrays the KML writers consume, without copying lon, lat and h."""
+        return TrajectoryArrays(self.when, self.lon, self.lat, self.h)
+
+    def coords(self):
+        """Yields (lon, lat, h) tuples of plain floats."""
+        return zip(self.lon.tolist(), self.lat.tolist(), self.h.tolist())
+
+    def copy(self):
+        return Trajectory(self.data.copy())
+
+    def save(self, path):
+        """Saves the column block to a .npy file."""
+        np.save(path, self.data, allow_pickle=False)
+
+    @classmethod
+    def load(cls, path, mmap=False):
+        """
+        Loads a Trajectory saved with save.
+
+        With mmap=True the file is memory-mapped read-only, so only the samples that are used are read.
+        """
+        return cls(np.load(path, mmap_mode="r" if mmap else None, allow_pickle=False))
+
+    @classmethod
+    def create(cls, path, length, velocity=False):
+        """
+        Creates a .npy file of length samples and returns a Trajectory memory-mapped onto it.
+
+        Fill it slice by slice, e.g. trajectory.data[:, start:stop] = block, then call flush().
+        The file can be larger than memory.
+        """
+        return cls(np.lib.format.open_memmap(path, mode="w+", dtype=np.float64, shape=(len(columns(velocity)), length)))
+
+    def flush(self):
+        if isinstance(self.data, np.memmap):
+            self.data.flush()
+
+    @classmethod
+    def concatenate(cls, trajectories):
+        trajectories = list(trajectories)
+        if not trajectories:
+            return cls.empty(0)
+        return cls(np.concatenate([trajectory.data for trajectory in trajectories], axis=1))
+
+
+def columns(velocity=False):
+    return POSITION_COLUMNS + VELOCITY_COLUMNS if velocity else POSITION_COLUMNS
+
+
+def datetime64_to_seconds(when):
+    """Converts datetime64 timestamps to POSIX seconds."""
+    return np.asarray(when, dtype="datetime64[us]").astype(np.int64) / 1e6
+
+
+def seconds_to_datetime64(seconds):
+    """Converts POSIX seconds to datetime64[us], exact for timestamps that came from datetime64[us]."""
+    return np.round(np.asarray(seconds) * 1e6).astype(np.int64).astype("datetime64[us]")
@@ -0,0 +1,463 @@
+# Description: Array-based trajectory engine used by the KML generators.
+# Computes the whole time grid, displacements and ground cutoff with NumPy instead of one Python
+# iteration per sample. Displacements are converted to lat/lon with geodesy.offset_to_geodetic.
+
+import math
+from collections import namedtuple
+from datetime import timedelta
+
+import numpy as np
+
+from geodesy import offset_to_geodetic
+from instrumentation import FORMAT_TIMES, stage
+
+# Constants
+GRAVITY_CONSTANT = 9.80  # Acceleration due to gravity (m/s^2)
+
+# Compact result consumed by the KML writers. Every field is a 1-D array of the same length.
+# - when: numpy datetime64[us] timestamps
+# - lon, lat: degrees
+# - h: height above ground in meters
+TrajectoryArrays = namedtuple("TrajectoryArrays", ["when", "lon", "lat", "h"])
+
+# Exact closed-form results of solve_projectile. Fields are arrays broadcast from the launch parameters.
+# - time_of_flight: time in seconds at which the height returns to zero
+# - apex_time: time in seconds of the maximum height
+# - apex: maximum height in meters
+# - range: horizontal distance from launch to impact in meters
+# - impact_lat, impact_lon: coordinates of the impact point
+ProjectileSolution = namedtuple("ProjectileSolution", ["time_of_flight", "apex_time", "apex", "range", "impact_lat", "impact_lon"])
+
+# Per-launch results of simulate_projectile_batch. Every field is a 1-D array with one entry per launch.
+# - range, apex, time_of_flight, impact_lat, impact_lon: as in ProjectileSolution
+# - tracks: BatchTracks, or None if tracks were not requested
+BatchSummary = namedtuple("BatchSummary", ["range", "apex", "time_of_flight", "impact_lat", "impact_lon", "tracks"])
+
+# Full (launch x time) arrays. Samples after a launch has hit the ground are NaN.
+BatchTracks = namedtuple("BatchTracks", ["elapsed", "lon", "lat", "h"])
+
+
+def time_grid(duration, intervals):
+    """Returns the elapsed time in seconds of each of the intervals + 1 samples."""
+    return np.arange(intervals + 1) * duration / intervals
+
+
+def ground_cutoff(h):
+    """Returns the number of leading samples before the height first drops below zero."""
+    below = np.flatnonzero(h < 0)
+    return int(below[0]) if below.size else h.size
+
+
+def elapsed_to_datetime64(start_time, elapsed):
+    """Converts elapsed seconds after start_time into datetime64[us] timestamps."""
+    offsets = np.round(np.asarray(elapsed) * 1e6).astype("timedelta64[us]")
+    return np.datetime64(start_time, "us") + offsets
+
+
+def format_kml_times(when):
+    """Formats datetime64 timestamps the same way as strftime('%Y-%m-%dT%H:%M:%S.%fZ')."""
+    with stage(FORMAT_TIMES):
+        return [s + "Z" for s in np.datetime_as_string(when, unit="us").tolist()]
+
+
+def sample_blocks(intervals, chunk_size=None, last=None):
+    """Yields the sample indices 0..last (intervals by default) as consecutive arrays of at most chunk_size entries."""
+    count = (intervals if last is None else last) + 1
+    if count <= 0:
+        return
+    chunk_size = chunk_size or count
+    for start in range(0, count, chunk_size):
+        yield np.arange(start, min(start + chunk_size, count))
+
+
+def solve_projectile(lat, lon, h0, v0, elevation_angle_deg, azimuth_angle_deg, g=GRAVITY_CONSTANT):
+    """
+    Solves the vacuum trajectory in closed form, without sampling it.
+
+    Every parameter may be a scalar or an array, they are broadcast together so millions of
+    launches can be solved at once. A free fall is a launch with v0 = 0.
+
+    Parameters:
+    - lat, lon: Launch latitudes and longitudes.
+    - h0: Initial heights in meters.
+    - v0: Initial velocities in meters per second.
+    - elevation_angle_deg: Launch elevation angles in degrees.
+    - azimuth_angle_deg: Launch azimuth angles in degrees from north.
+    - g: Gravitational acceleration in m/s^2.
+
+    Returns:
+    - ProjectileSolution. Launches that start below ground have NaN results.
+    """
+    lat, lon, h0, v0, elevation, azimuth = (
+        np.asarray(a, dtype=float) for a in np.broadcast_arrays(lat, lon, h0, v0, elevation_angle_deg, azimuth_angle_deg)
+    )
+    elevation_rad = np.radians(elevation)
+    azimuth_rad = np.radians(azimuth)
+    v0h = v0 * np.cos(elevation_rad)  # Horizontal component
+    v0v = v0 * np.sin(elevation_rad)  # Vertical component
+
+    # Positive root of h0 + v0v * t - g * t^2 / 2 = 0
+    time_of_flight = np.where(h0 >= 0, (v0v + np.sqrt(np.maximum(v0v**2 + 2 * g * h0, 0))) / g, np.nan)
+    apex_time = np.clip(v0v / g, 0, time_of_flight)
+    apex = h0 + v0v * apex_time - 0.5 * g * apex_time**2
+    distance = v0h * time_of_flight
+
+    impact_lat, impact_lon = offset_to_geodetic(lat, lon, distance * np.sin(azimuth_rad), distance * np.cos(azimuth_rad))
+    return ProjectileSolution(
+        time_of_flight=time_of_flight,
+        apex_time=apex_time,
+        apex=apex,
+        range=distance,
+        impact_lat=impact_lat,
+        impact_lon=impact_lon,
+    )
+
+
+def last_sample_in_flight(time_of_flight, duration, intervals):
+    """Returns the index of the last grid sample at or before the time of flight, -1 if there is none."""
+    if math.isnan(time_of_flight):
+        return -1
+    if time_of_flight >= duration:
+        return intervals
+    return min(intervals, int(time_of_flight * intervals / duration))
+
+
+def flight_chunks(block, intervals, duration, time_of_flight, chunk_size, impact=None):
+    """
+    Yields the blocks of the time grid clipped to the flight window up front, followed by the
+    exact impact sample when the ground is hit between two grid samples.
+
+    Parameters:
+    - block: Function computing TrajectoryArrays for an array of sample indices.
+    - intervals, duration: The time grid.
+    - time_of_flight: Exact time of impact in seconds, NaN if the launch starts below ground.
+    - chunk_size: Maximum number of samples per block.
+    - impact: Optional single-sample TrajectoryArrays at the impact point.
+    """
+    last = last_sample_in_flight(time_of_flight, duration, intervals)
+    last_when = None
+    for chunk in clip_to_ground(block(index) for index in sample_blocks(intervals, chunk_size, last)):
+        last_when = chunk.when[-1]
+        yield chunk
+    if impact is not None and time_of_flight < duration and (last_when is None or last_when < impact.when[0]):
+        yield impact
+
+
+def clip_to_ground(blocks):
+    """Yields the TrajectoryArrays blocks up to, but not including, the first sample below ground."""
+    for block in blocks:
+        n = ground_cutoff(block.h)
+        if n < block.h.size:
+            if n:
+                yield TrajectoryArrays(*(field[:n] for field in block))
+            return
+        yield block
+
+
+def freefall_block(lat, lon, height, duration, intervals, start_time, g, index):
+    """Computes the free fall samples with the given sample indices."""
+    elapsed = index * duration / intervals
+    h = height - 0.5 * g * elapsed**2
+    return TrajectoryArrays(
+        when=elapsed_to_datetime64(start_time, elapsed),
+        lon=np.full(index.size, float(lon)),
+        lat=np.full(index.size, float(lat)),
+        h=h,
+    )
+
+
+def iter_freefall_chunks(lat, lon, height, duration, intervals, start_time, g=GRAVITY_CONSTANT, chunk_size=65536,
+                         include_impact=True):
+    """
+    Yields the free fall of freefall_trajectory as TrajectoryArrays chunks of at most chunk_size samples,
+    so arbitrarily long runs can be written with bounded memory.
+    """
+    time_of_flight = float(solve_projectile(lat, lon, height, 0.0, 0.0, 0.0, g).time_of_flight)
+    impact = None
+    if include_impact and not math.isnan(time_of_flight):
+        impact = TrajectoryArrays(
+            when=elapsed_to_datetime64(start_time, [time_of_flight]),
+            lon=np.array([float(lon)]),
+            lat=np.array([float(lat)]),
+            h=np.array([0.0]),
+        )
+    return flight_chunks(
+        lambda index: freefall_block(lat, lon, height, duration, intervals, start_time, g, index),
+        intervals, duration, time_of_flight, chunk_size, impact
+    )
+
+
+def freefall_trajectory(lat, lon, height, duration, intervals, start_time, g=GRAVITY_CONSTANT, include_impact=True):
+    """
+    Computes a free fall from rest. The time grid is clipped to the flight window up front and,
+    with include_impact, ends with the exact impact sample.
+
+    Parameters:
+    - lat, lon: Drop latitude and longitude.
+    - height: Initial height in meters.
+    - duration: Total simulation duration in seconds.
+    - intervals: Number of intervals to divide the simulation time.
+    - start_time: Datetime of the first sample.
+    - g: Gravitational acceleration in m/s^2.
+    - include_impact: Add the exact impact sample when the ground is hit between two grid samples.
+
+    Returns:
+    - TrajectoryArrays of the samples above ground.
+    """
+    return concatenate_chunks(iter_freefall_chunks(
+        lat, lon, height, duration, intervals, start_time, g, chunk_size=None, include_impact=include_impact
+    ))
+
+
+def launch_velocity(v0, elevation_angle_deg, azimuth_angle_deg):
+    """Splits the launch speed into (east, north, up) components in m/s."""
+    elevation_angle_rad = math.radians(elevation_angle_deg)
+    azimuth_angle_rad = math.radians(azimuth_angle_deg)
+    v0h = v0 * math.cos(elevation_angle_rad)  # Horizontal component
+    v0v = v0 * math.sin(elevation_angle_rad)  # Vertical component
+    v0x = v0h * math.sin(azimuth_angle_rad)  # East-West component (x)
+    v0y = v0h * math.cos(azimuth_angle_rad)  # North-South component (y)
+    return v0x, v0y, v0v
+
+
+def projectile_block(lat, lon, h0, v0, elevation_angle_deg, azimuth_angle_deg, duration, intervals,
+                     start_time, end_time, g, index):
+    """Computes the projectile samples with the given sample indices."""
+    v0x, v0y, v0v = launch_velocity(v0, elevation_angle_deg, azimuth_angle_deg)
+
+    elapsed = index * duration / intervals
+    h = h0 + (v0v * elapsed - 0.5 * g * elapsed**2)
+    current_lat, current_lon = offset_to_geodetic(lat, lon, v0x * elapsed, v0y * elapsed)
+
+    # Timestamps are interpolated between start_time and end_time, like projectileMotion.interpolate_times
+    delta = np.timedelta64((end_time - start_time) / intervals, "us")
+    return TrajectoryArrays(
+        when=np.datetime64(start_time, "us") + index * delta,
+        lon=current_lon,
+        lat=current_lat,
+        h=h,
+    )
+
+
+def iter_projectile_chunks(lat, lon, h0, v0, elevation_angle_deg, azimuth_angle_deg, duration, intervals,
+                           start_time, end_time=None, g=GRAVITY_CONSTANT, chunk_size=65536, include_impact=True):
+    """
+    Yields the trajectory of projectile_trajectory as TrajectoryArrays chunks of at most chunk_size samples,
+    so arbitrarily long runs can be written with bounded memory.
+    """
+    if end_time is None:
+        end_time = start_time + timedelta(seconds=duration)
+    solution = solve_projectile(lat, lon, h0, v0, elevation_angle_deg, azimuth_angle_deg, g)
+    time_of_flight = float(solution.time_of_flight)
+    impact = None
+    if include_impact and not math.isnan(time_of_flight):
+        timeline_scale = (end_time - start_time).total_seconds() / duration
+        impact = TrajectoryArrays(
+            when=elapsed_to_datetime64(start_time, [time_of_flight * timeline_scale]),
+            lon=np.array([float(solution.impact_lon)]),
+            lat=np.array([float(solution.impact_lat)]),
+            h=np.array([0.0]),
+        )
+    return flight_chunks(
+        lambda index: projectile_block(lat, lon, h0, v0, elevation_angle_deg, azimuth_angle_deg, duration, intervals,
+                                       start_time, end_time, g, index),
+        intervals, duration, time_of_flight, chunk_size, impact
+    )
+
+
+def projectile_trajectory(lat, lon, h0, v0, elevation_angle_deg, azimuth_angle_deg, duration, intervals,
+                          start_time, end_time=None, g=GRAVITY_CONSTANT, include_impact=True):
+    """
+    Computes a vacuum projectile trajectory. The time grid is clipped to the flight window up front
+    and, with include_impact, ends with the exact impact sample.
+
+    Parameters:
+    - lat, lon: Initial latitude and longitude.
+    - h0: Initial height in meters.
+    - v0: Initial velocity in meters per second.
+    - elevation_angle_deg: Launch elevation angle in degrees (0 = horizontal, 90 = vertical).
+    - azimuth_angle_deg: Launch azimuth angle in degrees from north (0 = north, 90 = east).
+    - duration: Total simulation duration in seconds.
+    - intervals: Number of intervals to divide the simulation time.
+    - start_time: Datetime of the first sample.
+    - end_time: Optional datetime of the last sample, timestamps are interpolated between the two.
+    - g: Gravitational acceleration in m/s^2.
+    - include_impact: Add the exact impact sample when the ground is hit between two grid samples.
+
+    Returns:
+    - TrajectoryArrays of the samples above ground.
+    """
+    return concatenate_chunks(iter_projectile_chunks(
+        lat, lon, h0, v0, elevation_angle_deg, azimuth_angle_deg, duration, intervals,
+        start_time, end_time, g, chunk_size=None, include_impact=include_impact
+    ))
+
+
+def adaptive_times(position, t0, t1, tolerance, initial_intervals=8, max_depth=30, active=None):
+    """
+    Places samples by geometric error instead of at a fixed step.
+
+    Intervals are split in half until the midpoint of every interval lies within tolerance
+    of the straight chord between its ends, so straight parts get few samples and tight
+    curves get many.
+
+    Parameters:
+    - position: Function mapping an array of times to an (N, 3) array of positions in meters.
+    - t0, t1: Time range in seconds.
+    - tolerance: Maximum chord error in meters.
+    - initial_intervals: Number of uniform intervals to start from.
+    - max_depth: Maximum number of halvings of any interval.
+    - active: Optional function mapping interval start times to a boolean array, intervals
+      where it is False are never refined.
+
+    Returns:
+    - Sorted array of sample times.
+    """
+    times = np.linspace(t0, t1, initial_intervals + 1)
+    for _ in range(max_depth):
+        start, end = times[:-1], times[1:]
+        middle = (start + end) / 2
+        a, b, m = position(start), position(end), position(middle)
+        chord = b - a
+        length = np.linalg.norm(chord, axis=1)
+        offset = m - a
+        error = np.where(
+            length > 0,
+            np.linalg.norm(np.cross(offset, chord), axis=1) / np.where(length > 0, length, 1),
+            np.linalg.norm(offset, axis=1),
+        )
+        refine = error > tolerance
+        if active is not None:
+            refine &= active(start)
+        if not refine.any():
+            break
+        times = np.sort(np.concatenate((times, middle[refine])))
+    return times
+
+
+def adaptive_projectile_trajectory(lat, lon, h0, v0, elevation_angle_deg, azimuth_angle_deg, duration, tolerance,
+                                   start_time, end_time=None, g=GRAVITY_CONSTANT):
+    """
+    Computes a vacuum projectile trajectory sampled by geometric error instead of a fixed interval count.
+
+    Parameters:
+    - lat, lon, h0, v0, elevation_angle_deg, azimuth_angle_deg, duration, start_time, end_time, g:
+      Same as projectile_trajectory.
+    - tolerance: Maximum distance in meters between the emitted polyline and the true path.
+
+    Returns:
+    - TrajectoryArrays of the samples above ground.
+    """
+    if end_time is None:
+        end_time = start_time + timedelta(seconds=duration)
+    v0x, v0y, v0v = launch_velocity(v0, elevation_angle_deg, azimuth_angle_deg)
+
+    def height(t):
+        return h0 + (v0v * t - 0.5 * g * t**2)
+
+    def position(t):
+        return np.column_stack((v0x * t, v0y * t, height(t)))
+
+    # Only the flight window is refined, its last sample is the exact impact point
+    time_of_flight = float(solve_projectile(lat, lon, h0, v0, elevation_angle_deg, azimuth_angle_deg, g).time_of_flight)
+    if math.isnan(time_of_flight):
+        return concatenate_chunks([])
+    elapsed = adaptive_times(position, 0.0, min(duration, time_of_flight), tolerance)
+    h = np.maximum(height(elapsed), 0.0)
+
+    current_lat, current_lon = offset_to_geodetic(lat, lon, v0x * elapsed, v0y * elapsed)
+    # Timestamps are spread between start_time and end_time like the fixed-step version
+    timeline_scale = (end_time - start_time).total_seconds() / duration
+    return TrajectoryArrays(
+        when=elapsed_to_datetime64(start_time, elapsed * timeline_scale),
+        lon=current_lon,
+        lat=current_lat,
+        h=h,
+    )
+
+
+def concatenate_chunks(chunks):
+    """Joins TrajectoryArrays chunks into a single TrajectoryArrays."""
+    chunks = list(chunks)
+    if not chunks:
+        return TrajectoryArrays(np.array([], dtype="datetime64[us]"), np.array([]), np.array([]), np.array([]))
+    if len(chunks) == 1:
+        return chunks[0]
+    return TrajectoryArrays(*(np.concatenate(fields) for fields in zip(*chunks)))
+
+
+def iter_coords(trajectory):
+    """Yields (lon, lat, h) tuples of plain floats for the KML writers."""
+    return zip(trajectory.lon.tolist(), trajectory.lat.tolist(), trajectory.h.tolist())
+
+
+def simulate_projectile_batch(lat, lon, h0, v0, elevation_angle_deg, azimuth_angle_deg, duration, intervals,
+                              g=GRAVITY_CONSTANT, return_tracks=False, chunk_size=1024):
+    """
+    Simulates many vacuum projectile launches at once.
+
+    Every launch parameter may be a scalar or an array, they are broadcast together
+    into one flat list of launches. All launches share the same time grid.
+
+    Parameters:
+    - lat, lon: Launch latitudes and longitudes.
+    - h0: Initial heights in meters.
+    - v0: Initial velocities in meters per second.
+    - elevation_angle_deg: Launch elevation angles in degrees.
+    - azimuth_angle_deg: Launch azimuth angles in degrees from north.
+    - duration: Total simulation duration in seconds.
+    - intervals: Number of intervals to divide the simulation time.
+    - g: Gravitational acceleration in m/s^2, scalar or one value per launch (see gravity.GravityProvider).
+    - return_tracks: Also return the full (launch x time) tracks.
+    - chunk_size: Number of launches computed together, bounds the size of the temporary arrays.
+
+    Returns:
+    - BatchSummary with one entry per launch, with exact closed-form summaries that are not limited
+      to duration. Launches that start below ground have NaN summaries.
+    """
+    lat, lon, h0, v0, elevation, azimuth, g = (
+        np.ravel(a).astype(float) for a in np.broadcast_arrays(lat, lon, h0, v0, elevation_angle_deg, azimuth_angle_deg, g)
+    )
+    # Summaries come from the closed-form solution, tracks are only sampled when requested
+    solution = solve_projectile(lat, lon, h0, v0, elevation, azimuth, g)
+    summary = BatchSummary(
+        range=solution.range,
+        apex=solution.apex,
+        time_of_flight=solution.time_of_flight,
+        impact_lat=solution.impact_lat,
+        impact_lon=solution.impact_lon,
+        tracks=None,
+    )
+    if not return_tracks:
+        return summary
+
+    # The shared time grid stops at the last sample any launch is still in the air
+    longest_flight = np.nanmax(solution.time_of_flight, initial=-1.0)
+    last = last_sample_in_flight(longest_flight, duration, intervals) if longest_flight >= 0 else -1
+    elapsed = time_grid(duration, intervals)[:last + 1]
+
+    count = lat.size
+    elevation_rad = np.radians(elevation)
+    azimuth_rad = np.radians(azimuth)
+    v0h = v0 * np.cos(elevation_rad)  # Horizontal component
+    v0v = v0 * np.sin(elevation_rad)  # Vertical component
+    v0x = v0h * np.sin(azimuth_rad)  # East-West component (x)
+    v0y = v0h * np.cos(azimuth_rad)  # North-South component (y)
+
+    track_lon = np.full((count, elapsed.size), np.nan)
+    track_lat = np.full((count, elapsed.size), np.nan)
+    track_h = np.full((count, elapsed.size), np.nan)
+    for start in range(0, count, chunk_size):
+        block = slice(start, min(start + chunk_size, count))
+        h = h0[block, None] + (v0v[block, None] * elapsed - 0.5 * g[block, None] * elapsed**2)
+        below = h < 0
+        # Number of samples before the first one below ground, like ground_cutoff for each row
+        n = np.where(below.any(axis=1), below.argmax(axis=1), elapsed.size)
+        valid = np.arange(elapsed.size) < n[:, None]
+        track_h[block] = np.where(valid, h, np.nan)
+        block_lat, block_lon = offset_to_geodetic(lat[block, None], lon[block, None],
+                                                  v0x[block, None] * elapsed, v0y[block, None] * elapsed)
+        track_lat[block] = np.where(valid, block_lat, np.nan)
+        track_lon[block] = np.where(valid, block_lon, np.nan)
+
+    return summary._replace(tracks=BatchTracks(elapsed, track_lon, track_lat, track_h))